@@ -0,0 +1,86 @@
+"""
+Peer-operation throughput of each valDaemon WireGuard backend.
+
+Needs CAP_NET_ADMIN to create a scratch interface; run it from src/ inside a
+throwaway network namespace so nothing touches the host:
+
+    unshare -rn python -m benchmarks.backends --peers 2000
+    sudo ip netns exec valbench python -m benchmarks.backends
+
+Prints one JSON object per (backend, op) with ops/sec.
+"""
+import argparse
+import base64
+import ipaddress
+import json
+import os
+import sys
+import time
+
+from valDaemon.utils.wg_backends import BACKENDS
+
+
+def make_peers(n: int):
+    net = ipaddress.ip_network("10.64.0.0/10")
+    return [(base64.b64encode(os.urandom(32)).decode(), f"{net[i + 1]}/32") for i in range(n)]
+
+
+def timed(results, backend, op, count, fn):
+    start = time.perf_counter()
+    errors = fn()
+    elapsed = time.perf_counter() - start
+    results.append({
+        "backend": backend.name, "op": op, "count": count, "errors": errors,
+        "seconds": round(elapsed, 4), "ops_per_sec": round(count / elapsed, 1) if elapsed else None,
+    })
+
+
+def bench(backend, ifname: str, peers):
+    results = []
+    res = backend.create_interface(ifname)
+    if res.get("status") != "success":
+        raise SystemExit(f"[{backend.name}] cannot create {ifname}: {res.get('message')} {res.get('stderr', '')}")
+    try:
+        def add():
+            return sum(backend.add_peer(ifname, pk, ips).get("status") != "success" for pk, ips in peers)
+
+        def dump():
+            return int(backend.dump_peers(ifname).get("status") != "success")
+
+        def remove():
+            return sum(backend.remove_peer(ifname, pk).get("status") != "success" for pk, _ in peers)
+
+        timed(results, backend, "add_peer", len(peers), add)
+        timed(results, backend, "list_peers", 1, dump)
+        timed(results, backend, "remove_peer", len(peers), remove)
+    finally:
+        backend.delete_interface(ifname)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="benchmarks.backends")
+    parser.add_argument("--peers", type=int, default=1000)
+    parser.add_argument("--ifname", default="valbench0")
+    parser.add_argument("--backends", default="netlink,subprocess")
+    parser.add_argument("--output", default=None, help="also write results to this JSON file")
+    args = parser.parse_args(argv)
+
+    peers = make_peers(args.peers)
+    results = []
+    for name in args.backends.split(","):
+        try:
+            backend = BACKENDS[name]()
+        except Exception as e:
+            print(f"[{name}] unavailable: {e}", file=sys.stderr)
+            continue
+        results.extend(bench(backend, args.ifname, peers))
+    for row in results:
+        print(json.dumps(row))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
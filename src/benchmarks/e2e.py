@@ -0,0 +1,363 @@
+"""
+End-to-end load test: requests go through valAPI over HTTP, daemon_client's
+connection pool and a real valDaemon process, which by default runs the
+in-memory fake WireGuard backend so results are reproducible on any machine.
+For every interface size and client concurrency it measures add, remove,
+list, batch and keygen: ops/sec and p50/p90/p99 latency.
+
+Run from src/:
+
+    python -m benchmarks.e2e
+    python -m benchmarks.e2e --sizes 1000 --concurrency 1,16 --output run.json
+    python -m benchmarks.e2e --compare run.json      # exit 1 on regressions
+
+--via client drives daemon_client directly, skipping HTTP (and is what
+happens when uvicorn is not installed). With --backend netlink, subprocess
+or auto the daemon uses real WireGuard links; run it in a throwaway network
+namespace so nothing touches the host:
+
+    unshare -rn python -m benchmarks.e2e --backend auto --sizes 1000,10000
+
+Prints one JSON object per (size, op, concurrency) after a {"meta": ...}
+line; --output writes {"meta", "results"} for --compare to read.
+"""
+import argparse
+import http.client
+import itertools
+import json
+import os
+import platform
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+
+from benchmarks.backends import make_peers
+from valAPI.clients.daemon_client import DaemonPool
+
+SRC = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# valAPI route and method per daemon action
+ROUTES = {
+    "add_peer": ("POST", "/peers/add"),
+    "remove_peer": ("DELETE", "/peers/remove"),
+    "apply_peers": ("POST", "/peers/batch"),
+    "list_peers": ("GET", "/peers/"),
+    "generate_keypair": ("GET", "/peers/gen-keys"),
+    "create_interface": ("POST", "/interface/create"),
+    "delete_interface": ("DELETE", "/interface/delete"),
+}
+BATCH_OPS = 100
+PRELOAD_CHUNK = 2000
+# compare: ops/sec and p99 must stay within this fraction of the baseline
+TOLERANCE = 0.25
+
+
+class ClientTarget:
+    """Daemon requests straight through daemon_client's pool."""
+    via = "client"
+
+    def __init__(self, socket_path: str):
+        self.pool = DaemonPool(socket_path)
+
+    def session(self):
+        return self
+
+    def call(self, payload: dict, timeout: float = 120.0) -> bool:
+        return self.pool.call(payload, timeout).get("status") == "success"
+
+    def close(self):
+        self.pool.close()
+
+
+class HTTPTarget:
+    """The same requests as valAPI HTTP calls, one keep-alive connection per worker."""
+    via = "api"
+
+    def __init__(self, port: int):
+        self.port = port
+
+    def session(self):
+        return _HTTPSession(self.port)
+
+    def close(self):
+        pass
+
+
+class _HTTPSession:
+    def __init__(self, port: int):
+        self.conn = http.client.HTTPConnection("127.0.0.1", port, timeout=120)
+
+    def call(self, payload: dict, timeout: float = 120.0) -> bool:
+        args = dict(payload)
+        method, path = ROUTES[args.pop("action")]
+        if args.get("interface") and path.startswith("/interface/"):
+            args = {"name": args.pop("interface")}
+        body, headers = None, {}
+        if method == "GET":
+            query = {k: v for k, v in args.items() if v is not None}
+            path += "?" + urllib.parse.urlencode(query) if query else ""
+        else:
+            body, headers = json.dumps(args), {"Content-Type": "application/json"}
+        try:
+            self.conn.request(method, path, body, headers)
+            resp = self.conn.getresponse()
+            data = resp.read()
+        except (OSError, http.client.HTTPException):
+            self.conn.close()
+            return False
+        return resp.status == 200 and json.loads(data).get("status") == "success"
+
+
+def _percentile(sorted_values, q: float) -> float:
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+
+def run_load(target, payloads, concurrency: int) -> dict:
+    """Send `payloads` from `concurrency` workers as fast as they are answered."""
+    latencies, errors = [], [0]
+    it = iter(payloads)
+    lock = threading.Lock()
+
+    def worker():
+        session = target.session()
+        mine, failed = [], 0
+        while True:
+            with lock:
+                payload = next(it, None)
+            if payload is None:
+                break
+            start = time.perf_counter()
+            ok = session.call(payload)
+            mine.append(time.perf_counter() - start)
+            failed += not ok
+        with lock:
+            latencies.extend(mine)
+            errors[0] += failed
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    if not latencies:
+        return {"count": 0}
+    ms = lambda v: round(v * 1000, 3)
+    return {"count": len(latencies), "errors": errors[0], "seconds": round(elapsed, 4),
+            "ops_per_sec": round(len(latencies) / elapsed, 1),
+            "p50_ms": ms(_percentile(latencies, 0.50)), "p90_ms": ms(_percentile(latencies, 0.90)),
+            "p99_ms": ms(_percentile(latencies, 0.99)), "max_ms": ms(latencies[-1])}
+
+
+def bench_size(target, ifname: str, size: int, sweep, ops: int, results: list, meta: dict):
+    batches = max(10, ops // 20)
+    extra = make_peers(size + len(sweep) * (ops + batches * BATCH_OPS))
+    base, fresh = extra[:size], iter(extra[size:])
+    session = target.session()
+    session.call({"action": "delete_interface", "interface": ifname})
+    if not session.call({"action": "create_interface", "interface": ifname}):
+        raise SystemExit(f"cannot create {ifname}")
+
+    def row(op, concurrency, stats, **more):
+        out = dict(meta_key(meta), op=op, peers=size, concurrency=concurrency, **stats, **more)
+        results.append(out)
+        print(json.dumps(out), flush=True)
+
+    def batch(peers, op="add"):
+        return [{"op": op, "public_key": pk, **({"allowed_ips": ips} if op == "add" else {})} for pk, ips in peers]
+
+    try:
+        chunks = [base[i:i + PRELOAD_CHUNK] for i in range(0, size, PRELOAD_CHUNK)]
+        stats = run_load(target, [{"action": "apply_peers", "interface": ifname, "ops": batch(c)} for c in chunks], 4)
+        row("preload", 4, stats, peers_per_sec=round(size / stats["seconds"], 1) if stats.get("seconds") else None)
+        cursors = [pk for pk, _ in base[::max(1, size // 512)]]
+        for concurrency in sweep:
+            added = list(itertools.islice(fresh, ops))
+            row("add", concurrency, run_load(target, [
+                {"action": "add_peer", "interface": ifname, "public_key": pk, "allowed_ips": ips}
+                for pk, ips in added], concurrency))
+            row("list", concurrency, run_load(target, [
+                {"action": "list_peers", "interface": ifname, "limit": 100, "cursor": cursors[i % len(cursors)]}
+                for i in range(ops)], concurrency))
+            row("remove", concurrency, run_load(target, [
+                {"action": "remove_peer", "interface": ifname, "public_key": pk} for pk, _ in added], concurrency))
+            groups = [list(itertools.islice(fresh, BATCH_OPS)) for _ in range(batches)]
+            for op in ("add", "remove"):
+                stats = run_load(target, [{"action": "apply_peers", "interface": ifname, "ops": batch(g, op)}
+                                          for g in groups], concurrency)
+                row(f"batch_{op}", concurrency, stats, ops_per_request=BATCH_OPS,
+                    peers_per_sec=round(stats["ops_per_sec"] * BATCH_OPS, 1) if stats.get("count") else None)
+            row("keygen", concurrency, run_load(target, [{"action": "generate_keypair"}] * ops, concurrency))
+    finally:
+        session.call({"action": "delete_interface", "interface": ifname})
+
+
+def meta_key(meta: dict) -> dict:
+    return {"via": meta["via"], "backend": meta["backend"]}
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _wait(check, what: str, proc: subprocess.Popen, timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise SystemExit(f"{what} exited with status {proc.returncode}")
+        try:
+            if check():
+                return
+        except OSError:
+            pass
+        time.sleep(0.1)
+    raise SystemExit(f"{what} did not come up within {timeout:g}s")
+
+
+def start_daemon(workdir: str, backend: str, engine: str) -> subprocess.Popen:
+    sock = os.path.join(workdir, "valdaemon.sock")
+    env = dict(os.environ, VALDAEMON_STATE_DIR=workdir, VALDAEMON_STATS_INTERVAL="0", PYTHONPATH=SRC)
+    cmd = [sys.executable, "-m", "valDaemon.main", "--socket", sock, "--backend", backend,
+           "--engine", engine, "--no-restore"]
+    log = os.path.join(workdir, "valdaemon.log")
+    with open(log, "w") as out:
+        proc = subprocess.Popen(cmd, cwd=SRC, env=env, stdout=out, stderr=subprocess.STDOUT)
+    pool = DaemonPool(sock, size=1)
+    try:
+        _wait(lambda: os.path.exists(sock) and pool.call({"action": "ping"}).get("status") == "success",
+              "valDaemon", proc)
+    except SystemExit:
+        with open(log) as f:
+            sys.stderr.write(f.read()[-4000:])
+        raise
+    finally:
+        pool.close()
+    proc.socket_path = sock
+    return proc
+
+
+def start_api(socket_path: str) -> subprocess.Popen:
+    port = _free_port()
+    # admission control would turn a load test into a 429 test
+    env = dict(os.environ, VALDAEMON_SOCKET=socket_path, VALAPI_MUTATE_RATE="0",
+               VALAPI_MUTATE_CONCURRENCY="100000", PYTHONPATH=SRC)
+    cmd = [sys.executable, "-m", "uvicorn", "valAPI.main:app", "--host", "127.0.0.1", "--port", str(port),
+           "--log-level", "warning"]
+    proc = subprocess.Popen(cmd, cwd=SRC, env=env)
+
+    def healthy():
+        conn = http.client.HTTPConnection("127.0.0.1", port, timeout=2)
+        try:
+            conn.request("GET", "/health")
+            return conn.getresponse().status == 200
+        finally:
+            conn.close()
+    _wait(healthy, "valAPI", proc)
+    proc.port = port
+    return proc
+
+
+def compare(results: list, baseline_path: str, tolerance: float) -> list:
+    """Rows that got slower than the baseline's by more than `tolerance`."""
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    ident = lambda r: (r.get("via"), r.get("backend"), r.get("op"), r.get("peers"), r.get("concurrency"))
+    before = {ident(r): r for r in baseline.get("results", [])}
+    regressions = []
+    for row in results:
+        old = before.get(ident(row))
+        if not old or not old.get("count") or not row.get("count"):
+            continue
+        why = []
+        if row["ops_per_sec"] < old["ops_per_sec"] * (1 - tolerance):
+            why.append(f"ops/sec {old['ops_per_sec']} -> {row['ops_per_sec']}")
+        if row["p99_ms"] > old["p99_ms"] * (1 + tolerance):
+            why.append(f"p99 {old['p99_ms']}ms -> {row['p99_ms']}ms")
+        if row.get("errors", 0) > old.get("errors", 0):
+            why.append(f"errors {old.get('errors', 0)} -> {row['errors']}")
+        if why:
+            regressions.append({"op": row["op"], "peers": row["peers"], "concurrency": row["concurrency"],
+                                "regression": why})
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="benchmarks.e2e")
+    parser.add_argument("--sizes", default="1000,10000,100000", help="peers on the interface, comma-separated")
+    parser.add_argument("--concurrency", default="1,8,32,128", help="client workers, comma-separated")
+    parser.add_argument("--ops", type=int, default=2000, help="requests per (op, concurrency)")
+    parser.add_argument("--via", choices=["api", "client"], default=None,
+                        help="through valAPI over HTTP (default when uvicorn is installed) or daemon_client only")
+    parser.add_argument("--backend", default="fake", help="fake (default), auto, netlink or subprocess")
+    parser.add_argument("--engine", default="asyncio", choices=["asyncio", "thread"])
+    parser.add_argument("--ifname", default="valbench0")
+    parser.add_argument("--output", default=None, help="write {meta, results} to this JSON file")
+    parser.add_argument("--compare", default=None, metavar="BASELINE", help="report rows slower than this run")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE)
+    args = parser.parse_args(argv)
+
+    sizes = [int(s) for s in args.sizes.split(",") if s]
+    sweep = [int(c) for c in args.concurrency.split(",") if c]
+    via = args.via
+    if via is None:
+        try:
+            import uvicorn  # noqa: F401
+            via = "api"
+        except ImportError:
+            print("uvicorn not installed: driving daemon_client directly (--via client)", file=sys.stderr)
+            via = "client"
+    meta = {"via": via, "backend": args.backend, "engine": args.engine, "ops": args.ops,
+            "python": platform.python_version(), "machine": platform.machine(), "cpus": os.cpu_count(),
+            "started": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())}
+    try:
+        meta["commit"] = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=SRC, capture_output=True,
+                                        text=True).stdout.strip() or None
+    except OSError:
+        meta["commit"] = None
+    print(json.dumps({"meta": meta}), flush=True)
+
+    workdir = tempfile.mkdtemp(prefix="valbench-e2e-")
+    procs, target, results = [], None, []
+    try:
+        daemon = start_daemon(workdir, args.backend, args.engine)
+        procs.append(daemon)
+        if via == "api":
+            api = start_api(daemon.socket_path)
+            procs.append(api)
+            target = HTTPTarget(api.port)
+        else:
+            target = ClientTarget(daemon.socket_path)
+        for size in sizes:
+            bench_size(target, args.ifname, size, sweep, args.ops, results, meta)
+    finally:
+        if target is not None:
+            target.close()
+        for proc in reversed(procs):
+            proc.terminate()
+            try:
+                proc.wait(10)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"meta": meta, "results": results}, f, indent=2)
+    if args.compare:
+        regressions = compare(results, args.compare, args.tolerance)
+        for r in regressions:
+            print(json.dumps(r))
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
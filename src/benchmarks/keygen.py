@@ -0,0 +1,66 @@
+"""
+Keypair generation: in-process X25519 vs. forking `wg genkey` + `wg pubkey`.
+
+    python -m benchmarks.keygen --count 2000
+
+The fork path is only measured when the `wg` binary is installed. Prints one
+JSON object per method with keys/sec and per-key latency.
+"""
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import time
+
+from valDaemon.utils import keys
+
+
+def fork_keypair():
+    """What generate_keypair used to do: two process spawns per pair."""
+    priv = subprocess.run(["wg", "genkey"], capture_output=True, text=True, timeout=3, check=True).stdout
+    pub = subprocess.run(["wg", "pubkey"], input=priv, capture_output=True, text=True, timeout=3, check=True).stdout
+    return priv.strip(), pub.strip()
+
+
+def pure_python_keypair():
+    private = keys._clamp(os.urandom(32))
+    return private, keys._public_key_py(private)
+
+
+def measure(name, fn, count):
+    start = time.perf_counter()
+    for _ in range(count):
+        fn()
+    elapsed = time.perf_counter() - start
+    return {"method": name, "count": count, "seconds": round(elapsed, 4),
+            "keys_per_sec": round(count / elapsed, 1), "us_per_key": round(elapsed / count * 1e6, 2)}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="benchmarks.keygen")
+    parser.add_argument("--count", type=int, default=1000)
+    parser.add_argument("--fork-count", type=int, default=200, help="pairs for the (slow) fork path")
+    parser.add_argument("--output", default=None, help="also write results to this JSON file")
+    args = parser.parse_args(argv)
+
+    results = []
+    if keys.X25519PrivateKey is not None:
+        results.append(measure("in-process (cryptography)", keys.new_keypair, args.count))
+    results.append(measure("in-process (pure python)", pure_python_keypair, args.count))
+
+    pool = keys.KeyPool(args.count)
+    pool._pairs.extend(keys.new_keypair() for _ in range(args.count))
+    results.append(measure("pool hit", pool.take, args.count))
+
+    if shutil.which("wg"):
+        results.append(measure("fork wg genkey|pubkey", fork_keypair, args.fork_count))
+    for row in results:
+        print(json.dumps(row))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""
+Warm-restart cost: writing the valDaemon state journal, loading it back,
+and restoring every peer into the kernel in bulk, against re-adding the same
+peers one add_peer call at a time (what reprovisioning through the REST API
+amounts to).
+
+The kernel part needs CAP_NET_ADMIN; run it from src/ inside a throwaway
+network namespace, or pass --no-kernel to time only the journal:
+
+    unshare -rn python -m benchmarks.restore --peers 50000
+    python -m benchmarks.restore --peers 50000 --no-kernel
+
+Prints one JSON object per step.
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+from benchmarks.backends import make_peers
+from valDaemon.utils import wg_service
+from valDaemon.utils.journal import StateJournal
+
+
+def timed(results, step, count, fn, **extra):
+    start = time.perf_counter()
+    out = fn()
+    elapsed = time.perf_counter() - start
+    row = {"step": step, "count": count, "seconds": round(elapsed, 4),
+           "per_sec": round(count / elapsed, 1) if elapsed else None}
+    row.update(extra)
+    results.append(row)
+    return out
+
+
+def bench_journal(results, ifname: str, peers, directory: str):
+    journal = StateJournal(directory)
+    journal.load()
+    specs = [{"public_key": pk, "allowed_ips": [ips]} for pk, ips in peers]
+
+    def record():
+        journal.interface(ifname)
+        for i in range(0, len(specs), 512):
+            journal.peers(ifname, specs[i:i + 512])
+        journal.flush()
+
+    timed(results, "journal_append", len(peers), record)
+    timed(results, "journal_compact", len(peers), journal.compact)
+    results[-1]["bytes"] = os.path.getsize(journal.snap_path)
+    journal.stop()
+    fresh = StateJournal(directory)
+    state = timed(results, "journal_load", len(peers), fresh.load)
+    return state
+
+
+def bench_kernel(results, backend: str, ifname: str, peers, state, baseline: int):
+    wg_service.init_backend(backend)
+    api = wg_service.get_backend()
+    api.delete_interface(ifname)
+    try:
+        res = timed(results, "restore_bulk", len(peers), lambda: wg_service.restore_state(state),
+                    backend=api.name)
+        results[-1]["failed"] = res["failed"]
+        res = timed(results, "restore_noop", len(peers), lambda: wg_service.restore_state(state),
+                    backend=api.name)
+        results[-1]["unchanged"] = res["unchanged"]
+
+        api.delete_interface(ifname)
+        api.create_interface(ifname)
+        sample = peers[:baseline]
+        errors = timed(results, "add_peer_each", len(sample),
+                       lambda: sum(api.add_peer(ifname, pk, ips).get("status") != "success" for pk, ips in sample),
+                       backend=api.name)
+        row = results[-1]
+        row["errors"] = errors
+        row["projected_seconds"] = round(row["seconds"] * len(peers) / max(len(sample), 1), 2)
+    finally:
+        api.delete_interface(ifname)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="benchmarks.restore")
+    parser.add_argument("--peers", type=int, default=50000)
+    parser.add_argument("--ifname", default="valbench0")
+    parser.add_argument("--backend", default="auto", help="auto, netlink or subprocess")
+    parser.add_argument("--baseline", type=int, default=2000,
+                        help="peers to add one call at a time; the full run is projected from these")
+    parser.add_argument("--no-kernel", action="store_true", help="time only the journal")
+    parser.add_argument("--output", default=None, help="also write results to this JSON file")
+    args = parser.parse_args(argv)
+
+    peers = make_peers(args.peers)
+    results = []
+    with tempfile.TemporaryDirectory(prefix="valbench-journal-") as directory:
+        state = bench_journal(results, args.ifname, peers, directory)
+    if not args.no_kernel:
+        try:
+            bench_kernel(results, args.backend, args.ifname, peers, state, args.baseline)
+        except Exception as e:
+            print(f"kernel restore unavailable: {e}", file=sys.stderr)
+    for row in results:
+        print(json.dumps(row))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
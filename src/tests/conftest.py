@@ -0,0 +1,46 @@
+import base64
+import os
+import sys
+
+import pytest
+
+# the packages live side by side in src/ and are run from there, not installed
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from valDaemon.utils import wg_service
+from valDaemon.utils.ipam import IPAM
+from valDaemon.utils.metrics import InstrumentedBackend
+from valDaemon.utils.peer_cache import PeerCache
+from valDaemon.utils.wg_backends import FakeBackend
+
+
+def make_key(n: int) -> str:
+    """A well-formed public key, distinct for each n < 256."""
+    return base64.b64encode(bytes([n]) * 32).decode()
+
+
+@pytest.fixture
+def key():
+    return make_key
+
+
+@pytest.fixture
+def fake():
+    backend = FakeBackend(latency=0)
+    backend.create_interface("wg0")
+    return backend
+
+
+@pytest.fixture
+def service(monkeypatch, tmp_path, fake):
+    """
+    valDaemon's wg_service on a FakeBackend with wg0 created, a fresh peer
+    cache and an IPAM persisted under tmp_path. The state journal stays
+    disabled, so nothing is written outside tmp_path.
+    """
+    monkeypatch.setattr(wg_service, "_backend", InstrumentedBackend(fake))
+    monkeypatch.setattr(wg_service, "cache", PeerCache(wg_service._load_peers,
+                                                       lambda: wg_service.get_backend().list_interfaces()))
+    monkeypatch.setattr(wg_service, "ipam", IPAM(str(tmp_path)))
+    assert not wg_service.journal.enabled
+    return wg_service
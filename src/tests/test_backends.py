@@ -0,0 +1,83 @@
+import base64
+import struct
+from socket import AF_INET, AF_INET6, inet_pton
+
+import pytest
+
+from valDaemon.utils.wg_backends import (WGPEER_F_REMOVE_ME, WGPEER_F_REPLACE_ALLOWEDIPS, SubprocessBackend,
+                                        _check_spec, _set_device_msg, _wg_peer)
+
+
+def _allowed(backend, ifname="wg0"):
+    return {row[0]: row[3] for row in backend.dump_peers(ifname)["rows"]}
+
+
+def test_fake_replaces_allowed_ips(fake, key):
+    fake.add_peer("wg0", key(1), "10.0.0.1/32,10.0.0.2/32")
+    fake.add_peer("wg0", key(1), "10.0.0.3/32")
+    assert _allowed(fake) == {key(1): "10.0.0.3/32"}
+
+
+def test_fake_moves_prefix_to_last_owner(fake, key):
+    fake.add_peer("wg0", key(1), "10.0.0.1/32,10.0.0.2/32")
+    fake.add_peer("wg0", key(2), "10.0.0.2/32")
+    assert _allowed(fake) == {key(1): "10.0.0.1/32", key(2): "10.0.0.2/32"}
+
+
+def test_fake_update_without_allowed_ips_keeps_them(fake, key):
+    fake.add_peer("wg0", key(1), "10.0.0.1/32")
+    assert fake.set_peers("wg0", [{"public_key": key(1), "persistent_keepalive": 25}])["status"] == "success"
+    assert _allowed(fake) == {key(1): "10.0.0.1/32"}
+
+
+def test_subprocess_sends_the_whole_list(monkeypatch, key):
+    backend = SubprocessBackend()
+    sent = []
+    monkeypatch.setattr(backend, "_run", lambda cmd: sent.append(cmd) or {"status": "success"})
+    backend.set_peers("wg0", [{"public_key": key(1), "allowed_ips": ["10.0.0.3/32", "fd00::3/128"]},
+                              {"public_key": key(2), "remove": True}])
+    assert sent[0][1:] == ["set", "wg0", "peer", key(1), "allowed-ips", "10.0.0.3/32,fd00::3/128",
+                           "peer", key(2), "remove"]
+
+
+def _attrs(peer):
+    return dict((name, value) for name, value in peer["attrs"])
+
+
+def test_netlink_peer_replaces_allowed_ips(key):
+    attrs = _attrs(_wg_peer({"public_key": key(1), "allowed_ips": ["10.0.0.3/32", "fd00::/64"]}))
+    assert attrs["WGPEER_A_FLAGS"] == WGPEER_F_REPLACE_ALLOWEDIPS
+    ips = [_attrs(ip) for ip in attrs["WGPEER_A_ALLOWEDIPS"]]
+    assert [(ip["WGALLOWEDIP_A_FAMILY"], ip["WGALLOWEDIP_A_IPADDR"], ip["WGALLOWEDIP_A_CIDR_MASK"])
+            for ip in ips] == [(AF_INET, inet_pton(AF_INET, "10.0.0.3"), 32),
+                               (AF_INET6, inet_pton(AF_INET6, "fd00::"), 64)]
+
+
+def _nla(kind: int, payload: bytes) -> bytes:
+    return struct.pack("HH", 4 + len(payload), kind) + payload
+
+
+def test_netlink_message_carries_binary_addresses(key):
+    pytest.importorskip("pyroute2.netlink.generic.wireguard")
+    msg = _set_device_msg("wg0", [{"public_key": key(1), "allowed_ips": ["10.0.0.2/32", "fd00::/64"],
+                                   "endpoint": ("192.0.2.1", 51820)}])
+    msg.encode()
+    data = bytes(msg.data)
+    # WGALLOWEDIP_A_IPADDR is attribute 2: 4 bytes for v4, 16 for v6, never the text form
+    assert _nla(2, inet_pton(AF_INET, "10.0.0.2")) in data
+    assert _nla(2, inet_pton(AF_INET6, "fd00::")) in data
+    assert b"10.0.0.2" not in data
+    assert base64.b64decode(key(1)) in data
+
+
+def test_netlink_peer_without_allowed_ips_leaves_them(key):
+    attrs = _attrs(_wg_peer({"public_key": key(1), "persistent_keepalive": 25}))
+    assert "WGPEER_A_FLAGS" not in attrs and "WGPEER_A_ALLOWEDIPS" not in attrs
+    assert _attrs(_wg_peer({"public_key": key(1), "remove": True}))["WGPEER_A_FLAGS"] == WGPEER_F_REMOVE_ME
+
+
+def test_check_spec(key):
+    assert _check_spec({"public_key": key(1), "allowed_ips": ["10.0.0.0/24", "fd00::1"]}) is None
+    assert "public key" in _check_spec({"public_key": "nope", "allowed_ips": []})
+    for bad in ("foo/24", "10.0.0.0/33", "/24"):
+        assert _check_spec({"public_key": key(1), "allowed_ips": [bad]}) == f"invalid allowed ip {bad!r}"
@@ -0,0 +1,126 @@
+import threading
+
+import pytest
+
+from valDaemon.dispatch import IFACE, MUTATE, Bool, Int, Invalid, Number, Registry, SerialQueues, Str, registry
+from valDaemon.utils.tracing import Trace, activate, current
+
+
+def test_serial_queue_runs_in_order_and_batches_backlog():
+    batches = []
+    queues = SerialQueues(lambda key, items: batches.append(list(items)) or [i * 10 for i in items])
+    spawned = []
+    futures = [queues.submit("wg0", i, spawned.append) for i in range(3)]
+    # only the submit that found the queue idle asks for a drain
+    assert spawned == ["wg0"]
+    queues.drain("wg0")
+    assert batches == [[0, 1, 2]]
+    assert [f.result() for f in futures] == [0, 10, 20]
+    assert queues.pending() == {}
+
+
+def test_serial_queues_are_per_key():
+    queues = SerialQueues(lambda key, items: [(key, i) for i in items])
+    a = queues.submit("wg0", 1, lambda k: None)
+    b = queues.submit("wg1", 2, queues.drain)
+    assert b.result(timeout=1) == ("wg1", 2)
+    assert not a.done() and queues.pending() == {"wg0": 1}
+    queues.drain("wg0")
+    assert a.result() == ("wg0", 1)
+
+
+def test_serial_queue_fails_the_batch_on_error():
+    def boom(key, items):
+        raise RuntimeError("boom")
+    queues = SerialQueues(boom)
+    fut = queues.submit("wg0", 1, queues.drain)
+    assert isinstance(fut.exception(timeout=1), RuntimeError)
+
+
+def _registry(seen, combined=None):
+    registry = Registry()
+    combined = [] if combined is None else combined
+
+    @registry.action("touch", MUTATE, coalesce="touches", interface=IFACE, label=Str())
+    def touch(iface, label):
+        seen.append((label, current()))
+        return {"status": "success", "label": label}
+
+    @registry.combiner("touches")
+    def combine(iface, calls):
+        combined.append(len(calls))
+        out = []
+        for entry, args, trace in calls:
+            with activate(trace):
+                out.append(entry.handler(*args))
+        return out
+    return registry
+
+
+def test_queued_item_runs_under_its_own_trace():
+    seen = []
+    registry = _registry(seen)
+    entry, args = registry.resolve({"action": "touch", "interface": "wg0", "label": "a"})
+    trace = Trace()
+
+    def drain_elsewhere(key):
+        threading.Thread(target=registry.serial.drain, args=(key,)).start()
+    fut = registry.serial.submit("wg0", (entry, args, trace), drain_elsewhere)
+    assert fut.result(timeout=1) == {"status": "success", "label": "a"}
+    assert seen == [("a", trace)]
+
+
+def test_call_carries_the_callers_trace():
+    seen = []
+    registry = _registry(seen)
+    entry, args = registry.resolve({"action": "touch", "interface": "wg0", "label": "a"})
+    trace = Trace()
+    with activate(trace):
+        registry.call(entry, args)
+    registry.call(entry, args)
+    assert seen == [("a", trace), ("a", None)]
+
+
+def test_neighbours_of_a_group_go_to_the_combiner():
+    seen, combined = [], []
+    registry = _registry(seen, combined)
+    items = []
+    traces = [Trace(), None, Trace()]
+    for name, trace in zip("abc", traces):
+        entry, args = registry.resolve({"action": "touch", "interface": "wg0", "label": name})
+        items.append((entry, args, trace))
+    assert [r["label"] for r in registry.run_serial("wg0", items)] == ["a", "b", "c"]
+    assert combined == [3]
+    assert seen == list(zip("abc", traces))
+
+
+def test_bool_takes_only_json_booleans():
+    assert Bool().check("force", False) is False
+    for bad in ("false", "0", 0, 1):
+        with pytest.raises(Invalid, match="force must be a boolean"):
+            Bool().check("force", bad)
+
+
+def test_numbers_are_typed_and_bounded():
+    limit = Int(ge=1, le=10)
+    assert limit.check("limit", 10) == 10 and limit.check("limit", 3.0) == 3
+    for bad, message in (("5", "an integer"), (2.5, "an integer"), (True, "an integer"),
+                         (0, "at least 1"), (11, "at most 10")):
+        with pytest.raises(Invalid, match=message):
+            limit.check("limit", bad)
+    window = Number(gt=0)
+    assert window.check("window", 0.5) == 0.5
+    with pytest.raises(Invalid, match="greater than 0"):
+        window.check("window", 0)
+    with pytest.raises(Invalid, match="a number"):
+        window.check("window", "60")
+
+
+def test_handlers_reject_what_the_api_models_would():
+    import valDaemon.handlers.peer_handler  # noqa: F401
+    request = {"action": "list_peers", "interface": "wg0"}
+    for bad, message in (({"limit": "10"}, "limit must be an integer"), ({"limit": 0}, "limit must be at least 1"),
+                         ({"compact": "false"}, "compact must be a boolean")):
+        assert registry.resolve(dict(request, **bad)) == (None, {"status": "error", "message": message})
+    entry, args = registry.resolve(dict(request, limit=10))
+    assert entry.name == "list_peers" and 10 in args
@@ -0,0 +1,35 @@
+from valDaemon.utils.events import ChangeFeed
+
+
+def test_read_reports_lost_events():
+    feed = ChangeFeed(size=2)
+    for name in ("wg0", "wg1", "wg2"):
+        feed.interface(name)
+    seq, events, lost = feed.read(0)
+    assert (seq, lost) == (3, True)
+    assert [e["interface"] for e in events] == ["wg1", "wg2"]
+    assert feed.read(3) == (3, [], False)
+
+
+def test_watchers_are_capped():
+    feed = ChangeFeed(max_watchers=1)
+    first = feed.watch(heartbeat=0.01)
+    assert next(first)["status"] == "success"
+    assert feed.watchers == 1
+    refused = list(feed.watch(heartbeat=0.01))
+    assert len(refused) == 1 and refused[0]["status"] == "error"
+    first.close()
+    assert feed.watchers == 0
+    again = feed.watch(heartbeat=0.01)
+    assert next(again)["status"] == "success"
+    again.close()
+
+
+def test_watch_delivers_new_events():
+    feed = ChangeFeed()
+    feed.interface("old")
+    stream = feed.watch(heartbeat=0.01)
+    assert next(stream)["events"] == []
+    feed.peers("wg0", [{"public_key": "k1", "allowed_ips": ["10.0.0.1/32"]}], {"k1": False})
+    assert [e["type"] for e in next(stream)["events"]] == ["peer_added"]
+    stream.close()
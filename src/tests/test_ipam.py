@@ -0,0 +1,64 @@
+import pytest
+
+from valDaemon.utils.ipam import IPAM, AddressPool
+
+
+def test_pool_skips_reserved_addresses():
+    pool = AddressPool("10.8.0.0/29")
+    assert [pool.allocate() for _ in range(6)] == [f"10.8.0.{n}/32" for n in range(2, 7)] + [None]
+    assert pool.free == 0
+
+
+def test_pool_reuses_released_addresses_first():
+    pool = AddressPool("10.8.0.0/24")
+    addrs = [pool.allocate() for _ in range(3)]
+    assert pool.release(addrs[1])
+    assert not pool.release(addrs[1])
+    assert pool.allocate() == addrs[1]
+    assert pool.allocate() == "10.8.0.5/32"
+
+
+def test_pool_claim_and_offsets():
+    pool = AddressPool("fd00::/120", reserve_first=False)
+    assert pool.claim("fd00::1/128")
+    assert not pool.claim("fd00::1/64")
+    assert not pool.claim("10.0.0.1/32")
+    assert pool.allocate() == "fd00::2/128"
+
+
+def test_pool_size_is_capped():
+    with pytest.raises(ValueError):
+        AddressPool("10.0.0.0/7")
+
+
+def test_dual_stack_allocation_is_all_or_nothing(tmp_path):
+    ipam = IPAM(str(tmp_path))
+    ipam.create_pool("wg0", "10.8.0.0/29")
+    ipam.create_pool("wg0", "fd00::/125")
+    assert ipam.create_pool("wg0", "10.9.0.0/24")["status"] == "error"
+    assert ipam.allocate("wg0") == ["10.8.0.2/32,fd00::2/128"]
+    # v6 has no broadcast, so v4 runs out first and nothing is taken from v6
+    ipam.allocate("wg0", 4)
+    with pytest.raises(ValueError):
+        ipam.allocate("wg0")
+    assert [p["used"] for p in ipam.status("wg0")["pools"]] == [8, 7]
+
+
+def test_state_survives_a_reload(tmp_path):
+    ipam = IPAM(str(tmp_path))
+    ipam.create_pool("wg0", "10.8.0.0/24")
+    ipam.allocate("wg0", 3)
+    ipam.release("wg0", ["10.8.0.3/32"])
+    ipam.save()
+    reloaded = IPAM(str(tmp_path))
+    reloaded.load()
+    assert reloaded.status()["pools"] == ipam.status()["pools"]
+    assert reloaded.allocate("wg0") == ["10.8.0.3/32"]
+
+
+def test_reset_frees_everything_but_keeps_the_cidr(tmp_path):
+    ipam = IPAM(str(tmp_path))
+    ipam.create_pool("wg0", "10.8.0.0/29", in_use=["10.8.0.5/32"])
+    ipam.allocate("wg0", 2)
+    ipam.reset("wg0")
+    assert ipam.status("wg0")["pools"][0]["used"] == 3
@@ -0,0 +1,83 @@
+from valDaemon.utils.journal import StateJournal
+
+
+def _journal(tmp_path):
+    journal = StateJournal(str(tmp_path))
+    assert journal.load() is None
+    return journal
+
+
+def _add(key, ips, endpoint=None, keepalive=None):
+    spec = {"public_key": key, "allowed_ips": ips}
+    if endpoint:
+        spec["endpoint"] = endpoint
+    if keepalive is not None:
+        spec["persistent_keepalive"] = keepalive
+    return spec
+
+
+def test_replay_after_flush(tmp_path):
+    journal = _journal(tmp_path)
+    journal.interface("wg0")
+    journal.peers("wg0", [_add("k1", ["10.0.0.1/32"], ("192.0.2.1", 51820), 25), _add("k2", ["10.0.0.2/32"])])
+    journal.peers("wg0", [{"public_key": "k2", "remove": True},
+                          {"public_key": "k1", "persistent_keepalive": 0}])
+    journal.flush()
+    state = StateJournal(str(tmp_path)).load()
+    assert state == {"wg0": {"k1": ["10.0.0.1/32", "192.0.2.1:51820", "0"]}}
+
+
+def test_prefix_moves_to_last_owner(tmp_path):
+    journal = _journal(tmp_path)
+    journal.peers("wg0", [_add("k1", ["10.0.0.1/32", "10.0.0.2/32"]), _add("k2", ["10.0.0.2/32"])])
+    journal.flush()
+    assert StateJournal(str(tmp_path)).load() == {"wg0": {"k1": ["10.0.0.1/32", "", ""],
+                                                          "k2": ["10.0.0.2/32", "", ""]}}
+
+
+def test_deleted_interface_drops_its_peers(tmp_path):
+    journal = _journal(tmp_path)
+    journal.interface("wg0")
+    journal.peers("wg0", [_add("k1", ["10.0.0.1/32"])])
+    journal.interface("wg0", exists=False)
+    journal.flush()
+    assert StateJournal(str(tmp_path)).load() == {}
+
+
+def test_compaction_keeps_state_and_drops_the_old_log(tmp_path):
+    journal = _journal(tmp_path)
+    journal.interface("wg0")
+    for n in range(5):
+        journal.peers("wg0", [_add("k1", [f"10.0.0.{n}/32"])])
+    journal.flush()
+    journal.compact()
+    assert len((tmp_path / "state.log").read_text().splitlines()) == 1
+    journal.peers("wg0", [_add("k2", ["10.0.1.1/32"])])
+    journal.flush()
+    assert StateJournal(str(tmp_path)).load() == {"wg0": {"k1": ["10.0.0.4/32", "", ""],
+                                                          "k2": ["10.0.1.1/32", "", ""]}}
+
+
+def test_log_from_another_generation_is_ignored(tmp_path):
+    journal = _journal(tmp_path)
+    journal.peers("wg0", [_add("k1", ["10.0.0.1/32"])])
+    journal.compact()
+    stale = (tmp_path / "state.log")
+    header = stale.read_text().splitlines()[0].rsplit(" ", 1)[0]
+    stale.write_text(f"{header} 999\nP\twg0\tk9\t10.0.0.9/32\t-\t-\n")
+    assert StateJournal(str(tmp_path)).load() == {"wg0": {"k1": ["10.0.0.1/32", "", ""]}}
+
+
+def test_torn_last_line_is_ignored(tmp_path):
+    journal = _journal(tmp_path)
+    journal.peers("wg0", [_add("k1", ["10.0.0.1/32"])])
+    journal.flush()
+    with open(tmp_path / "state.log", "a") as f:
+        f.write("P\twg0\tk2\t10.0")
+    assert StateJournal(str(tmp_path)).load() == {"wg0": {"k1": ["10.0.0.1/32", "", ""]}}
+
+
+def test_adopt_snapshots_right_away(tmp_path):
+    journal = StateJournal(str(tmp_path))
+    journal.adopt({"wg0": {"k1": ["10.0.0.1/32", "", "25"]}})
+    assert StateJournal(str(tmp_path)).load() == {"wg0": {"k1": ["10.0.0.1/32", "", "25"]}}
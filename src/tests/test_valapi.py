@@ -0,0 +1,136 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from valAPI.clients import daemon_client
+from valAPI.clients.hashring import HashRing
+
+KEYS = [f"wg{i}" for i in range(5000)]
+
+
+def _placement(ring):
+    return {key: ring.node(key) for key in KEYS}
+
+
+def test_ring_is_stable_and_even():
+    before = _placement(HashRing(["gw1", "gw2", "gw3"]))
+    assert before == _placement(HashRing(["gw3", "gw1", "gw2"]))
+    shares = [list(before.values()).count(node) for node in ("gw1", "gw2", "gw3")]
+    assert min(shares) > len(KEYS) / 3 * 0.8
+
+
+def test_adding_a_node_only_moves_keys_to_it():
+    before = _placement(HashRing(["gw1", "gw2", "gw3"]))
+    after = _placement(HashRing(["gw1", "gw2", "gw3", "gw4"]))
+    moved = [key for key in KEYS if before[key] != after[key]]
+    assert all(after[key] == "gw4" for key in moved)
+    assert len(moved) < len(KEYS) / 4 * 1.25
+
+
+def test_removing_a_node_only_moves_its_keys():
+    before = _placement(HashRing(["gw1", "gw2", "gw3"]))
+    after = _placement(HashRing(["gw1", "gw3"]))
+    assert all(before[key] == "gw2" for key in KEYS if before[key] != after[key])
+
+
+def test_ring_needs_a_node():
+    with pytest.raises(ValueError):
+        HashRing([])
+
+
+class _Pool:
+    def __init__(self):
+        self.calls = []
+        self.release = None
+
+    async def acall(self, payload, timeout):
+        self.calls.append(payload)
+        await self.release.wait()
+        return {"status": "success", "n": len(self.calls)}
+
+
+def test_single_flight_shares_one_round_trip(monkeypatch):
+    pool = _Pool()
+    monkeypatch.setattr(daemon_client, "get_pool", lambda interface=None: pool)
+
+    async def run():
+        pool.release = asyncio.Event()
+        flights = daemon_client.SingleFlight()
+        read = {"action": "list_peers", "interface": "wg0"}
+        same = [asyncio.ensure_future(flights.do(dict(read))) for _ in range(5)]
+        other = asyncio.ensure_future(flights.do(dict(read, interface="wg1")))
+        await asyncio.sleep(0)
+        # a caller giving up does not cancel the request for the rest
+        same[0].cancel()
+        pool.release.set()
+        results = await asyncio.gather(*same[1:], other)
+        return flights, results
+
+    flights, results = asyncio.run(run())
+    assert len(pool.calls) == 2
+    assert all(r is results[0] for r in results[:4])
+    assert results[4] is not results[0]
+    assert len(flights) == 0
+
+
+def test_single_flight_sends_again_once_done(monkeypatch):
+    pool = _Pool()
+    monkeypatch.setattr(daemon_client, "get_pool", lambda interface=None: pool)
+
+    async def run():
+        pool.release = asyncio.Event()
+        pool.release.set()
+        flights = daemon_client.SingleFlight()
+        first = await flights.do({"action": "list_interfaces"})
+        second = await flights.do({"action": "list_interfaces"})
+        return first, second
+
+    first, second = asyncio.run(run())
+    assert (first["n"], second["n"]) == (1, 2)
+
+
+def test_token_bucket_limits_each_client():
+    admission = pytest.importorskip("valAPI.admission", exc_type=ImportError)
+    bucket = admission.TokenBucket(rate=1, burst=2)
+    assert [bucket.take("a", now=0) for _ in range(2)] == [0, 0]
+    assert bucket.take("a", now=0) == pytest.approx(1.0)
+    assert bucket.take("b", now=0) == 0
+    assert bucket.take("a", now=1.5) == 0
+
+
+def test_token_bucket_forgets_idle_clients():
+    admission = pytest.importorskip("valAPI.admission", exc_type=ImportError)
+    bucket = admission.TokenBucket(rate=1, burst=1, max_clients=2)
+    bucket.take("a", now=0)
+    bucket.take("b", now=0)
+    bucket.take("c", now=10)
+    assert len(bucket) == 1
+
+
+def test_gate_queues_then_refuses():
+    admission = pytest.importorskip("valAPI.admission", exc_type=ImportError)
+
+    async def run():
+        gate = admission.Gate(limit=1, queue=1)
+        assert await gate.enter()
+        waiter = asyncio.ensure_future(gate.enter())
+        await asyncio.sleep(0)
+        refused = await gate.enter()
+        gate.leave(0.1)
+        return refused, await waiter, gate.active
+
+    assert asyncio.run(run()) == (False, True, 1)
+
+
+def test_tenant_header_only_from_trusted_proxies(monkeypatch):
+    admission = pytest.importorskip("valAPI.admission", exc_type=ImportError)
+    monkeypatch.setattr(admission, "TRUSTED_PROXIES", frozenset({"10.0.0.1"}))
+
+    def request(host, tenant=None):
+        headers = {admission.TENANT_HEADER: tenant} if tenant else {}
+        return SimpleNamespace(client=SimpleNamespace(host=host), headers=headers)
+
+    assert admission.client_key(request("10.0.0.1", "acme")) == "tenant:acme"
+    assert admission.client_key(request("10.0.0.1")) == "addr:10.0.0.1"
+    assert admission.client_key(request("192.0.2.7", "acme")) == "addr:192.0.2.7"
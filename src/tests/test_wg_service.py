@@ -0,0 +1,128 @@
+from valDaemon.utils.tracing import Trace
+
+
+def _kernel(service, ifname="wg0"):
+    return {p.public_key: p.allowed_ips for p in service._load_peers(ifname)["peers"]}
+
+
+def _cached(service, ifname="wg0"):
+    return {p.public_key: p.allowed_ips for p in service.cache.peers(ifname)["peers"]}
+
+
+def test_cache_follows_mutations(service, key):
+    assert _cached(service) == {}
+    service.add_peer("wg0", key(1), "10.0.0.1/32")
+    service.add_peer("wg0", key(2), "10.0.0.2/32,10.0.0.3/32")
+    service.add_peer("wg0", key(1), "10.0.0.4/32")
+    service.apply_peers("wg0", [{"op": "add", "public_key": key(3), "allowed_ips": "10.0.0.5/32"},
+                                {"op": "update", "public_key": key(2), "allowed_ips": "10.0.0.3/32"}])
+    service.remove_peer("wg0", key(3))
+    assert _cached(service) == _kernel(service) == {key(1): ("10.0.0.4/32",), key(2): ("10.0.0.3/32",)}
+
+
+def test_add_refuses_overlap_unless_forced(service, key):
+    service.add_peer("wg0", key(1), "10.0.0.0/24")
+    res = service.add_peer("wg0", key(2), "10.0.0.7/32")
+    assert res["status"] == "error" and res["conflicts"]
+    assert service.add_peer("wg0", key(2), "10.0.0.7/32", force=True)["status"] == "success"
+
+
+def test_ipam_releases_replaced_address(service, key):
+    service.create_pool("wg0", "10.8.0.0/29")
+    first = service.add_peer("wg0", key(1))
+    assert first["allowed_ips"] == "10.8.0.2/32"
+    assert service.add_peer("wg0", key(1), "10.8.0.5/32")["status"] == "success"
+    # .2 went back to the pool and .5 is taken
+    assert service.allocate_addresses("wg0", 2)["addresses"] == ["10.8.0.2/32", "10.8.0.3/32"]
+    service.remove_peer("wg0", key(1))
+    assert service.allocate_addresses("wg0")["addresses"] == ["10.8.0.5/32"]
+
+
+def test_apply_peers_reports_each_op(service, key):
+    res = service.apply_peers("wg0", [{"op": "add", "public_key": key(1), "allowed_ips": "10.0.0.1/32"},
+                                      {"op": "add", "public_key": "not-a-key", "allowed_ips": "10.0.0.2/32"},
+                                      {"op": "remove", "public_key": key(9)}])
+    assert res["status"] == "partial" and (res["applied"], res["failed"]) == (2, 1)
+    assert [r["status"] for r in res["results"]] == ["success", "error", "success"]
+    assert _kernel(service) == {key(1): ("10.0.0.1/32",)}
+
+
+def test_apply_peers_retries_a_rejected_chunk_peer_by_peer(service, key):
+    # passes parse_peer_op but not the backend, which rejects the whole message
+    res = service.apply_peers("wg0", [{"op": "add", "public_key": key(1), "allowed_ips": "10.0.0.1/32"},
+                                      {"op": "add", "public_key": key(2), "allowed_ips": "10.0.0.300/32"}])
+    assert [r["status"] for r in res["results"]] == ["success", "error"]
+    assert _kernel(service) == {key(1): ("10.0.0.1/32",)}
+
+
+def test_sync_peers_converges(service, key):
+    service.add_peer("wg0", key(1), "10.0.0.1/32")
+    service.add_peer("wg0", key(2), "10.0.0.2/32")
+    desired = [{"public_key": key(2), "allowed_ips": "10.0.0.20/32"},
+               {"public_key": key(3), "allowed_ips": "10.0.0.3/32"}]
+    plan = service.sync_peers("wg0", desired, dry_run=True)
+    assert (plan["added"], plan["removed"], plan["updated"]) == (1, 1, 1)
+    assert len(_kernel(service)) == 2
+    res = service.sync_peers("wg0", desired)
+    assert res["status"] == "success"
+    assert _kernel(service) == {key(2): ("10.0.0.20/32",), key(3): ("10.0.0.3/32",)}
+    again = service.sync_peers("wg0", desired)
+    assert (again["unchanged"], again["results"]) == (2, [])
+
+
+def test_queued_add_undone_by_remove_is_skipped(service, key):
+    results = service.apply_queued("wg0", [("add", key(1), "10.0.0.1/32", False, None),
+                                           ("remove", key(1), None, False, None)])
+    assert results[0] == {"status": "success", "coalesced": True}
+    assert results[1]["status"] == "success"
+    assert _kernel(service) == {}
+
+
+def test_queued_invalid_add_is_not_coalesced(service, key):
+    for bad in (("add", "not-a-key", "10.0.0.1/32"), ("add", key(1), "10.0.0.999/32")):
+        results = service.apply_queued("wg0", [bad + (False, None), ("remove", bad[1], None, False, None)])
+        assert results[0]["status"] == "error"
+        assert "coalesced" not in results[0]
+
+
+def test_queued_conflicting_add_is_not_coalesced(service, key):
+    service.add_peer("wg0", key(1), "10.0.0.1/32")
+    results = service.apply_queued("wg0", [("add", key(2), "10.0.0.1/32", False, None),
+                                           ("remove", key(2), None, False, None)])
+    assert results[0]["status"] == "error" and results[0]["conflicts"]
+    # a forced add would have been accepted, so it can be skipped
+    results = service.apply_queued("wg0", [("add", key(2), "10.0.0.1/32", True, None),
+                                           ("remove", key(2), None, False, None)])
+    assert results[0] == {"status": "success", "coalesced": True}
+    assert _kernel(service) == {key(1): ("10.0.0.1/32",)}
+
+
+def test_queued_conflict_within_the_batch(service, key):
+    # the second add clashes with the first one, which is still queued
+    results = service.apply_queued("wg0", [("add", key(1), "10.0.0.1/32", False, None),
+                                           ("add", key(2), "10.0.0.1/32", False, None),
+                                           ("remove", key(2), None, False, None)])
+    assert results[0]["status"] == "success"
+    assert results[1]["status"] == "error"
+    assert _kernel(service) == {key(1): ("10.0.0.1/32",)}
+
+
+def test_queued_batch_spans_every_trace(service, key):
+    traces = [Trace(), Trace()]
+    results = service.apply_queued("wg0", [("add", key(1), "10.0.0.1/32", False, traces[0]),
+                                           ("add", key(2), "10.0.0.2/32", False, traces[1])])
+    assert [r["status"] for r in results] == ["success", "success"]
+    for trace in traces:
+        # one set message for both, recorded on each
+        assert [s["call"] for s in trace.spans if s["name"] == "backend"].count("set_peers") == 1
+
+
+def test_endpoint_hostnames_are_resolved_per_op(service, key):
+    res = service.apply_peers("wg0", [
+        {"op": "add", "public_key": key(1), "allowed_ips": "10.0.0.1/32", "endpoint": "localhost:51820"},
+        {"op": "add", "public_key": key(2), "allowed_ips": "10.0.0.2/32", "endpoint": "no-such-host.invalid:51820"},
+        {"op": "add", "public_key": key(3), "allowed_ips": "10.0.0.3/32", "endpoint": "[fd00::3]:51820"}])
+    assert [r["status"] for r in res["results"]] == ["success", "error", "success"]
+    endpoints = {p.public_key: p.endpoint for p in service._load_peers("wg0")["peers"]}
+    assert endpoints[key(1)] in ("127.0.0.1:51820", "[::1]:51820")
+    assert endpoints[key(3)] == "[fd00::3]:51820"
@@ -0,0 +1,27 @@
+from wgAPI.services.wg_service import WGService
+
+
+def _allowed(svc):
+    return {p["public_key"]: p["allowed_ips"] for p in svc.list_peers()["peers"]}
+
+
+def test_add_extends_a_known_peer(fake, key):
+    svc = WGService(backend=fake)
+    assert svc.add_peer(key(1), "10.0.0.1/32")["status"] == "success"
+    # another instance (another worker) adding to the same peer
+    assert WGService(backend=fake).add_peer(key(1), "10.0.0.2/32")["status"] == "success"
+    assert svc.add_peer(key(1), "10.0.0.1/32")["status"] == "success"
+    assert _allowed(svc) == {key(1): "10.0.0.1/32,10.0.0.2/32"}
+
+
+def test_add_refuses_another_peers_prefix(fake, key):
+    svc = WGService(backend=fake)
+    svc.add_peer(key(1), "10.0.0.0/24")
+    res = svc.add_peer(key(2), "10.0.0.9/32")
+    assert res["status"] == "error" and "overlaps" in res["message"]
+    assert svc.add_peer(key(2), "10.0.0.9/32", force=True)["status"] == "success"
+
+
+def test_add_to_missing_interface_fails(fake, key):
+    res = WGService("wg9", backend=fake).add_peer(key(1), "10.0.0.1/32")
+    assert res["status"] == "error"
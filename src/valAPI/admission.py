@@ -0,0 +1,164 @@
+import asyncio
+import math
+import os
+import time
+from typing import Dict, List
+
+from fastapi import HTTPException, Request
+from valAPI.metrics import family, registry
+
+# per client: sustained mutating requests per second, and how many may come at once
+RATE = float(os.environ.get("VALAPI_MUTATE_RATE", "20"))
+BURST = float(os.environ.get("VALAPI_MUTATE_BURST", "40"))
+# mutating requests handed to the daemon at once, and how many may wait for a turn
+CONCURRENCY = int(os.environ.get("VALAPI_MUTATE_CONCURRENCY", "8"))
+QUEUE = int(os.environ.get("VALAPI_MUTATE_QUEUE", "64"))
+# requests carrying this header are limited per value (tenant); the rest per client address
+TENANT_HEADER = os.environ.get("VALAPI_TENANT_HEADER", "x-tenant-id")
+# the header is only believed from these peer addresses (a proxy that sets it); none by default
+TRUSTED_PROXIES = frozenset(a.strip() for a in os.environ.get("VALAPI_TRUSTED_PROXIES", "").split(",") if a.strip())
+# buckets kept before idle (full) ones are dropped
+MAX_CLIENTS = 10000
+
+rejected = registry.counter("valapi_admission_rejected_total",
+                            "Mutating requests answered 429, by reason (rate or queue).", ("reason",))
+
+
+class TokenBucket:
+    """
+    Per-client token buckets, refilled lazily on use: `rate` tokens a second
+    up to `burst`. take() returns 0 when a token was taken, otherwise the
+    seconds until one will be there.
+    """
+    def __init__(self, rate: float = RATE, burst: float = BURST, max_clients: int = MAX_CLIENTS):
+        self.rate = rate
+        self.burst = max(1.0, burst)
+        self.max_clients = max_clients
+        self._buckets: Dict[str, List[float]] = {}
+
+    def take(self, client: str, now: float = None) -> float:
+        if self.rate <= 0:
+            return 0.0
+        now = time.monotonic() if now is None else now
+        bucket = self._buckets.get(client)
+        if bucket is None:
+            if len(self._buckets) >= self.max_clients:
+                self._prune(now)
+            bucket = self._buckets[client] = [self.burst, now]
+        tokens = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+        bucket[1] = now
+        if tokens >= 1:
+            bucket[0] = tokens - 1
+            return 0.0
+        bucket[0] = tokens
+        return (1 - tokens) / self.rate
+
+    def _prune(self, now: float):
+        # a bucket that has refilled is the same as no bucket
+        full = [k for k, (tokens, at) in self._buckets.items() if tokens + (now - at) * self.rate >= self.burst]
+        for key in full:
+            del self._buckets[key]
+        if len(self._buckets) >= self.max_clients:
+            # still full of active clients: forget the least recently seen half
+            for key, _ in sorted(self._buckets.items(), key=lambda kv: kv[1][1])[:len(self._buckets) // 2]:
+                del self._buckets[key]
+
+    def __len__(self):
+        return len(self._buckets)
+
+
+class Gate:
+    """
+    At most `limit` requests at a time, `queue` more waiting in arrival order;
+    past that, enter() fails at once instead of stacking more work behind a
+    busy daemon. Tracks an average service time to say when to retry.
+    """
+    def __init__(self, limit: int = CONCURRENCY, queue: int = QUEUE):
+        self.limit = max(1, limit)
+        self.queue = max(0, queue)
+        self.active = 0
+        self._waiters: List[asyncio.Future] = []
+        self.avg_seconds = 0.1
+
+    def retry_after(self) -> float:
+        return self.avg_seconds * (len(self._waiters) + self.active) / self.limit
+
+    async def enter(self) -> bool:
+        if self.active < self.limit and not self._waiters:
+            self.active += 1
+            return True
+        if len(self._waiters) >= self.queue:
+            return False
+        fut = asyncio.get_event_loop().create_future()
+        self._waiters.append(fut)
+        try:
+            await fut
+        except asyncio.CancelledError:
+            if fut in self._waiters:
+                self._waiters.remove(fut)
+            elif not fut.cancelled():
+                # our turn came just as we gave up: pass it on
+                self.active -= 1
+                self._wake()
+            raise
+        return True
+
+    def leave(self, seconds: float):
+        self.avg_seconds += 0.2 * (seconds - self.avg_seconds)
+        self.active -= 1
+        self._wake()
+
+    def _wake(self):
+        while self._waiters and self.active < self.limit:
+            fut = self._waiters.pop(0)
+            if not fut.done():
+                self.active += 1
+                fut.set_result(None)
+
+
+buckets = TokenBucket()
+gate = Gate()
+
+
+def client_key(request: Request) -> str:
+    # a client choosing its own tenant could take a fresh bucket per request
+    host = request.client.host if request.client else ""
+    tenant = request.headers.get(TENANT_HEADER) if TENANT_HEADER and host in TRUSTED_PROXIES else None
+    if tenant:
+        return "tenant:" + tenant[:128]
+    return "addr:" + host
+
+
+def _too_many(reason: str, seconds: float) -> HTTPException:
+    rejected.labels(reason).inc()
+    return HTTPException(status_code=429, detail={"status": "error", "message": f"too many requests ({reason})"},
+                         headers={"Retry-After": str(max(1, math.ceil(seconds)))})
+
+
+async def admit(request: Request):
+    """
+    Dependency for mutating routes: a token from the client's bucket, then a
+    place in the gate to the daemon; 429 with Retry-After when either is out.
+    """
+    wait = buckets.take(client_key(request))
+    if wait:
+        raise _too_many("rate", wait)
+    if not await gate.enter():
+        raise _too_many("queue", gate.retry_after())
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        gate.leave(time.perf_counter() - start)
+
+
+def _admission_metrics() -> List[str]:
+    return (family("valapi_admission_active", "gauge", "Mutating requests being handled.",
+                   [({}, gate.active)]) +
+            family("valapi_admission_queued", "gauge", "Mutating requests waiting for a turn.",
+                   [({}, len(gate._waiters))]) +
+            family("valapi_admission_clients", "gauge", "Clients with a rate-limit bucket.",
+                   [({}, len(buckets))]))
+
+
+registry.add_collector(_admission_metrics)
@@ -1,10 +1,40 @@
 import socket
 import json
 import os
-from typing import Dict, Any
+import ssl
+import struct
+import itertools
+import threading
+import asyncio
+import concurrent.futures
+import contextvars
+import time
+from typing import AsyncIterator, Dict, Any, Iterator, List, Optional, Tuple
+
+from valAPI.clients.hashring import HashRing
+from valAPI.metrics import daemon_coalesced, daemon_errors, daemon_seconds, family, registry
 
 DEFAULT_SOCKET = os.environ.get("VALDAEMON_SOCKET", "/run/valdaemon.sock")
 FALLBACK_SOCKET = "/tmp/valdaemon.sock"
+POOL_SIZE = int(os.environ.get("VALAPI_POOL_SIZE", "4"))
+# fleet of daemons, "name=address,...", or a JSON file {"nodes": {name: address}, "pins": {interface: name}}.
+# Addresses are socket paths, unix:PATH, tcp://HOST:PORT or tls://HOST:PORT.
+DAEMONS = os.environ.get("VALAPI_DAEMONS", "")
+DAEMONS_FILE = os.environ.get("VALAPI_DAEMONS_FILE", "")
+# CA that signed the daemons' certificates (default: system CAs), and a client certificate for mutual TLS
+TLS_CA = os.environ.get("VALAPI_TLS_CA", "")
+TLS_CERT = os.environ.get("VALAPI_TLS_CERT", "")
+TLS_KEY = os.environ.get("VALAPI_TLS_KEY", "")
+
+# Must match valDaemon.protocol: 4-byte big-endian length + JSON object with an "id".
+HEADER = struct.Struct("!I")
+MAX_FRAME = 16 * 1024 * 1024 - 1
+
+_ids = itertools.count(1)
+
+# X-Request-ID of the HTTP request being served; set by the middleware in
+# valAPI.main and sent along with every daemon request so its traces match up.
+request_id: contextvars.ContextVar = contextvars.ContextVar("valapi_request_id", default=None)
 
 def _choose_socket():
     if os.path.exists(DEFAULT_SOCKET):
@@ -13,33 +43,654 @@ def _choose_socket():
         return FALLBACK_SOCKET
     return DEFAULT_SOCKET
 
-def send(payload: Dict[str, Any], socket_path: str = None, timeout: float = 5.0) -> Dict[str, Any]:
-    path = socket_path or _choose_socket()
+def parse_address(address: str) -> Tuple[str, Any]:
+    """("unix", path) or ("tcp" | "tls", (host, port))."""
+    if address.startswith("unix:"):
+        return "unix", address[5:]
+    for scheme in ("tcp", "tls"):
+        if address.startswith(scheme + "://"):
+            host, _, port = address[len(scheme) + 3:].rpartition(":")
+            if not host or not port.isdigit():
+                raise ValueError(f"invalid daemon address {address!r}, expected {scheme}://HOST:PORT")
+            return scheme, (host.strip("[]"), int(port))
+    return "unix", address
+
+_tls: Optional[ssl.SSLContext] = None
+
+def tls_context() -> ssl.SSLContext:
+    global _tls
+    if _tls is None:
+        ctx = ssl.create_default_context(cafile=TLS_CA or None)
+        if TLS_CERT:
+            ctx.load_cert_chain(TLS_CERT, TLS_KEY or None)
+        _tls = ctx
+    return _tls
+
+def next_id() -> int:
+    return next(_ids)
+
+def _tagged(payload: Dict[str, Any], **fields) -> Dict[str, Any]:
+    rid = request_id.get()
+    if rid is not None:
+        fields["request_id"] = rid
+    return dict(payload, **fields)
+
+def encode_frame(obj: Dict[str, Any]) -> bytes:
+    body = json.dumps(obj).encode("utf-8")
+    if len(body) > MAX_FRAME:
+        raise ValueError(f"frame too large: {len(body)} bytes")
+    return HEADER.pack(len(body)) + body
+
+class FrameReader:
+    """
+    Buffered frame decoder: one recv_into fills a reusable chunk, complete
+    frames are cut out of a bytearray, and the consumed prefix is dropped once
+    per refill. No per-frame header syscall and no quadratic `bytes +=`.
+    """
+    def __init__(self, client: socket.socket, chunk_size: int = 256 * 1024):
+        self.client = client
+        self.buf = bytearray()
+        self.chunk = bytearray(chunk_size)
+        self.view = memoryview(self.chunk)
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        buf = self.buf
+        start = 0
+        while True:
+            while len(buf) - start >= HEADER.size:
+                (length,) = HEADER.unpack_from(buf, start)
+                if length > MAX_FRAME:
+                    raise ValueError(f"frame too large: {length} bytes")
+                end = start + HEADER.size + length
+                if len(buf) < end:
+                    break
+                yield json.loads(buf[start + HEADER.size:end])
+                start = end
+            del buf[:start]
+            start = 0
+            n = self.client.recv_into(self.view)
+            if not n:
+                if buf:
+                    raise ConnectionError("daemon closed the connection mid-frame")
+                return
+            buf += self.view[:n]
+
+def _recv_exact(client: socket.socket, n: int) -> bytes:
+    buf = bytearray(n)
+    view = memoryview(buf)
+    got = 0
+    while got < n:
+        r = client.recv_into(view[got:], n - got)
+        if not r:
+            raise ConnectionError("daemon closed the connection")
+        got += r
+    return bytes(buf)
+
+def read_frame(client: socket.socket) -> Dict[str, Any]:
+    (length,) = HEADER.unpack(_recv_exact(client, HEADER.size))
+    if length > MAX_FRAME:
+        raise ValueError(f"frame too large: {length} bytes")
+    return json.loads(_recv_exact(client, length))
+
+def _record(action, start: float, out: Dict[str, Any], reason: str = None) -> Dict[str, Any]:
+    """Time one daemon round trip and count it as failed when it is."""
+    action = str(action)
+    daemon_seconds.labels(action).observe(time.perf_counter() - start)
+    if reason is None and out.get("status") == "error":
+        reason = "daemon"
+    if reason is not None:
+        daemon_errors.labels(action, reason).inc()
+    return out
+
+def _connect(path: str, timeout: float):
     try:
-        client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
-        client.settimeout(timeout)
-        client.connect(path)
+        kind, target = parse_address(path)
+        if kind == "unix":
+            client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            client.settimeout(timeout)
+            client.connect(target)
+        else:
+            client = socket.create_connection(target, timeout)
+            client.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            if kind == "tls":
+                client = tls_context().wrap_socket(client, server_hostname=target[0])
+        return client, None
     except FileNotFoundError:
-        return {"status": "error", "message": f"Socket not found at {path}. Is valDaemon running?"}
+        return None, {"status": "error", "message": f"Socket not found at {path}. Is valDaemon running?"}
     except PermissionError:
-        return {"status": "error", "message": f"Permission denied connecting to socket {path}."}
+        return None, {"status": "error", "message": f"Permission denied connecting to socket {path}."}
     except Exception as e:
-        return {"status": "error", "message": f"Connection error to {path}: {e}"}
+        return None, {"status": "error", "message": f"Connection error to {path}: {e}"}
+
+class DaemonConnection:
+    """
+    One persistent framed connection. Requests are written under a lock and a
+    reader thread routes each response to the Future registered for its id, so
+    many callers can share the socket concurrently.
+    """
+    def __init__(self, path: str, timeout: float = 5.0):
+        self.path = path
+        self.timeout = timeout
+        self.sock = None
+        self.alive = False
+        self._pending: Dict[int, concurrent.futures.Future] = {}
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+
+    def connect(self) -> Optional[Dict[str, Any]]:
+        client, err = _connect(self.path, self.timeout)
+        if err:
+            return err
+        # responses are awaited through futures; the reader itself blocks
+        client.settimeout(None)
+        self.sock = client
+        self.alive = True
+        threading.Thread(target=self._read_loop, name="valapi-daemon-reader", daemon=True).start()
+        return None
+
+    def request(self, payload: Dict[str, Any]) -> concurrent.futures.Future:
+        fut = concurrent.futures.Future()
+        req_id = next_id()
+        with self._lock:
+            if not self.alive:
+                fut.set_exception(ConnectionError("connection closed"))
+                return fut
+            self._pending[req_id] = fut
+        # a caller that gives up cancels the future; drop its slot
+        fut.add_done_callback(lambda f: f.cancelled() and self._discard(req_id))
+        try:
+            self._send(encode_frame(_tagged(payload, id=req_id)))
+        except Exception as e:
+            with self._lock:
+                self._pending.pop(req_id, None)
+            if isinstance(e, OSError):
+                self.close(e)
+            if not fut.done():
+                fut.set_exception(e)
+        return fut
+
+    def _send(self, data: bytes):
+        with self._write_lock:
+            self.sock.sendall(data)
+
+    def _discard(self, req_id: int):
+        with self._lock:
+            self._pending.pop(req_id, None)
+
+    def _read_loop(self):
+        err = ConnectionError("daemon closed the connection")
+        try:
+            for out in FrameReader(self.sock):
+                with self._lock:
+                    fut = self._pending.pop(out.pop("id", None), None)
+                if fut is not None and not fut.done():
+                    fut.set_result(out)
+        except Exception as e:
+            err = e
+        self.close(err)
+
+    def close(self, err: Exception = None):
+        with self._lock:
+            self.alive = False
+            pending, self._pending = self._pending, {}
+        try:
+            if self.sock:
+                self.sock.close()
+        except Exception:
+            pass
+        for fut in pending.values():
+            if not fut.done():
+                fut.set_exception(ConnectionError(f"daemon connection lost: {err}"))
+
+
+async def _aopen(path: str, timeout: float):
+    kind, target = parse_address(path)
+    if kind == "unix":
+        return await asyncio.wait_for(asyncio.open_unix_connection(target), timeout)
+    host, port = target
+    reader, writer = await asyncio.wait_for(
+        asyncio.open_connection(host, port, ssl=tls_context() if kind == "tls" else None), timeout)
+    sock = writer.get_extra_info("socket")
+    if sock is not None:
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    return reader, writer
+
+_io_loop: Optional[asyncio.AbstractEventLoop] = None
+_io_lock = threading.Lock()
+
+def _background_loop() -> asyncio.AbstractEventLoop:
+    """Event loop on a daemon thread that does the I/O of every TCP/TLS connection."""
+    global _io_loop
+    with _io_lock:
+        if _io_loop is None:
+            _io_loop = asyncio.new_event_loop()
+            threading.Thread(target=_io_loop.run_forever, name="valapi-daemon-io", daemon=True).start()
+    return _io_loop
+
+class StreamConnection(DaemonConnection):
+    """
+    DaemonConnection to a daemon over TCP or TLS. Reads and writes run on one
+    background event loop instead of a reader thread plus the callers, as an
+    SSL socket must not be used from two threads at once.
+    """
+    def __init__(self, path: str, timeout: float = 5.0):
+        super().__init__(path, timeout)
+        self.loop = None
+        self.writer = None
+        self._drain_lock = None
+
+    def connect(self) -> Optional[Dict[str, Any]]:
+        self.loop = _background_loop()
+        try:
+            reader, self.writer = asyncio.run_coroutine_threadsafe(
+                _aopen(self.path, self.timeout), self.loop).result(self.timeout + 1)
+        except Exception as e:
+            return {"status": "error", "message": f"Connection error to {self.path}: {e}"}
+        self.alive = True
+        asyncio.run_coroutine_threadsafe(self._read_loop_async(reader), self.loop)
+        return None
+
+    def _send(self, data: bytes):
+        if self.writer.is_closing():
+            raise ConnectionError("daemon connection closed")
+        # a write that fails or cannot drain closes the connection, which
+        # fails every pending request now rather than at its timeout
+        fut = asyncio.run_coroutine_threadsafe(self._write(data), self.loop)
+        fut.add_done_callback(lambda f: not f.cancelled() and f.exception() and self.close(f.exception()))
+
+    async def _write(self, data: bytes):
+        if self.writer.is_closing():
+            raise ConnectionError("daemon connection closed")
+        self.writer.write(data)
+        if self._drain_lock is None:
+            self._drain_lock = asyncio.Lock()
+        async with self._drain_lock:
+            await asyncio.wait_for(self.writer.drain(), self.timeout)
+
+    async def _read_loop_async(self, reader: asyncio.StreamReader):
+        err = ConnectionError("daemon closed the connection")
+        try:
+            while True:
+                (length,) = HEADER.unpack(await reader.readexactly(HEADER.size))
+                if length > MAX_FRAME:
+                    raise ValueError(f"frame too large: {length} bytes")
+                out = json.loads(await reader.readexactly(length))
+                with self._lock:
+                    fut = self._pending.pop(out.pop("id", None), None)
+                if fut is not None and not fut.done():
+                    fut.set_result(out)
+        except asyncio.IncompleteReadError:
+            pass
+        except Exception as e:
+            err = e
+        self.close(err)
 
+    def close(self, err: Exception = None):
+        super().close(err)
+        if self.writer is not None:
+            self.loop.call_soon_threadsafe(self.writer.close)
+
+def connection(path: str, timeout: float = 5.0) -> DaemonConnection:
+    kind, _ = parse_address(path)
+    return DaemonConnection(path, timeout) if kind == "unix" else StreamConnection(path, timeout)
+
+
+class DaemonPool:
+    """
+    Keeps `size` warm connections to valDaemon and spreads requests over them
+    round-robin. Dead connections (daemon restart, socket error) are replaced
+    on next use. Offers a blocking `call` and an awaitable `acall`; neither
+    ties up a thread while the daemon works.
+    """
+    def __init__(self, socket_path: str = None, size: int = POOL_SIZE, timeout: float = 5.0):
+        self.socket_path = socket_path
+        self.size = max(1, size)
+        self.timeout = timeout
+        self._conns: List[Optional[DaemonConnection]] = [None] * self.size
+        self._locks = [threading.Lock() for _ in range(self.size)]
+        self._rr = itertools.count()
+
+    def _slot(self, i: int):
+        conn = self._conns[i]
+        if conn is not None and conn.alive:
+            return conn, None
+        with self._locks[i]:
+            conn = self._conns[i]
+            if conn is not None and conn.alive:
+                return conn, None
+            conn = connection(self.socket_path or _choose_socket(), self.timeout)
+            err = conn.connect()
+            if err:
+                return None, err
+            self._conns[i] = conn
+            return conn, None
+
+    def submit(self, payload: Dict[str, Any], i: int = None) -> concurrent.futures.Future:
+        i = next(self._rr) % self.size if i is None else i
+        conn, err = self._slot(i)
+        if err:
+            fut = concurrent.futures.Future()
+            fut.set_result(err)
+            return fut
+        return self._request(i, conn, payload)
+
+    def _request(self, i: int, conn: DaemonConnection, payload: Dict[str, Any]) -> concurrent.futures.Future:
+        fut = conn.request(payload)
+        if fut.done() and isinstance(fut.exception(), ConnectionError):
+            # stale connection (daemon restarted): reconnect once and retry
+            conn, err = self._slot(i)
+            if err:
+                fut = concurrent.futures.Future()
+                fut.set_result(err)
+            else:
+                fut = conn.request(payload)
+        return fut
+
+    async def asubmit(self, payload: Dict[str, Any]) -> concurrent.futures.Future:
+        """submit() for the event loop: connecting, up to `timeout` for a remote node, runs on a thread."""
+        i = next(self._rr) % self.size
+        conn = self._conns[i]
+        if conn is not None and conn.alive:
+            fut = conn.request(payload)
+            if not (fut.done() and isinstance(fut.exception(), ConnectionError)):
+                return fut
+        return await asyncio.get_running_loop().run_in_executor(None, self.submit, payload, i)
+
+    def call(self, payload: Dict[str, Any], timeout: float = None) -> Dict[str, Any]:
+        start, action = time.perf_counter(), payload.get("action")
+        fut = self.submit(payload)
+        try:
+            return _record(action, start, fut.result(timeout or self.timeout))
+        except concurrent.futures.TimeoutError:
+            fut.cancel()
+            return _record(action, start, {"status":"error","message":"timed out waiting for daemon"}, "timeout")
+        except Exception as e:
+            return _record(action, start, {"status":"error","message":f"send/recv error: {e}"}, "connection")
+
+    async def acall(self, payload: Dict[str, Any], timeout: float = None) -> Dict[str, Any]:
+        start, action = time.perf_counter(), payload.get("action")
+        fut = await self.asubmit(payload)
+        try:
+            return _record(action, start, await asyncio.wait_for(asyncio.wrap_future(fut), timeout or self.timeout))
+        except asyncio.TimeoutError:
+            return _record(action, start, {"status":"error","message":"timed out waiting for daemon"}, "timeout")
+        except Exception as e:
+            return _record(action, start, {"status":"error","message":f"send/recv error: {e}"}, "connection")
+
+    def health(self) -> Dict[str, Any]:
+        """Ping every slot, reconnecting the ones that are down."""
+        futs = []
+        for i in range(self.size):
+            conn, err = self._slot(i)
+            futs.append(self._request(i, conn, {"action": "ping"}) if conn else None)
+        ok = 0
+        for fut in futs:
+            try:
+                if fut is not None and fut.result(self.timeout).get("status") == "success":
+                    ok += 1
+            except Exception:
+                pass
+        status = "success" if ok == self.size else "error"
+        return {"status": status, "connections": self.size, "healthy": ok}
+
+    def close(self):
+        for i, conn in enumerate(self._conns):
+            if conn is not None:
+                conn.close()
+            self._conns[i] = None
+
+    def stats(self) -> Tuple[int, int]:
+        """(connections up, requests awaiting a response)"""
+        alive = [c for c in self._conns if c is not None and c.alive]
+        return len(alive), sum(len(c._pending) for c in alive)
+
+
+def load_nodes(spec: str = DAEMONS, path: str = DAEMONS_FILE) -> Tuple[Dict[str, Optional[str]], Dict[str, str]]:
+    """({name: address}, {interface: name}) from $VALAPI_DAEMONS_FILE or $VALAPI_DAEMONS."""
+    if path:
+        with open(path) as f:
+            conf = json.load(f)
+        nodes, pins = dict(conf.get("nodes") or {}), dict(conf.get("pins") or {})
+    else:
+        nodes, pins = {}, {}
+        for item in filter(None, (part.strip() for part in spec.split(","))):
+            name, sep, address = item.partition("=")
+            if not sep or not name.strip() or not address.strip():
+                raise ValueError(f"invalid VALAPI_DAEMONS entry {item!r}, expected name=address")
+            nodes[name.strip()] = address.strip()
+    for address in nodes.values():
+        parse_address(address)
+    unknown = set(pins.values()) - set(nodes)
+    if unknown:
+        raise ValueError(f"interfaces pinned to unknown nodes: {', '.join(sorted(unknown))}")
+    return nodes, pins
+
+
+class Fleet:
+    """
+    The daemons valAPI drives, one DaemonPool each. An interface, and with
+    it every peer on it, belongs to the node its name hashes to on a
+    consistent-hash ring unless `pins` names a node for it. Requests that
+    name no interface go to the first node. Without configuration this is a
+    single node, "local", on the local socket.
+    """
+    def __init__(self, nodes: Dict[str, Optional[str]] = None, pins: Dict[str, str] = None):
+        self.nodes = dict(nodes or {"local": None})
+        self.pins = dict(pins or {})
+        self.primary = next(iter(self.nodes))
+        self.ring = HashRing(self.nodes)
+        self._pools: Dict[str, DaemonPool] = {}
+        self._lock = threading.Lock()
+
+    def owner(self, interface: str = None) -> str:
+        if not interface:
+            return self.primary
+        pinned = self.pins.get(interface)
+        if pinned is not None:
+            return pinned
+        return self.ring.node(interface) if len(self.nodes) > 1 else self.primary
+
+    def address(self, name: str) -> str:
+        return self.nodes[name] or _choose_socket()
+
+    def address_for(self, interface: str = None) -> str:
+        return self.address(self.owner(interface))
+
+    def pool(self, name: str) -> DaemonPool:
+        pool = self._pools.get(name)
+        if pool is None:
+            with self._lock:
+                pool = self._pools.get(name)
+                if pool is None:
+                    pool = self._pools[name] = DaemonPool(self.nodes[name])
+        return pool
+
+    def pool_for(self, interface: str = None) -> DaemonPool:
+        return self.pool(self.owner(interface))
+
+    async def gather(self, payload: Dict[str, Any], timeout: float = 5.0,
+                     nodes: List[str] = None) -> Dict[str, Dict[str, Any]]:
+        """The same request sent to every node (or `nodes`) at once: {node: response}."""
+        names = list(nodes or self.nodes)
+        outs = await asyncio.gather(*(self.pool(name).acall(payload, timeout) for name in names))
+        return dict(zip(names, outs))
+
+    def health(self) -> Dict[str, Any]:
+        if len(self.nodes) == 1:
+            return self.pool(self.primary).health()
+        pool = concurrent.futures.ThreadPoolExecutor(max_workers=min(32, len(self.nodes)))
+        with pool:
+            results = dict(zip(self.nodes, pool.map(lambda name: self.pool(name).health(), self.nodes)))
+        up = sum(1 for r in results.values() if r["status"] == "success")
+        return {"status": "success" if up == len(results) else "error", "healthy_nodes": up, "nodes": results}
+
+    def close(self):
+        with self._lock:
+            pools, self._pools = list(self._pools.values()), {}
+        for pool in pools:
+            pool.close()
+
+    def metrics(self) -> List[str]:
+        stats = {name: pool.stats() for name, pool in list(self._pools.items())}
+        return (family("valapi_daemon_connections", "gauge", "Pooled valDaemon connections that are up, by node.",
+                       [({"node": name}, up) for name, (up, _) in stats.items()]) +
+                family("valapi_daemon_pending_requests", "gauge", "Requests awaiting a daemon response, by node.",
+                       [({"node": name}, pending) for name, (_, pending) in stats.items()]) +
+                family("valapi_daemon_shared_requests", "gauge", "Coalesced reads awaiting a daemon response.",
+                       [({}, len(_flights))]))
+
+
+_fleet: Optional[Fleet] = None
+_fleet_lock = threading.Lock()
+
+def get_fleet() -> Fleet:
+    global _fleet
+    if _fleet is None:
+        with _fleet_lock:
+            if _fleet is None:
+                _fleet = Fleet(*load_nodes())
+    return _fleet
+
+def get_pool(interface: str = None) -> DaemonPool:
+    """Pool of the node that owns `interface` (the first node when None)."""
+    return get_fleet().pool_for(interface)
+
+def _pool_metrics() -> List[str]:
+    return _fleet.metrics() if _fleet is not None else []
+
+registry.add_collector(_pool_metrics)
+
+def close_pool():
+    global _fleet
+    with _fleet_lock:
+        if _fleet is not None:
+            _fleet.close()
+            _fleet = None
+
+async def asend(payload: Dict[str, Any], timeout: float = 5.0) -> Dict[str, Any]:
+    """Awaitable request over the pool of the node that owns the payload's interface."""
+    return await get_pool(payload.get("interface")).acall(payload, timeout)
+
+class SingleFlight:
+    """
+    Identical reads in flight at the same time share one daemon round trip:
+    the first caller's request goes out and everyone who asks for the same
+    payload before it comes back awaits its result. A caller that gives up
+    (client disconnect, timeout) leaves the request running for the others.
+    """
+    def __init__(self):
+        self._calls: Dict[str, asyncio.Future] = {}
+
+    async def do(self, payload: Dict[str, Any], timeout: float = 5.0) -> Dict[str, Any]:
+        key = json.dumps(payload, sort_keys=True)
+        fut = self._calls.get(key)
+        if fut is None:
+            fut = asyncio.ensure_future(get_pool(payload.get("interface")).acall(payload, timeout))
+            self._calls[key] = fut
+            fut.add_done_callback(lambda f: self._calls.get(key) is f and self._calls.pop(key))
+        else:
+            daemon_coalesced.labels(payload.get("action")).inc()
+        return await asyncio.shield(fut)
+
+    def __len__(self):
+        return len(self._calls)
+
+
+_flights = SingleFlight()
+
+async def ashared(payload: Dict[str, Any], timeout: float = 5.0) -> Dict[str, Any]:
+    """
+    asend() for reads: joins an identical request already in flight instead
+    of sending another. The result dict is shared, so callers must not
+    modify it. Only for side-effect-free actions.
+    """
+    return await _flights.do(payload, timeout)
+
+def stream(payload: Dict[str, Any], socket_path: str = None, timeout: float = 30.0) -> Iterator[Dict[str, Any]]:
+    """
+    Issue a streamed request ("stream": true) on a dedicated connection and
+    yield each frame as it arrives, ending with the final status frame. Not
+    pooled: while the caller is slow the socket simply stops being read, so
+    the daemon is throttled instead of frames buffering up here.
+    """
+    client, err = _connect(socket_path or get_fleet().address_for(payload.get("interface")), timeout)
+    if err:
+        yield err
+        return
+    try:
+        req_id = next_id()
+        client.sendall(encode_frame(_tagged(payload, id=req_id, stream=True)))
+        for frame in FrameReader(client):
+            if frame.pop("id", None) != req_id:
+                continue
+            yield frame
+            if not frame.get("more"):
+                return
+        yield {"status":"error","message":"daemon closed the stream early"}
+    except Exception as e:
+        yield {"status":"error","message":f"stream error: {e}"}
+    finally:
+        try:
+            client.close()
+        except Exception:
+            pass
+
+async def astream(payload: Dict[str, Any], socket_path: str = None,
+                  timeout: float = 30.0) -> AsyncIterator[Dict[str, Any]]:
+    """asyncio form of stream(); frames are awaited, never blocking a thread."""
+    path = socket_path or get_fleet().address_for(payload.get("interface"))
+    try:
+        reader, writer = await _aopen(path, timeout)
+    except Exception as e:
+        yield {"status":"error","message":f"Connection error to {path}: {e}"}
+        return
     try:
-        client.sendall(json.dumps(payload).encode("utf-8"))
-        resp = b""
+        req_id = next_id()
+        writer.write(encode_frame(_tagged(payload, id=req_id, stream=True)))
+        await writer.drain()
         while True:
-            try:
-                chunk = client.recv(65536)
-                if not chunk:
-                    break
-                resp += chunk
-            except socket.timeout:
-                break
-        if not resp:
-            return {"status":"error","message":"empty response from daemon"}
-        return json.loads(resp.decode("utf-8"))
+            header = await asyncio.wait_for(reader.readexactly(HEADER.size), timeout)
+            (length,) = HEADER.unpack(header)
+            if length > MAX_FRAME:
+                raise ValueError(f"frame too large: {length} bytes")
+            frame = json.loads(await asyncio.wait_for(reader.readexactly(length), timeout))
+            if frame.pop("id", None) != req_id:
+                continue
+            yield frame
+            if not frame.get("more"):
+                return
+    except asyncio.IncompleteReadError:
+        yield {"status":"error","message":"daemon closed the stream early"}
+    except Exception as e:
+        yield {"status":"error","message":f"stream error: {e}"}
+    finally:
+        writer.close()
+
+def send(payload: Dict[str, Any], socket_path: str = None, timeout: float = 5.0,
+         legacy: bool = False) -> Dict[str, Any]:
+    """
+    Send one request to the valDaemon owning the payload's interface, over
+    that node's connection pool. An explicit socket_path or legacy=True uses
+    a dedicated one-off connection instead (legacy speaks the old one-shot
+    JSON dialect).
+    """
+    if socket_path is None and not legacy:
+        return get_pool(payload.get("interface")).call(payload, timeout)
+
+    path = socket_path or get_fleet().address_for(payload.get("interface"))
+    client, err = _connect(path, timeout)
+    if err:
+        return err
+
+    try:
+        if legacy:
+            return _send_legacy(client, payload)
+        req_id = next_id()
+        client.sendall(encode_frame(_tagged(payload, id=req_id)))
+        while True:
+            out = read_frame(client)
+            if out.pop("id", None) == req_id:
+                return out
     except Exception as e:
         return {"status":"error","message":f"send/recv error: {e}"}
     finally:
@@ -47,3 +698,19 @@ def send(payload: Dict[str, Any], socket_path: str = None, timeout: float = 5.0)
             client.close()
         except Exception:
             pass
+
+def _send_legacy(client: socket.socket, payload: Dict[str, Any]) -> Dict[str, Any]:
+    client.sendall(json.dumps(_tagged(payload)).encode("utf-8"))
+    client.shutdown(socket.SHUT_WR)
+    resp = bytearray()
+    while True:
+        try:
+            chunk = client.recv(65536)
+            if not chunk:
+                break
+            resp += chunk
+        except socket.timeout:
+            break
+    if not resp:
+        return {"status":"error","message":"empty response from daemon"}
+    return json.loads(resp.decode("utf-8"))
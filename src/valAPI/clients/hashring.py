@@ -0,0 +1,29 @@
+import bisect
+import hashlib
+from typing import Iterable, List
+
+# points per node on the ring; more points, more even shares
+VNODES = 256
+
+
+def _hash(value: str) -> int:
+    return int.from_bytes(hashlib.blake2b(value.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+class HashRing:
+    """
+    Consistent hashing of keys (interface names) onto nodes. Each node owns
+    `vnodes` points on a 64-bit ring and a key goes to the first point at or
+    after its hash, so adding or removing one of N nodes moves about 1/N of
+    the keys and leaves the rest where they were.
+    """
+    def __init__(self, nodes: Iterable[str], vnodes: int = VNODES):
+        points = sorted((_hash(f"{node}#{i}"), node) for node in nodes for i in range(vnodes))
+        if not points:
+            raise ValueError("a hash ring needs at least one node")
+        self._points: List[int] = [p for p, _ in points]
+        self._nodes: List[str] = [n for _, n in points]
+
+    def node(self, key: str) -> str:
+        i = bisect.bisect_left(self._points, _hash(key))
+        return self._nodes[i % len(self._nodes)]
@@ -0,0 +1,197 @@
+import asyncio
+import collections
+import json
+import os
+import time
+from typing import Any, AsyncIterator, Dict, Optional, Tuple
+
+from valAPI.clients.daemon_client import astream
+from valAPI.metrics import registry
+
+# seconds per tick: upstream events are merged into one batch per tick
+TICK = float(os.environ.get("VALAPI_EVENTS_TICK", "0.5"))
+MAX_INTERVAL = 60.0
+HEARTBEAT = 15.0
+
+event_clients = registry.gauge("valapi_event_clients", "Browsers connected to /events.")
+event_renders = registry.counter("valapi_event_renders_total",
+                                 "Event messages serialized; shared by every client on the same interval.")
+
+
+class Delta:
+    """
+    Net effect of a run of daemon events: the latest event per interface and
+    per peer, and the latest traffic row per peer. Merging two deltas gives
+    the same result as applying their events in order.
+    """
+    __slots__ = ("interfaces", "peers", "traffic", "resync")
+
+    def __init__(self):
+        self.interfaces: Dict[str, Dict[str, Any]] = {}
+        self.peers: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        self.traffic: Dict[Tuple[str, str], list] = {}
+        self.resync = False
+
+    def __bool__(self):
+        return bool(self.interfaces or self.peers or self.traffic or self.resync)
+
+    def add(self, event: Dict[str, Any]):
+        kind = event.get("type", "")
+        if kind == "traffic":
+            ifname = event["interface"]
+            for row in event["peers"]:
+                self.traffic[(ifname, row[0])] = row
+        elif kind.startswith("interface_"):
+            self.interfaces[event["interface"]] = event
+        elif kind.startswith("peer_"):
+            self._peer((event["interface"], event["public_key"]), event)
+
+    def _peer(self, key: Tuple[str, str], event: Dict[str, Any]):
+        prev = self.peers.get(key)
+        kind = event["type"]
+        if kind == "peer_removed":
+            self.traffic.pop(key, None)
+        if prev is not None and prev["type"] == "peer_added":
+            if kind == "peer_removed":
+                # added and gone again within the window: nothing to report
+                del self.peers[key]
+                return
+            event = dict(event, type="peer_added")
+        self.peers[key] = event
+
+    def merge(self, other: "Delta"):
+        self.resync |= other.resync
+        self.interfaces.update(other.interfaces)
+        for key, event in other.peers.items():
+            self._peer(key, event)
+        self.traffic.update(other.traffic)
+
+    def message(self, tick: int) -> bytes:
+        traffic: Dict[str, list] = {}
+        for (ifname, _), row in self.traffic.items():
+            traffic.setdefault(ifname, []).append(row)
+        body = {"tick": tick, "resync": self.resync, "interfaces": list(self.interfaces.values()),
+                "peers": list(self.peers.values()),
+                "traffic": [{"interface": k, "peers": rows} for k, rows in traffic.items()]}
+        return f"id: {tick}\nevent: delta\ndata: {json.dumps(body, separators=(',', ':'))}\n\n".encode()
+
+
+class LiveHub:
+    """
+    Fans one daemon `watch` stream out to every connected browser.
+
+    Upstream events are folded into one Delta per tick. A client asking for
+    at most one message every `interval` seconds is sent the merge of the
+    ticks since its last message, on tick numbers that are multiples of its
+    interval, so every client on the same interval gets the same bytes and
+    each message is built once however many clients are watching. A client
+    that cannot keep up skips ahead and gets a bigger merge, not a backlog.
+    The daemon stream is opened for the first client and closed after the last.
+    """
+    def __init__(self, tick: float = TICK):
+        self.tick = tick
+        self.tick_no = 0
+        self.clients = 0
+        self._batches: collections.deque = collections.deque(maxlen=int(2 * MAX_INTERVAL / tick) + 2)
+        self._pending = Delta()
+        self._rendered: Dict[Tuple[int, int], bytes] = {}
+        self._cond: Optional[asyncio.Condition] = None
+        self._tasks = []
+        self._seq = None
+
+    # ---- upstream ----
+    async def _upstream(self):
+        backoff = 0.5
+        while True:
+            async for frame in astream({"action": "watch", "since": self._seq, "heartbeat": HEARTBEAT},
+                                       timeout=HEARTBEAT * 3):
+                if frame.get("status") != "success":
+                    break
+                backoff = 0.5
+                if frame.get("lost"):
+                    self._pending.resync = True
+                self._seq = frame.get("seq", self._seq)
+                for event in frame.get("events", ()):
+                    self._pending.add(event)
+            # whatever happened while disconnected is unknown; have the clients reload
+            self._pending.resync = True
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, 10.0)
+
+    async def _ticker(self):
+        while True:
+            await asyncio.sleep(self.tick)
+            batch, self._pending = self._pending, Delta()
+            self.tick_no += 1
+            self._batches.append((self.tick_no, batch))
+            oldest = self._batches[0][0]
+            for key in [k for k in self._rendered if k[0] < oldest - 1]:
+                del self._rendered[key]
+            async with self._cond:
+                self._cond.notify_all()
+
+    def _start(self):
+        if self._tasks:
+            return
+        self._cond = asyncio.Condition()
+        self._tasks = [asyncio.ensure_future(self._upstream()), asyncio.ensure_future(self._ticker())]
+
+    def _stop(self):
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+        self._batches.clear()
+        self._rendered.clear()
+        self._pending = Delta()
+        self._seq = None
+
+    # ---- clients ----
+    def _render(self, start: int, end: int) -> bytes:
+        """One message for ticks (start, end], cached for every client on the same boundaries."""
+        key = (start, end)
+        data = self._rendered.get(key)
+        if data is None:
+            delta = Delta()
+            oldest = self._batches[0][0] if self._batches else end + 1
+            delta.resync = start + 1 < oldest
+            for tick_no, batch in self._batches:
+                if start < tick_no <= end:
+                    delta.merge(batch)
+            data = delta.message(end) if delta else b""
+            self._rendered[key] = data
+            event_renders.inc()
+        return data
+
+    async def subscribe(self, interval: float = 1.0) -> AsyncIterator[bytes]:
+        every = max(1, round(min(interval, MAX_INTERVAL) / self.tick))
+        self._start()
+        self.clients += 1
+        event_clients.inc()
+        try:
+            yield b"retry: 3000\n\n"
+            cursor = self.tick_no
+            last_sent = time.monotonic()
+            while True:
+                target = (cursor // every + 1) * every
+                try:
+                    async with self._cond:
+                        await asyncio.wait_for(self._cond.wait_for(lambda: self.tick_no >= target), HEARTBEAT)
+                except asyncio.TimeoutError:
+                    pass
+                end = self.tick_no // every * every
+                data = self._render(cursor, end) if end > cursor else b""
+                cursor = max(cursor, end)
+                if data:
+                    yield data
+                    last_sent = time.monotonic()
+                elif time.monotonic() - last_sent >= HEARTBEAT:
+                    yield b": ping\n\n"
+                    last_sent = time.monotonic()
+        finally:
+            self.clients -= 1
+            event_clients.dec()
+            if not self.clients:
+                self._stop()
+
+
+hub = LiveHub()
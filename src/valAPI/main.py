@@ -1,5 +1,12 @@
-from fastapi import FastAPI
-from valAPI.routes import interface, peers
+import time
+import uuid
+
+from fastapi import FastAPI, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import Response
+from valAPI.routes import events, fleet, interface, ipam, peers
+from valAPI.clients.daemon_client import ashared, get_fleet, close_pool, request_id
+from valAPI.metrics import CONTENT_TYPE, family, http_in_flight, http_seconds, registry
 
 app = FastAPI(title="ValAPI (REST) - WireGuard extension",
               description="REST endpoints that forward commands to valDaemon via a Unix socket.",
@@ -7,7 +14,54 @@ app = FastAPI(title="ValAPI (REST) - WireGuard extension",
 
 app.include_router(interface.router)
 app.include_router(peers.router)
+app.include_router(ipam.router)
+app.include_router(events.router)
+app.include_router(fleet.router)
+
+@app.middleware("http")
+async def observe(request: Request, call_next):
+    start = time.perf_counter()
+    # keep the caller's id (or mint one) so valDaemon traces can be matched to this request
+    rid = request.headers.get("x-request-id", "")[:128] or uuid.uuid4().hex
+    token = request_id.set(rid)
+    http_in_flight.inc()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        response.headers["X-Request-ID"] = rid
+        return response
+    finally:
+        request_id.reset(token)
+        http_in_flight.dec()
+        # label by route template, not raw path, so /peers/{key} stays one series
+        route = request.scope.get("route")
+        http_seconds.labels(request.method, getattr(route, "path", "unmatched"), status).observe(
+            time.perf_counter() - start)
+
+@app.on_event("shutdown")
+def shutdown():
+    close_pool()
 
 @app.get("/")
 def root():
     return {"message":"ValAPI running. Visit /docs for Swagger UI."}
+
+@app.get("/health")
+async def health():
+    return await run_in_threadpool(get_fleet().health)
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """
+    Prometheus exposition: valAPI's own series followed by valDaemon's
+    (request, backend and per-peer metrics, from one peer dump per scrape).
+    """
+    text = registry.render()
+    daemon = await ashared({"action":"metrics"}, timeout=30.0)
+    up = daemon.get("status") == "success"
+    text += "\n".join(family("valapi_daemon_up", "gauge", "Whether valDaemon answered the metrics scrape.",
+                             [({}, int(up))])) + "\n"
+    if up:
+        text += daemon.get("text", "")
+    return Response(text, media_type=CONTENT_TYPE)
@@ -0,0 +1,21 @@
+# The Prometheus exposition code is valDaemon's; valAPI only keeps its own
+# registry and metrics.
+from valDaemon.utils.metrics import CONTENT_TYPE, Registry, family
+
+__all__ = ["CONTENT_TYPE", "Registry", "family", "registry", "http_seconds", "http_in_flight",
+           "daemon_seconds", "daemon_errors", "daemon_coalesced"]
+
+registry = Registry()
+
+http_seconds = registry.histogram("valapi_http_request_duration_seconds",
+                                  "HTTP request latency, by method, route template and status code.",
+                                  ("method", "route", "status"))
+http_in_flight = registry.gauge("valapi_http_requests_in_flight", "HTTP requests being served.")
+daemon_seconds = registry.histogram("valapi_daemon_request_duration_seconds",
+                                    "Round trip to valDaemon, by action.", ("action",))
+daemon_errors = registry.counter("valapi_daemon_request_errors_total",
+                                 "valDaemon requests that failed, by action and reason "
+                                 "(timeout, connection or daemon).", ("action", "reason"))
+daemon_coalesced = registry.counter("valapi_daemon_coalesced_total",
+                                    "Reads answered by joining an identical daemon request already in flight, "
+                                    "by action.", ("action",))
@@ -0,0 +1,24 @@
+import os
+
+from fastapi import APIRouter, Query
+from fastapi.responses import StreamingResponse
+from valAPI.live import MAX_INTERVAL, TICK, hub
+
+router = APIRouter(prefix="/events", tags=["Events"])
+
+# the dashboard's origin, allowed to read the feed cross-origin; unset, no CORS header is sent
+ALLOW_ORIGIN = os.environ.get("VALAPI_EVENTS_ORIGIN", "")
+
+@router.get("")
+async def events(interval: float = Query(1.0, ge=TICK, le=MAX_INTERVAL)):
+    """
+    Server-Sent Events with live changes: interfaces and peers added, updated
+    or removed, and per-peer traffic rates and handshakes. At most one
+    `delta` message every `interval` seconds, each the net change since the
+    previous one. `resync: true` means changes were missed (daemon restart,
+    lost connection) and the client should reload its state.
+    """
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    if ALLOW_ORIGIN:
+        headers["Access-Control-Allow-Origin"] = ALLOW_ORIGIN
+    return StreamingResponse(hub.subscribe(interval), media_type="text/event-stream", headers=headers)
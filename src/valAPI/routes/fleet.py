@@ -0,0 +1,149 @@
+import asyncio
+import json
+from typing import List, Optional
+
+from fastapi import APIRouter, Depends
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+from valAPI.admission import admit
+from valAPI.clients.daemon_client import astream, get_fleet
+from valAPI.routes.peers import BATCH_CHUNK, BATCH_TIMEOUT, PeerOpModel, _chunk_rows, _op_dict
+
+router = APIRouter(prefix="/fleet", tags=["Fleet"])
+
+# NDJSON lines buffered between the node streams and the client
+MERGE_BUFFER = 64
+
+class FleetOpModel(PeerOpModel):
+    interface: str
+
+class FleetBatchModel(BaseModel):
+    ops: List[FleetOpModel]
+    force: bool = False
+
+def _interfaces(out: dict) -> list:
+    return [i["ifname"] for i in out.get("interfaces", ())] if out.get("status") == "success" else []
+
+@router.get("/nodes")
+async def nodes():
+    """Every daemon valAPI drives, whether it answers, and where it is."""
+    fleet = get_fleet()
+    pings = await fleet.gather({"action": "ping"})
+    return {"status": "success", "primary": fleet.primary,
+            "nodes": [{"node": name, "address": fleet.address(name), "up": out.get("status") == "success",
+                       **({} if out.get("status") == "success" else {"message": out.get("message")})}
+                      for name, out in pings.items()]}
+
+@router.get("/route")
+async def route(interface: str):
+    """The node an interface (and its peers) is routed to."""
+    fleet = get_fleet()
+    return {"status": "success", "interface": interface, "node": fleet.owner(interface),
+            "pinned": interface in fleet.pins}
+
+@router.get("/interfaces")
+async def interfaces(fresh: bool = False):
+    """
+    Interfaces of every node, listed in parallel. `routed` is false for an
+    interface living on another node than the one its name routes to;
+    requests for it go to the wrong daemon until it is pinned or moved.
+    """
+    fleet = get_fleet()
+    outs = await fleet.gather({"action": "list_interfaces", "fresh": fresh})
+    merged, errors = [], {}
+    for name, out in outs.items():
+        if out.get("status") != "success":
+            errors[name] = out.get("message")
+            continue
+        for iface in out.get("interfaces", ()):
+            merged.append(dict(iface, node=name, routed=fleet.owner(iface["ifname"]) == name))
+    status = "success" if not errors else ("error" if not merged and len(errors) == len(outs) else "partial")
+    return {"status": status, "interfaces": merged, "errors": errors}
+
+@router.get("/peers")
+async def peers(fields: Optional[str] = None, active_since: Optional[int] = None,
+                allowed_ip: Optional[str] = None, fresh: bool = False):
+    """
+    Every peer on every node as NDJSON, one object per line tagged with its
+    `node` and `interface`. Nodes are read in parallel and their lines
+    interleaved as they arrive; a node that fails adds an error line.
+    """
+    query = {"action": "list_peers", "fields": fields, "active_since": active_since,
+             "allowed_ip": allowed_ip, "fresh": fresh, "limit": 10000}
+    return StreamingResponse(_merge_peers(query), media_type="application/x-ndjson")
+
+async def _node_peers(name: str, query: dict, out: asyncio.Queue):
+    fleet = get_fleet()
+    listed = await fleet.pool(name).acall({"action": "list_interfaces"})
+    if listed.get("status") != "success":
+        await out.put(json.dumps({"node": name, "status": "error", "message": listed.get("message")}) + "\n")
+        return
+    for ifname in _interfaces(listed):
+        tag = {"node": name, "interface": ifname}
+        async for frame in astream(dict(query, interface=ifname), socket_path=fleet.address(name)):
+            if not frame.get("more"):
+                if frame.get("status") != "success":
+                    await out.put(json.dumps(dict(tag, status="error", message=frame.get("message"))) + "\n")
+                break
+            await out.put("".join(json.dumps(dict(peer, **tag)) + "\n" for peer in frame.get("peers", ())))
+
+async def _merge_peers(query: dict):
+    out: asyncio.Queue = asyncio.Queue(MERGE_BUFFER)
+    tasks = [asyncio.ensure_future(_node_peers(name, query, out)) for name in get_fleet().nodes]
+    done = asyncio.ensure_future(asyncio.gather(*tasks, return_exceptions=True))
+    try:
+        while not (done.done() and out.empty()):
+            getter = asyncio.ensure_future(out.get())
+            await asyncio.wait({getter, done}, return_when=asyncio.FIRST_COMPLETED)
+            if getter.done():
+                yield getter.result()
+            else:
+                getter.cancel()
+    finally:
+        for task in tasks:
+            task.cancel()
+
+@router.get("/peers/lookup")
+async def lookup(ip: str, fields: Optional[str] = None):
+    """The peers routing `ip` on any interface of any node, asked in parallel."""
+    fleet = get_fleet()
+    listed = await fleet.gather({"action": "list_interfaces"})
+    asks = [(name, ifname) for name, out in listed.items() for ifname in _interfaces(out)]
+    outs = await asyncio.gather(*(fleet.pool(name).acall({"action": "lookup_peer", "interface": ifname,
+                                                          "ip": ip, "fields": fields})
+                                  for name, ifname in asks))
+    matches = [dict(out, node=name, interface=ifname) for (name, ifname), out in zip(asks, outs)
+               if out.get("status") == "success"]
+    matches.sort(key=lambda m: -int(m["prefix"].rpartition("/")[2] or 0))
+    unreachable = [name for name, out in listed.items() if out.get("status") != "success"]
+    return {"status": "success" if matches else "error", "matches": matches, "unreachable": unreachable,
+            **({} if matches else {"message": f"no peer routes {ip}"})}
+
+@router.post("/peers/batch", dependencies=[Depends(admit)])
+async def batch(payload: FleetBatchModel):
+    """
+    Ops on any interfaces of any nodes. Each op goes to the node owning its
+    interface; interfaces are applied in parallel, the ops of one interface
+    in order. `results` holds one entry per op, in request order.
+    """
+    fleet = get_fleet()
+    by_iface = {}
+    for i, op in enumerate(payload.ops):
+        by_iface.setdefault(op.interface, []).append(i)
+    results: list = [None] * len(payload.ops)
+
+    async def apply(ifname: str, idx: List[int]):
+        pool = fleet.pool_for(ifname)
+        for start in range(0, len(idx), BATCH_CHUNK):
+            chunk = idx[start:start + BATCH_CHUNK]
+            ops = [{k: v for k, v in _op_dict(payload.ops[i]).items() if k != "interface"} for i in chunk]
+            out = await pool.acall({"action": "apply_peers", "interface": ifname, "ops": ops, "force": payload.force},
+                                   BATCH_TIMEOUT)
+            for i, row in zip(chunk, _chunk_rows(out, ops)):
+                results[i] = dict(row, interface=ifname, node=fleet.owner(ifname))
+
+    await asyncio.gather(*(apply(ifname, idx) for ifname, idx in by_iface.items()))
+    failed = sum(1 for r in results if r["status"] != "success")
+    applied = len(results) - failed
+    status = "success" if not failed else ("error" if not applied else "partial")
+    return {"status": status, "applied": applied, "failed": failed, "results": results}
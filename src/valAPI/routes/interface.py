@@ -1,20 +1,44 @@
-from fastapi import APIRouter
+from typing import List, Optional
+
+from fastapi import APIRouter, Depends
 from pydantic import BaseModel
-from valAPI.clients.daemon_client import send
+from valAPI.admission import admit
+from valAPI.clients.daemon_client import ashared, asend
 
 router = APIRouter(prefix="/interface", tags=["Interface"])
 
 class InterfaceModel(BaseModel):
     name: str = "wg0"
 
-@router.post("/create")
-def create(payload: InterfaceModel):
-    return send({"action":"create_interface", "interface": payload.name})
+class PeerStateModel(BaseModel):
+    public_key: str
+    allowed_ips: str
+    endpoint: Optional[str] = None
+    persistent_keepalive: Optional[int] = None
+
+class InterfaceStateModel(BaseModel):
+    peers: List[PeerStateModel]
+    dry_run: bool = False
+    force: bool = False
 
-@router.delete("/delete")
-def delete(payload: InterfaceModel):
-    return send({"action":"delete_interface", "interface": payload.name})
+@router.post("/create", dependencies=[Depends(admit)])
+async def create(payload: InterfaceModel):
+    return await asend({"action":"create_interface", "interface": payload.name})
+
+@router.delete("/delete", dependencies=[Depends(admit)])
+async def delete(payload: InterfaceModel):
+    return await asend({"action":"delete_interface", "interface": payload.name})
 
 @router.get("/list")
-def list_interfaces():
-    return send({"action":"list_interfaces"})
+async def list_interfaces(fresh: bool = False):
+    return await ashared({"action":"list_interfaces", "fresh": fresh})
+
+@router.put("/{name}/state", dependencies=[Depends(admit)])
+async def sync_state(name: str, payload: InterfaceStateModel):
+    """
+    Declare the full peer set of an interface. The daemon diffs it against the
+    kernel and applies only the peers that were added, removed or changed.
+    """
+    peers = [p.model_dump(exclude_none=True) for p in payload.peers]
+    return await asend({"action":"sync_interface", "interface": name, "peers": peers,
+                        "dry_run": payload.dry_run, "force": payload.force}, timeout=120.0)
@@ -0,0 +1,43 @@
+from typing import List, Optional
+
+from fastapi import APIRouter, Depends, Query
+from pydantic import BaseModel
+from valAPI.admission import admit
+from valAPI.clients.daemon_client import ashared, asend
+
+router = APIRouter(prefix="/ipam", tags=["IPAM"])
+
+class PoolModel(BaseModel):
+    interface: str = "wg0"
+    cidr: str
+    reserve_first: bool = True
+
+class ReleaseModel(BaseModel):
+    addresses: List[str]
+
+@router.post("/pools", dependencies=[Depends(admit)])
+async def create_pool(payload: PoolModel):
+    """
+    Attach an address pool to an interface (one per IP family). Peers added
+    without allowed_ips then get the next free address from it.
+    reserve_first keeps the first host address for the interface itself.
+    """
+    return await asend({"action":"ipam_create_pool", "interface": payload.interface,
+                        "cidr": payload.cidr, "reserve_first": payload.reserve_first})
+
+@router.get("/pools")
+async def list_pools(interface: Optional[str] = None):
+    return await ashared({"action":"ipam_status", "interface": interface})
+
+@router.delete("/pools/{interface}", dependencies=[Depends(admit)])
+async def delete_pool(interface: str, version: Optional[int] = Query(None, ge=4, le=6)):
+    return await asend({"action":"ipam_delete_pool", "interface": interface, "version": version})
+
+@router.post("/{interface}/allocate", dependencies=[Depends(admit)])
+async def allocate(interface: str, count: int = Query(1, ge=1, le=65536)):
+    """Reserve addresses ahead of time; pass them back as allowed_ips when adding the peers."""
+    return await asend({"action":"ipam_allocate", "interface": interface, "count": count})
+
+@router.post("/{interface}/release", dependencies=[Depends(admit)])
+async def release(interface: str, payload: ReleaseModel):
+    return await asend({"action":"ipam_release", "interface": interface, "addresses": payload.addresses})
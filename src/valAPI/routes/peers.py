@@ -1,39 +1,211 @@
-from fastapi import APIRouter
-from pydantic import BaseModel
-from valAPI.clients.daemon_client import send
+import json
+from typing import List, Literal, Optional
+
+from fastapi import APIRouter, Depends, Query, Request
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, ValidationError
+from valAPI.admission import admit
+from valAPI.clients.daemon_client import ashared, asend, astream
 
 router = APIRouter(prefix="/peers", tags=["Peers"])
 
+# ops per apply_peers round-trip; keeps each daemon frame far below its size cap
+BATCH_CHUNK = 2000
+BATCH_TIMEOUT = 120.0
+
 class PeerAddModel(BaseModel):
     interface: str = "wg0"
     public_key: str
-    allowed_ips: str
+    allowed_ips: Optional[str] = None
+    force: bool = False
 
 class PeerRemoveModel(BaseModel):
     interface: str = "wg0"
     public_key: str
 
-@router.post("/add")
-def add_peer(payload: PeerAddModel):
-    return send({
+class PeerOpModel(BaseModel):
+    op: Literal["add", "remove", "update"]
+    public_key: str
+    allowed_ips: Optional[str] = None
+    endpoint: Optional[str] = None
+    persistent_keepalive: Optional[int] = None
+
+class PeerBatchModel(BaseModel):
+    interface: str = "wg0"
+    ops: List[PeerOpModel]
+    force: bool = False
+
+def _op_dict(op: PeerOpModel) -> dict:
+    return op.model_dump(exclude_none=True)
+
+async def _apply_chunk(interface: str, ops: list, force: bool = False) -> dict:
+    return await asend({"action":"apply_peers", "interface": interface, "ops": ops, "force": force},
+                       timeout=BATCH_TIMEOUT)
+
+def _chunk_rows(out: dict, ops: list) -> list:
+    """Per-op results of one apply_peers chunk; a chunk that failed as a whole fails each of its ops."""
+    return out.get("results") or [{"public_key": op.get("public_key"), "op": op.get("op"),
+                                   "status": "error", "message": out.get("message")} for op in ops]
+
+@router.post("/add", dependencies=[Depends(admit)])
+async def add_peer(payload: PeerAddModel):
+    """
+    Leave allowed_ips out to get an address from the interface's IPAM pool.
+    Prefixes overlapping another peer's are rejected unless force=true.
+    """
+    return await asend({
         "action":"add_peer",
         "interface": payload.interface,
         "public_key": payload.public_key,
-        "allowed_ips": payload.allowed_ips
+        "allowed_ips": payload.allowed_ips,
+        "force": payload.force
     })
 
-@router.delete("/remove")
-def remove_peer(payload: PeerRemoveModel):
-    return send({
+@router.delete("/remove", dependencies=[Depends(admit)])
+async def remove_peer(payload: PeerRemoveModel):
+    return await asend({
         "action":"remove_peer",
         "interface": payload.interface,
         "public_key": payload.public_key
     })
 
 @router.get("/")
-def list_peers(interface: str = "wg0"):
-    return send({"action":"list_peers", "interface": interface})
+async def list_peers(interface: str = "wg0", fresh: bool = False,
+                     cursor: Optional[str] = None, limit: int = Query(1000, ge=1, le=10000),
+                     fields: Optional[str] = None, active_since: Optional[int] = None,
+                     allowed_ip: Optional[str] = None, format: Literal["objects", "compact"] = "objects",
+                     stream: bool = False):
+    """
+    One page of peers ordered by public key, served from the daemon's peer
+    cache (fresh=true forces a kernel dump). Follow `next_cursor` for more.
+    fields=public_key,rx_bytes projects; active_since and allowed_ip filter;
+    format=compact returns column names once plus one array per peer.
+
+    stream=1 returns every matching peer as NDJSON instead, one line per
+    peer (after a {"fields": [...]} line in compact format), relayed page by
+    page from the daemon so memory stays flat.
+    """
+    query = {"action":"list_peers", "interface": interface, "fresh": fresh,
+             "limit": limit, "fields": fields, "active_since": active_since,
+             "allowed_ip": allowed_ip, "compact": format == "compact"}
+    if stream:
+        return StreamingResponse(_stream_peers(query), media_type="application/x-ndjson")
+    return await ashared(dict(query, cursor=cursor))
+
+async def _stream_peers(query: dict):
+    header_sent = False
+    async for frame in astream(query):
+        if not frame.get("more"):
+            if frame.get("status") != "success":
+                yield json.dumps(frame) + "\n"
+            return
+        if "rows" in frame:
+            if not header_sent:
+                yield json.dumps({"fields": frame["fields"]}) + "\n"
+                header_sent = True
+            items = frame["rows"]
+        else:
+            items = frame["peers"]
+        yield "".join(json.dumps(item) + "\n" for item in items)
+
+@router.get("/lookup")
+async def lookup_peer(ip: str, interface: str = "wg0", fields: Optional[str] = None):
+    """The peer whose AllowedIPs route `ip` (longest prefix match), plus the matching prefix."""
+    return await ashared({"action":"lookup_peer", "interface": interface, "ip": ip, "fields": fields})
+
+@router.get("/top")
+async def top_peers(interface: str = "wg0", by: Literal["rx", "tx", "total"] = "total",
+                    window: float = Query(3600, gt=0), limit: int = Query(10, ge=1, le=1000)):
+    """The peers that moved the most bytes over the last `window` seconds, from the daemon's traffic history."""
+    return await ashared({"action":"top_peers", "interface": interface, "by": by, "window": window, "limit": limit})
+
+@router.get("/{public_key:path}/stats")
+async def peer_stats(public_key: str, interface: str = "wg0",
+                     start: Optional[float] = Query(None, alias="from"),
+                     end: Optional[float] = Query(None, alias="to")):
+    """
+    rx/tx bytes per second and latest handshake for one peer between `from`
+    and `to` (unix times; default the last hour), one point per bucket at the
+    finest resolution the daemon still holds for `from`. The key may be
+    given in URL-safe base64.
+    """
+    public_key = public_key.replace("-", "+").replace("_", "/")
+    return await ashared({"action":"peer_stats", "interface": interface, "public_key": public_key,
+                        "from": start, "to": end})
 
 @router.get("/gen-keys")
-def gen_keys():
-    return send({"action":"generate_keypair"})
+async def gen_keys(count: int = Query(1, ge=1, le=10000)):
+    """One keypair by default; count=N returns a `keypairs` list."""
+    return await asend({"action":"generate_keypair", "count": count}, timeout=30.0)
+
+@router.post("/batch", dependencies=[Depends(admit)])
+async def batch(payload: PeerBatchModel):
+    """
+    Apply many add/remove/update ops in one call. The daemon groups them into
+    as few WireGuard set messages as possible; `results` holds one entry per op,
+    in request order. A chunk the daemon fails as a whole (e.g. a timeout)
+    fails each of its ops; earlier chunks stay applied and reported.
+    """
+    ops = [_op_dict(op) for op in payload.ops]
+    results = []
+    for start in range(0, len(ops), BATCH_CHUNK):
+        chunk = ops[start:start + BATCH_CHUNK]
+        results.extend(_chunk_rows(await _apply_chunk(payload.interface, chunk, payload.force), chunk))
+    failed = sum(1 for r in results if r["status"] != "success")
+    applied = len(results) - failed
+    status = "success" if not failed else ("error" if not applied else "partial")
+    return {"status": status, "applied": applied, "failed": failed, "results": results}
+
+@router.post("/batch/stream", dependencies=[Depends(admit)])
+async def batch_stream(request: Request, interface: str = "wg0", force: bool = False):
+    """
+    Streaming variant of /peers/batch: the body is NDJSON, one op per line.
+    Ops are forwarded in chunks as they arrive and per-op results are streamed
+    back as NDJSON, ending with a summary line, so neither side ever holds the
+    whole batch.
+    """
+    return StreamingResponse(_stream_batch(request, interface, force), media_type="application/x-ndjson")
+
+async def _stream_batch(request: Request, interface: str, force: bool):
+    applied = failed = 0
+
+    async def flush(chunk):
+        nonlocal applied, failed
+        rows = _chunk_rows(await _apply_chunk(interface, chunk, force), chunk)
+        for row in rows:
+            if row["status"] == "success":
+                applied += 1
+            else:
+                failed += 1
+        return "".join(json.dumps(row) + "\n" for row in rows)
+
+    chunk = []
+    async for line in _lines(request):
+        try:
+            chunk.append(_op_dict(PeerOpModel(**json.loads(line))))
+        except (ValueError, TypeError, ValidationError) as e:
+            failed += 1
+            yield json.dumps({"status": "error", "message": f"invalid op: {e}"}) + "\n"
+            continue
+        if len(chunk) >= BATCH_CHUNK:
+            yield await flush(chunk)
+            chunk = []
+    if chunk:
+        yield await flush(chunk)
+    status = "success" if not failed else ("error" if not applied else "partial")
+    yield json.dumps({"summary": {"status": status, "applied": applied, "failed": failed}}) + "\n"
+
+async def _lines(request: Request):
+    buf = bytearray()
+    async for data in request.stream():
+        buf += data
+        while True:
+            nl = buf.find(b"\n")
+            if nl < 0:
+                break
+            line = bytes(buf[:nl]).strip()
+            del buf[:nl + 1]
+            if line:
+                yield line
+    if buf.strip():
+        yield bytes(buf).strip()
@@ -0,0 +1,303 @@
+import os
+import json
+import time
+import asyncio
+import ipaddress
+import socket
+import ssl
+from typing import Dict, Any
+
+from valDaemon.dispatch import registry as actions
+from valDaemon.socket_server import SocketDaemon
+from valDaemon.utils import metrics
+from valDaemon.utils.tracing import activate, span, tracer
+from valDaemon.protocol import (ProtocolError, decode_frame, encode_frame, read_frame_body_async,
+                                read_legacy_async)
+
+DEFAULT_MAX_INFLIGHT = int(os.environ.get("VALDAEMON_MAX_INFLIGHT", "256"))
+# "host:port" to also accept valAPI connections over TCP, e.g. from a central valAPI
+DEFAULT_LISTEN = os.environ.get("VALDAEMON_LISTEN", "")
+# server certificate and key for TLS on the TCP listener; with a CA, clients
+# must present a certificate signed by it (required off loopback)
+TLS_CERT = os.environ.get("VALDAEMON_TLS_CERT", "")
+TLS_KEY = os.environ.get("VALDAEMON_TLS_KEY", "")
+TLS_CA = os.environ.get("VALDAEMON_TLS_CA", "")
+
+
+def tls_context(cert: str = TLS_CERT, key: str = TLS_KEY, ca: str = TLS_CA):
+    if not cert:
+        return None
+    ctx = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+    ctx.minimum_version = ssl.TLSVersion.TLSv1_2
+    ctx.load_cert_chain(cert, key or None)
+    if ca:
+        ctx.load_verify_locations(ca)
+        ctx.verify_mode = ssl.CERT_REQUIRED
+    return ctx
+
+
+def parse_listen(listen: str, tls) -> tuple:
+    """
+    (host, port) from "host:port". Anything that can reach the listener may
+    add peers and delete interfaces, so beyond loopback it needs TLS with
+    client certificates checked against VALDAEMON_TLS_CA.
+    """
+    host, _, port = listen.rpartition(":")
+    host = host.strip("[]") or "0.0.0.0"
+    try:
+        port = int(port)
+    except ValueError:
+        raise ValueError(f"invalid listen address {listen!r}, expected host:port")
+    try:
+        loopback = ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        loopback = host == "localhost"
+    if not loopback and (tls is None or tls.verify_mode != ssl.CERT_REQUIRED):
+        raise ValueError(f"refusing to listen on {listen} without mutual TLS; set VALDAEMON_TLS_CERT, "
+                         "VALDAEMON_TLS_KEY and VALDAEMON_TLS_CA so clients must present a certificate")
+    return host, port
+
+
+def _next_traced(trace, frames, default):
+    # executor threads do not inherit the task's context; carry the trace over
+    with activate(trace):
+        return next(frames, default)
+
+
+class AsyncSocketDaemon(SocketDaemon):
+    """
+    Event-loop engine: one asyncio task per connection instead of one thread.
+    At most `max_inflight` requests are dispatched at once across all
+    connections; once the limit is hit a connection stops reading, so the
+    kernel socket buffer fills and clients see backpressure instead of the
+    daemon queueing without bound. Handlers still block on netlink/`wg`, so
+    they run on the shared bounded worker pool. Mutations are queued per
+    interface straight from the loop and drained by one worker per busy
+    interface, so a pile of writes to one interface neither parks worker
+    threads that reads could use nor reorders.
+
+    `listen` ("host:port") accepts the same protocol over TCP as well, with
+    TLS when a certificate is configured, so one valAPI can drive daemons
+    on many gateways.
+    """
+    def __init__(self, socket_path=None, workers=None, backlog=None, max_inflight=None, listen=None):
+        super().__init__(socket_path, workers=workers, backlog=backlog)
+        self.max_inflight = max_inflight or DEFAULT_MAX_INFLIGHT
+        self.listen = DEFAULT_LISTEN if listen is None else listen
+        self.tls = tls_context() if self.listen else None
+        self.tcp_addr = parse_listen(self.listen, self.tls) if self.listen else None
+        self.loop = None
+        self._server = None
+        self._tcp_server = None
+        self._slots = None
+        self._clients = {}
+
+    def start(self):
+        try:
+            asyncio.run(self.serve())
+        finally:
+            self.shutdown()
+
+    async def serve(self):
+        self._remove_stale_socket()
+        self.loop = asyncio.get_running_loop()
+        self._slots = asyncio.Semaphore(self.max_inflight)
+        self._server = await asyncio.start_unix_server(self.handle_client, path=self.socket_path,
+                                                       backlog=self.backlog)
+        try:
+            os.chmod(self.socket_path, 0o660)
+        except Exception:
+            pass
+        if self.tcp_addr:
+            host, port = self.tcp_addr
+            self._tcp_server = await asyncio.start_server(self._handle_tcp, host, port, backlog=self.backlog,
+                                                          ssl=self.tls)
+            mode = "plain TCP" if self.tls is None else (
+                "mutual TLS" if self.tls.verify_mode == ssl.CERT_REQUIRED else "TLS")
+            print(f"[valDaemon] Listening on {host}:{port} ({mode})")
+        self.running = True
+        print(f"[valDaemon] Listening on {self.socket_path} (pid {os.getpid()}, asyncio, "
+              f"backlog {self.backlog}, max in-flight {self.max_inflight})")
+        async with self._server:
+            try:
+                await self._server.serve_forever()
+            except asyncio.CancelledError:
+                pass
+            finally:
+                if self._tcp_server is not None:
+                    self._tcp_server.close()
+                await self._close_clients()
+
+    async def _handle_tcp(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        sock = writer.get_extra_info("socket")
+        if sock is not None:
+            try:
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            except OSError:
+                pass
+        await self.handle_client(reader, writer)
+
+    async def _close_clients(self):
+        # closing the transports turns pending reads into EOF so handlers unwind normally
+        for writer in self._clients.values():
+            writer.close()
+        if self._clients:
+            await asyncio.wait(list(self._clients), timeout=5)
+
+    async def handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self._clients[asyncio.current_task()] = writer
+        metrics.connections.inc()
+        metrics.connections_total.inc()
+        try:
+            first = await reader.read(1)
+            if not first:
+                writer.write(b'{"status":"error","message":"empty request"}')
+            elif first[0] == 0:
+                await self.serve_framed_async(reader, writer, first)
+            else:
+                await self.serve_legacy_async(reader, writer, first)
+            await writer.drain()
+        except Exception as e:
+            try:
+                writer.write(json.dumps({"status":"error","message":f"server error: {e}"}).encode("utf-8"))
+                await writer.drain()
+            except Exception:
+                pass
+        finally:
+            metrics.connections.dec()
+            self._clients.pop(asyncio.current_task(), None)
+            try:
+                writer.close()
+                await writer.wait_closed()
+            except Exception:
+                pass
+
+    async def serve_legacy_async(self, reader, writer, first: bytes):
+        raw = await read_legacy_async(reader, first)
+        if not raw.strip():
+            writer.write(b'{"status":"error","message":"empty request"}')
+            return
+        trace = tracer.begin()
+        try:
+            with span(trace, "parse", bytes=len(raw)):
+                payload = json.loads(raw.decode("utf-8"))
+        except Exception as e:
+            writer.write(json.dumps({"status":"error","message":f"invalid json: {e}"}).encode("utf-8"))
+            return
+        self._open(payload, trace)
+        async with self._slots:
+            out = await self._run(payload, trace)
+        with span(trace, "serialize"):
+            data = json.dumps(out).encode("utf-8")
+        writer.write(data)
+        tracer.finish(trace, out.get("status"))
+
+    async def serve_framed_async(self, reader, writer, first: bytes):
+        write_lock = asyncio.Lock()
+        tasks = set()
+        header = first
+        try:
+            while self.running:
+                # take a slot before reading so a saturated daemon stops draining the socket
+                await self._slots.acquire()
+                try:
+                    body = await read_frame_body_async(reader, header)
+                except ProtocolError as e:
+                    self._slots.release()
+                    await self._write_frame(writer, write_lock, {"id": None, "status":"error", "message": str(e)})
+                    break
+                header = b""
+                if body is None:
+                    self._slots.release()
+                    break
+                trace = tracer.begin()
+                try:
+                    with span(trace, "parse", bytes=len(body)):
+                        payload = decode_frame(body)
+                except ProtocolError as e:
+                    # the frame boundary is intact, so the connection can carry on
+                    self._slots.release()
+                    await self._write_frame(writer, write_lock, {"id": None, "status":"error", "message": str(e)})
+                    continue
+                task = asyncio.ensure_future(self._reply_async(writer, write_lock, payload, trace))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+        finally:
+            if tasks:
+                await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _reply_async(self, writer, write_lock: asyncio.Lock, payload: Dict[str, Any], trace=None):
+        req_id = self._open(payload, trace)
+        try:
+            frames = self.stream(payload)
+            if frames is not None:
+                with span(trace, "stream"):
+                    await self._stream_async(writer, write_lock, req_id, frames, trace)
+                tracer.finish(trace, "success")
+                return
+            out = dict(await self._run(payload, trace))
+            out["id"] = req_id
+        finally:
+            self._slots.release()
+        await self._write_frame(writer, write_lock, out, trace)
+        tracer.finish(trace, out.get("status"))
+
+    async def _run(self, payload: Dict[str, Any], trace=None) -> Dict[str, Any]:
+        entry, args = actions.resolve(payload)
+        key = actions.serial_key(entry, args) if entry is not None else None
+        if key is None:
+            return await self.loop.run_in_executor(self.executor, self.dispatch, payload, trace)
+        start = time.perf_counter()
+        metrics.in_flight.inc()
+        try:
+            with span(trace, "dispatch", queued=True):
+                fut = actions.serial.submit(key, (entry, args, trace), self._spawn_drain)
+                out = await asyncio.wrap_future(fut)
+        except Exception as e:
+            out = {"status":"error","message":f"server error: {e}"}
+        finally:
+            metrics.in_flight.dec()
+        return self._record(entry.name, start, out)
+
+    def _spawn_drain(self, key: str):
+        self.executor.submit(actions.serial.drain, key)
+
+    async def _stream_async(self, writer, write_lock: asyncio.Lock, req_id, frames, trace=None):
+        # pages are produced on the executor; drain() between frames lets a slow
+        # reader throttle production instead of piling pages up in memory
+        done = object()
+        while True:
+            try:
+                frame = await self.loop.run_in_executor(self.executor, _next_traced, trace, frames, done)
+            except Exception as e:
+                frame = {"status":"error","message":f"server error: {e}"}
+            if frame is done:
+                return
+            out = dict(frame)
+            out["id"] = req_id
+            await self._write_frame(writer, write_lock, out)
+            if not out.get("more") or writer.is_closing():
+                return
+
+    async def _write_frame(self, writer, write_lock: asyncio.Lock, out: Dict[str, Any], trace=None):
+        try:
+            with span(trace, "serialize"):
+                data = encode_frame(out)
+        except ProtocolError as e:
+            data = encode_frame({"id": out.get("id"), "status":"error", "message": str(e)})
+        try:
+            async with write_lock:
+                writer.write(data)
+                await writer.drain()
+        except (ConnectionError, OSError):
+            pass
+
+    def shutdown(self):
+        if self.loop is not None and self._server is not None and self.loop.is_running():
+            try:
+                if self._tcp_server is not None:
+                    self.loop.call_soon_threadsafe(self._tcp_server.close)
+                self.loop.call_soon_threadsafe(self._server.close)
+            except RuntimeError:
+                pass
+        super().shutdown()
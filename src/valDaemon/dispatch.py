@@ -0,0 +1,361 @@
+import collections
+import concurrent.futures
+import threading
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from valDaemon.utils.tracing import activate, current
+
+# Concurrency classes. Reads run in parallel; mutations on the same interface
+# go through one ordered queue per interface.
+READ = "read"
+MUTATE = "mutate"
+
+# Linux IFNAMSIZ minus the trailing NUL
+MAX_IFNAME = 15
+# queued mutations taken off an interface queue per round
+MAX_DRAIN = 1024
+
+
+class Invalid(Exception):
+    pass
+
+
+class Field:
+    """
+    One request argument. A missing or null value takes `default`, or fails
+    the request when the field is required. The field names and defaults
+    mirror the valAPI request models, so a body that passes pydantic there
+    passes here too.
+    """
+    kind = "any"
+    __slots__ = ("default", "required")
+
+    def __init__(self, default: Any = None, required: bool = False):
+        self.default = default
+        self.required = required
+
+    def check(self, name: str, value):
+        return value
+
+    def missing(self, name: str):
+        return Invalid(f"{name} required")
+
+    def describe(self) -> Dict[str, Any]:
+        out = {"type": self.kind, "required": self.required}
+        if not self.required:
+            out["default"] = self.default
+        return out
+
+
+class Str(Field):
+    kind = "string"
+    __slots__ = ("max_len",)
+
+    def __init__(self, default: str = None, required: bool = False, max_len: int = None):
+        super().__init__(default, required)
+        self.max_len = max_len
+
+    def check(self, name: str, value):
+        if not isinstance(value, str):
+            raise Invalid(f"{name} must be a string")
+        if self.required and not value:
+            raise Invalid(f"{name} required")
+        if self.max_len is not None and len(value) > self.max_len:
+            raise Invalid(f"{name} must be at most {self.max_len} characters")
+        return value
+
+
+class Bool(Field):
+    kind = "boolean"
+    __slots__ = ()
+
+    def __init__(self, default: bool = False):
+        super().__init__(default)
+
+    def check(self, name: str, value):
+        # bool("false") is True: only JSON true/false are accepted
+        if not isinstance(value, bool):
+            raise Invalid(f"{name} must be a boolean")
+        return value
+
+
+class Number(Field):
+    """
+    A JSON number, with the same bounds (ge, gt, le) as the Query/model
+    constraints of the valAPI route it mirrors.
+    """
+    kind = "number"
+    __slots__ = ("ge", "gt", "le")
+
+    def __init__(self, default: float = None, required: bool = False,
+                 ge: float = None, gt: float = None, le: float = None):
+        super().__init__(default, required)
+        self.ge, self.gt, self.le = ge, gt, le
+
+    def _convert(self, name: str, value):
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            raise Invalid(f"{name} must be a number")
+        return value
+
+    def check(self, name: str, value):
+        value = self._convert(name, value)
+        if self.ge is not None and value < self.ge:
+            raise Invalid(f"{name} must be at least {self.ge}")
+        if self.gt is not None and value <= self.gt:
+            raise Invalid(f"{name} must be greater than {self.gt}")
+        if self.le is not None and value > self.le:
+            raise Invalid(f"{name} must be at most {self.le}")
+        return value
+
+    def describe(self) -> Dict[str, Any]:
+        out = super().describe()
+        out.update((k, getattr(self, k)) for k in ("ge", "gt", "le") if getattr(self, k) is not None)
+        return out
+
+
+class Int(Number):
+    kind = "integer"
+    __slots__ = ()
+
+    def _convert(self, name: str, value):
+        # 5.0 is accepted as 5, as pydantic does; 5.5 is not
+        if isinstance(value, float) and value.is_integer():
+            value = int(value)
+        if isinstance(value, bool) or not isinstance(value, int):
+            raise Invalid(f"{name} must be an integer")
+        return value
+
+
+class Array(Field):
+    kind = "array"
+    __slots__ = ()
+
+    def check(self, name: str, value):
+        if not isinstance(value, list):
+            raise Invalid(f"{name} list required")
+        return value
+
+    def missing(self, name: str):
+        return Invalid(f"{name} list required")
+
+
+IFACE = Str("wg0", max_len=MAX_IFNAME)
+
+
+class Schema:
+    """
+    Argument list of one action, compiled once at registration into a flat
+    tuple of (name, default, required, checkers) so validating a request is a single
+    pass over its declared fields. Values come back in declaration order,
+    which is the handler's positional order; undeclared keys are ignored.
+    """
+    __slots__ = ("fields", "_plan")
+
+    def __init__(self, **fields: Field):
+        self.fields = fields
+        self._plan = tuple((name, f.default, f.required, f.check, f.missing) for name, f in fields.items())
+
+    def parse(self, payload: Dict[str, Any]) -> List[Any]:
+        args = []
+        get = payload.get
+        for name, default, required, check, missing in self._plan:
+            value = get(name)
+            if value is None:
+                if required:
+                    raise missing(name)
+                args.append(default)
+            else:
+                args.append(check(name, value))
+        return args
+
+    def describe(self) -> Dict[str, Any]:
+        return {name: f.describe() for name, f in self.fields.items()}
+
+
+class Action:
+    __slots__ = ("name", "handler", "schema", "kind", "serial_on", "coalesce")
+
+    def __init__(self, name: str, handler: Callable, schema: Schema, kind: str, coalesce: str = None):
+        self.name = name
+        self.handler = handler
+        self.schema = schema
+        self.kind = kind
+        # mutations serialize on their interface argument when they have one
+        names = list(schema.fields)
+        self.serial_on = names.index("interface") if kind == MUTATE and "interface" in names else None
+        self.coalesce = coalesce
+
+
+class SerialQueues:
+    """
+    One FIFO of pending mutations per interface, drained by a single thread
+    at a time, so writes to an interface apply in arrival order while
+    different interfaces proceed in parallel. Whatever queued up behind a
+    running mutation is handed to `run_batch` together, which is where
+    neighbouring requests get coalesced.
+
+    submit() takes a `spawn(key)` callback that is invoked when the queue
+    was idle; an event loop passes one that schedules `drain` on its
+    executor. run() is the blocking form for worker threads: the caller
+    drains one round itself, so nobody waits on a drain that has no thread,
+    and leaves whatever queued up meanwhile to a thread of its own rather
+    than to the pool, where every worker may be one of the waiters.
+    """
+    def __init__(self, run_batch: Callable[[str, List[Any]], List[Any]]):
+        self._run_batch = run_batch
+        self._queues: Dict[str, collections.deque] = {}
+        self._lock = threading.Lock()
+
+    def submit(self, key: str, item, spawn: Callable[[str], Any]) -> concurrent.futures.Future:
+        fut = concurrent.futures.Future()
+        with self._lock:
+            queue = self._queues.get(key)
+            idle = queue is None
+            if idle:
+                queue = self._queues[key] = collections.deque()
+            queue.append((item, fut))
+        if idle:
+            spawn(key)
+        return fut
+
+    def run(self, key: str, item):
+        return self.submit(key, item, lambda k: self.drain(k, rounds=1)).result()
+
+    def drain(self, key: str, rounds: int = None):
+        while True:
+            with self._lock:
+                queue = self._queues[key]
+                if not queue:
+                    del self._queues[key]
+                    return
+                if rounds == 0:
+                    threading.Thread(target=self.drain, args=(key,), name="valdaemon-serial", daemon=True).start()
+                    return
+                batch = [queue.popleft() for _ in range(min(len(queue), MAX_DRAIN))]
+            if rounds is not None:
+                rounds -= 1
+            try:
+                results = self._run_batch(key, [item for item, _ in batch])
+            except Exception as e:
+                for _, fut in batch:
+                    fut.set_exception(e)
+                continue
+            for (_, fut), res in zip(batch, results):
+                fut.set_result(res)
+
+    def pending(self) -> Dict[str, int]:
+        with self._lock:
+            return {key: len(queue) for key, queue in self._queues.items()}
+
+
+class Registry:
+    """
+    action name -> handler, request schema and concurrency class. Handlers
+    register themselves with the `action` decorator; dispatching is a dict
+    lookup plus Schema.parse, whatever the number of actions.
+
+    Mutations sharing a `coalesce` group name that end up next to each other
+    in an interface queue are run by that group's combiner in one call
+    instead of one handler call each.
+    """
+    def __init__(self):
+        self.actions: Dict[str, Action] = {}
+        self.streams: Dict[str, Action] = {}
+        self.combiners: Dict[str, Callable] = {}
+        self.serial = SerialQueues(self.run_serial)
+
+    def action(self, name: str, kind: str = READ, coalesce: str = None, **fields: Field):
+        def register(fn):
+            if name in self.actions:
+                raise ValueError(f"action already registered: {name}")
+            self.actions[name] = Action(name, fn, Schema(**fields), kind, coalesce)
+            return fn
+        return register
+
+    def combiner(self, group: str):
+        """
+        Register fn(key, [(action, args, trace), ...]) -> [response, ...] for
+        a coalesce group. It gets two or more queued requests, in order, and
+        returns one response per request; it activates each request's trace
+        (None when untraced) around the work done for it.
+        """
+        def register(fn):
+            self.combiners[group] = fn
+            return fn
+        return register
+
+    def stream(self, name: str, **fields: Field):
+        """Register the streamed form of a read action ("stream": true on framed connections)."""
+        def register(fn):
+            self.streams[name] = Action(name, fn, Schema(**fields), READ)
+            return fn
+        return register
+
+    def __contains__(self, name) -> bool:
+        return isinstance(name, str) and name in self.actions
+
+    def resolve(self, payload: Dict[str, Any]) -> Tuple[Optional[Action], Any]:
+        """(action, args) for a valid request, (None, error response) otherwise."""
+        name = payload.get("action")
+        entry = self.actions.get(name) if isinstance(name, str) else None
+        if entry is None:
+            return None, {"status":"error", "message": f"unknown action: {name}"}
+        try:
+            return entry, entry.schema.parse(payload)
+        except Invalid as e:
+            return None, {"status":"error", "message": str(e)}
+
+    def serial_key(self, entry: Action, args: List[Any]) -> Optional[str]:
+        return args[entry.serial_on] if entry.serial_on is not None else None
+
+    def call(self, entry: Action, args: List[Any]) -> Dict[str, Any]:
+        key = self.serial_key(entry, args)
+        if key is None:
+            return entry.handler(*args)
+        # whichever thread drains the queue runs this, so the trace travels with the item
+        return self.serial.run(key, (entry, args, current()))
+
+    def run_serial(self, key: str, items: List[Tuple[Action, List[Any], Any]]) -> List[Dict[str, Any]]:
+        """
+        Run one interface's queued (action, args, trace) mutations in order,
+        coalescing neighbours of the same group. Each runs under its own
+        trace, not that of the thread draining the queue.
+        """
+        results = []
+        i = 0
+        while i < len(items):
+            group = items[i][0].coalesce
+            j = i + 1
+            if group is not None:
+                while j < len(items) and items[j][0].coalesce == group:
+                    j += 1
+            try:
+                if j - i > 1:
+                    results.extend(self.combiners[group](key, items[i:j]))
+                else:
+                    entry, args, trace = items[i]
+                    with activate(trace):
+                        results.append(entry.handler(*args))
+            except Exception as e:
+                results.extend({"status":"error","message":f"server error: {e}"} for _ in range(j - i))
+            i = j
+        return results
+
+    def open_stream(self, payload: Dict[str, Any]) -> Optional[Iterator[Dict[str, Any]]]:
+        entry = self.streams.get(payload.get("action"))
+        if entry is None:
+            return None
+        try:
+            args = entry.schema.parse(payload)
+        except Invalid as e:
+            return iter([{"status":"error", "message": str(e)}])
+        return entry.handler(*args)
+
+    def describe(self) -> Dict[str, Any]:
+        return {name: {"kind": a.kind, "stream": name in self.streams, "coalesce": a.coalesce,
+                       "fields": a.schema.describe()}
+                for name, a in sorted(self.actions.items())}
+
+
+registry = Registry()
+action = registry.action
@@ -0,0 +1,67 @@
+from valDaemon.dispatch import Bool, Int, Number, Str, action, registry
+from valDaemon.utils import metrics
+from valDaemon.utils.events import feed
+from valDaemon.utils.journal import journal
+from valDaemon.utils.profiler import DEFAULT_SECONDS, MAX_SECONDS, profiler
+from valDaemon.utils.sweeper import sweeper
+from valDaemon.utils.tracing import tracer
+
+@action("ping")
+def handle_ping():
+    return {"status":"success","message":"pong"}
+
+@action("metrics")
+def handle_metrics():
+    return {"status":"success","text": metrics.registry.render()}
+
+@action("watch", since=Int(0, ge=0))
+def handle_watch(since=0):
+    """Changes after sequence number `since`, without waiting; the streamed form pushes them as they happen."""
+    seq, events, lost = feed.read(since)
+    return {"status":"success","seq": seq, "lost": lost, "events": events}
+
+@registry.stream("watch", since=Int(ge=0), heartbeat=Number(15.0, gt=0))
+def handle_watch_stream(since=None, heartbeat=15.0):
+    return feed.watch(since, min(max(heartbeat, 1.0), 60.0))
+
+@action("trace", output=Str(), slow_ms=Number(ge=0), enabled=Bool(None))
+def handle_trace(output: str = None, slow_ms: float = None, enabled: bool = None):
+    try:
+        return tracer.configure(output, slow_ms, enabled)
+    except OSError as e:
+        return {"status":"error","message":f"cannot open trace output: {e}"}
+
+@action("profile", seconds=Number(DEFAULT_SECONDS, gt=0, le=MAX_SECONDS))
+def handle_profile(seconds: float = DEFAULT_SECONDS):
+    return profiler.start(seconds)
+
+@action("idle_peers", interface=Str(max_len=15))
+def handle_idle(iface: str = None):
+    """Peers the sweeper found without a handshake for longer than its TTL."""
+    if not sweeper.ttl:
+        return {"status":"error","message":"idle sweeper is off (ttl 0)"}
+    return {"status":"success","ttl": sweeper.ttl, "mode": sweeper.mode, "interfaces": sweeper.idle(iface)}
+
+@action("sweeper", ttl=Number(ge=0), mode=Str(), interval=Number(gt=0), batch=Int(ge=1), run=Bool())
+def handle_sweeper(ttl: float = None, mode: str = None, interval: float = None, batch: int = None,
+                   run: bool = False):
+    """Show or change the idle sweeper settings; "run": true sweeps now."""
+    res = sweeper.configure(ttl, mode, interval, batch)
+    if run and res["status"] == "success":
+        res = dict(res, sweep=sweeper.sweep())
+    return res
+
+@action("state_snapshot")
+def handle_snapshot():
+    """Flush the state journal and compact it into a fresh snapshot now."""
+    if not journal.enabled:
+        return {"status":"error","message":"state journal not loaded"}
+    journal.flush()
+    journal.compact()
+    return {"status":"success","path": journal.snap_path,
+            "interfaces": len(journal.state), "peers": sum(map(len, journal.state.values()))}
+
+@action("describe")
+def handle_describe():
+    """Every registered action with its concurrency class and request fields."""
+    return {"status":"success","actions": registry.describe()}
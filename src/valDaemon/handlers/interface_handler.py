@@ -1,10 +1,18 @@
-from valDaemon.utils.wg_service import create_interface, delete_interface, list_interfaces
+from valDaemon.dispatch import IFACE, MUTATE, Array, Bool, action
+from valDaemon.utils.wg_service import create_interface, delete_interface, list_interfaces, sync_peers
 
+@action("create_interface", MUTATE, interface=IFACE)
 def handle_create(interface_name: str = "wg0"):
     return create_interface(interface_name)
 
+@action("delete_interface", MUTATE, interface=IFACE)
 def handle_delete(interface_name: str = "wg0"):
     return delete_interface(interface_name)
 
-def handle_list():
-    return list_interfaces()
+@action("list_interfaces", fresh=Bool())
+def handle_list(fresh: bool = False):
+    return list_interfaces(fresh)
+
+@action("sync_interface", MUTATE, interface=IFACE, peers=Array(required=True), dry_run=Bool(), force=Bool())
+def handle_sync(interface_name: str, peers: list, dry_run: bool = False, force: bool = False):
+    return sync_peers(interface_name, peers, dry_run, force)
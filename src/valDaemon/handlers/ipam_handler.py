@@ -0,0 +1,23 @@
+from valDaemon.dispatch import IFACE, MAX_IFNAME, MUTATE, Array, Bool, Int, Str, action
+from valDaemon.utils.wg_service import (MAX_ALLOCATE, create_pool, delete_pool, pool_status, allocate_addresses,
+                                       release_addresses)
+
+@action("ipam_create_pool", MUTATE, interface=IFACE, cidr=Str(required=True), reserve_first=Bool(True))
+def handle_create_pool(iface: str, cidr: str, reserve_first: bool = True):
+    return create_pool(iface, cidr, reserve_first)
+
+@action("ipam_delete_pool", MUTATE, interface=IFACE, version=Int(ge=4, le=6))
+def handle_delete_pool(iface: str, version: int = None):
+    return delete_pool(iface, version)
+
+@action("ipam_status", interface=Str(max_len=MAX_IFNAME))
+def handle_status(iface: str = None):
+    return pool_status(iface)
+
+@action("ipam_allocate", MUTATE, interface=IFACE, count=Int(1, ge=1, le=MAX_ALLOCATE))
+def handle_allocate(iface: str, count: int = 1):
+    return allocate_addresses(iface, count)
+
+@action("ipam_release", MUTATE, interface=IFACE, addresses=Array(required=True))
+def handle_release(iface: str, addresses: list):
+    return release_addresses(iface, addresses)
@@ -1,4 +1,6 @@
-from valDaemon.utils.wg_service import generate_keypair
+from valDaemon.dispatch import Int, action
+from valDaemon.utils.wg_service import MAX_KEYPAIRS, generate_keypair
 
-def handle_gen_keys():
-    return generate_keypair()
+@action("generate_keypair", count=Int(1, ge=1, le=MAX_KEYPAIRS))
+def handle_gen_keys(count: int = 1):
+    return generate_keypair(count)
@@ -1,10 +1,50 @@
-from valDaemon.utils.wg_service import add_peer, remove_peer, list_peers
+from valDaemon.dispatch import IFACE, MUTATE, Array, Bool, Field, Int, Number, Str, action, registry
+from valDaemon.utils.wg_service import (MAX_PAGE, add_peer, remove_peer, list_peers, apply_peers, apply_queued,
+                                       iter_peers, lookup_peer)
+from valDaemon.utils.peer_stats import stats
 
-def handle_list(iface: str = "wg0"):
-    return list_peers(iface)
+_QUERY = dict(fields=Field(), active_since=Int(), allowed_ip=Field(), compact=Bool())
+_LIMIT = Int(ge=1, le=MAX_PAGE)
 
-def handle_add(iface: str, public_key: str, allowed_ips: str):
-    return add_peer(iface, public_key, allowed_ips)
+@action("list_peers", interface=IFACE, fresh=Bool(), cursor=Field(), limit=_LIMIT, **_QUERY)
+def handle_list(iface: str = "wg0", fresh: bool = False, cursor=None, limit=None, fields=None,
+                active_since=None, allowed_ip=None, compact=False):
+    return list_peers(iface, fresh, cursor=cursor, limit=limit, fields=fields, active_since=active_since,
+                      allowed_ip=allowed_ip, compact=compact)
 
+@registry.stream("list_peers", interface=IFACE, fresh=Bool(), limit=_LIMIT, **_QUERY)
+def handle_stream(iface: str = "wg0", fresh: bool = False, limit=None, fields=None,
+                  active_since=None, allowed_ip=None, compact=False):
+    return iter_peers(iface, fresh, limit=limit, fields=fields, active_since=active_since,
+                      allowed_ip=allowed_ip, compact=compact)
+
+@action("add_peer", MUTATE, coalesce="peer_ops", interface=IFACE, public_key=Str(required=True), allowed_ips=Str(), force=Bool())
+def handle_add(iface: str, public_key: str, allowed_ips: str = None, force: bool = False):
+    return add_peer(iface, public_key, allowed_ips, force)
+
+@action("remove_peer", MUTATE, coalesce="peer_ops", interface=IFACE, public_key=Str(required=True))
 def handle_remove(iface: str, public_key: str):
     return remove_peer(iface, public_key)
+
+@registry.combiner("peer_ops")
+def handle_queued(iface: str, calls: list):
+    # add_peer args: (iface, public_key, allowed_ips, force); remove_peer: (iface, public_key)
+    return apply_queued(iface, [("add", args[1], args[2], args[3], trace) if entry.name == "add_peer"
+                                else ("remove", args[1], None, False, trace) for entry, args, trace in calls])
+
+@action("apply_peers", MUTATE, interface=IFACE, ops=Array(required=True), force=Bool())
+def handle_apply(iface: str, ops: list, force: bool = False):
+    return apply_peers(iface, ops, force)
+
+@action("lookup_peer", interface=IFACE, ip=Str(required=True), fields=Field())
+def handle_lookup(iface: str, ip: str, fields=None):
+    return lookup_peer(iface, ip, fields)
+
+@action("peer_stats", interface=IFACE, public_key=Str(required=True), **{"from": Number(), "to": Number()})
+def handle_stats(iface: str, public_key: str, start=None, end=None):
+    """rx/tx rate and handshake history for one peer, at the finest resolution still covering `from`."""
+    return stats.peer(iface, public_key, start, end)
+
+@action("top_peers", interface=IFACE, by=Str("total"), window=Number(3600, gt=0), limit=Int(10, ge=1, le=1000))
+def handle_top(iface: str, by: str = "total", window: float = 3600, limit: int = 10):
+    return stats.top(iface, by, window, limit)
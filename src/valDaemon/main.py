@@ -1,4 +1,43 @@
+import argparse
+
 from valDaemon.socket_server import run
 
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog="valDaemon")
+    parser.add_argument("--socket", dest="socket_path", default=None,
+                        help="Unix socket path (default /run/valdaemon.sock as root, else /tmp/valdaemon.sock)")
+    parser.add_argument("--listen", default=None, metavar="HOST:PORT",
+                        help="also accept connections over TCP; off loopback this needs mutual TLS "
+                             "($VALDAEMON_TLS_CERT/_KEY/_CA) (default: $VALDAEMON_LISTEN, off; asyncio engine only)")
+    parser.add_argument("--engine", choices=["asyncio", "thread"], default=None,
+                        help="server engine (default: $VALDAEMON_ENGINE or asyncio)")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="worker threads for blocking netlink/wg calls")
+    parser.add_argument("--backlog", type=int, default=None, help="listen() backlog")
+    parser.add_argument("--max-inflight", type=int, default=None,
+                        help="max concurrently dispatched requests (asyncio engine)")
+    parser.add_argument("--backend", choices=["auto", "netlink", "subprocess", "fake"], default=None,
+                        help="WireGuard backend (default: $VALDAEMON_BACKEND or auto)")
+    parser.add_argument("--keypool", dest="keypool_size", type=int, default=None,
+                        help="pre-generated keypairs to keep ready (default: $VALDAEMON_KEYPOOL_SIZE or 0, off)")
+    parser.add_argument("--metrics", dest="metrics_listen", default=None, metavar="HOST:PORT",
+                        help="serve Prometheus metrics over HTTP (default: $VALDAEMON_METRICS, off)")
+    parser.add_argument("--no-restore", dest="restore", action="store_false", default=None,
+                        help="do not put journaled interfaces and peers back at startup "
+                             "(default: $VALDAEMON_RESTORE, on)")
+    parser.add_argument("--trace", default=None, metavar="PATH",
+                        help="write per-request span timings as JSON lines to PATH, or - for stderr "
+                             "(default: $VALDAEMON_TRACE, off)")
+    parser.add_argument("--idle-ttl", type=float, default=None, metavar="SECONDS",
+                        help="report peers without a handshake for this long (default: $VALDAEMON_IDLE_TTL, off)")
+    parser.add_argument("--idle-mode", choices=["flag", "evict"], default=None,
+                        help="evict idle peers instead of only reporting them (default: $VALDAEMON_IDLE_MODE or flag)")
+    return parser.parse_args(argv)
+
 if __name__ == "__main__":
-    run()
+    args = parse_args()
+    run(args.socket_path, engine=args.engine, workers=args.workers,
+        backlog=args.backlog, max_inflight=args.max_inflight, backend=args.backend,
+        keypool_size=args.keypool_size, metrics_listen=args.metrics_listen,
+        trace=args.trace, restore=args.restore,
+        idle_ttl=args.idle_ttl, idle_mode=args.idle_mode, listen=args.listen)
@@ -0,0 +1,141 @@
+import asyncio
+import json
+import socket
+import struct
+from typing import Dict, Any, Optional
+
+# Framed mode: every message is a 4-byte big-endian length followed by a UTF-8
+# JSON object carrying an "id". Frames are capped well below 2**24 so the first
+# byte of a framed connection is always 0x00, while legacy clients open with "{".
+HEADER = struct.Struct("!I")
+MAX_FRAME = 16 * 1024 * 1024 - 1
+
+
+class ProtocolError(Exception):
+    pass
+
+
+def is_framed(first: bytes) -> bool:
+    return bool(first) and first[0] == 0
+
+
+def encode_frame(obj: Dict[str, Any]) -> bytes:
+    body = json.dumps(obj).encode("utf-8")
+    if len(body) > MAX_FRAME:
+        raise ProtocolError(f"frame too large: {len(body)} bytes")
+    return HEADER.pack(len(body)) + body
+
+
+def read_exact(conn: socket.socket, n: int) -> Optional[bytes]:
+    """
+    Read exactly n bytes. Returns None on a clean EOF before any byte was read.
+    """
+    buf = bytearray(n)
+    view = memoryview(buf)
+    got = 0
+    while got < n:
+        r = conn.recv_into(view[got:], n - got)
+        if not r:
+            if got == 0:
+                return None
+            raise ProtocolError("connection closed mid-frame")
+        got += r
+    return bytes(buf)
+
+
+def decode_frame(body: bytes) -> Dict[str, Any]:
+    try:
+        payload = json.loads(body)
+    except Exception as e:
+        raise ProtocolError(f"invalid json: {e}")
+    if not isinstance(payload, dict):
+        raise ProtocolError("frame must be a JSON object")
+    return payload
+
+
+def read_frame_body(conn: socket.socket) -> Optional[bytes]:
+    """
+    Read one frame without decoding it, so the caller can time or offload
+    the JSON parse. Returns None on a clean EOF.
+    """
+    header = read_exact(conn, HEADER.size)
+    if header is None:
+        return None
+    (length,) = HEADER.unpack(header)
+    if length > MAX_FRAME:
+        raise ProtocolError(f"frame too large: {length} bytes")
+    body = read_exact(conn, length) if length else b""
+    if body is None:
+        raise ProtocolError("connection closed mid-frame")
+    return body
+
+
+def read_frame(conn: socket.socket) -> Optional[Dict[str, Any]]:
+    body = read_frame_body(conn)
+    return None if body is None else decode_frame(body)
+
+
+def read_legacy(conn: socket.socket) -> bytes:
+    """
+    Read a one-shot JSON request. Old clients never half-close the socket, so
+    stop as soon as the buffer holds a complete JSON document instead of
+    waiting for EOF.
+    """
+    raw = bytearray()
+    while True:
+        chunk = conn.recv(65536)
+        if not chunk:
+            break
+        raw += chunk
+        if len(raw) > MAX_FRAME:
+            raise ProtocolError("request too large")
+        if raw.rstrip().endswith(b"}"):
+            try:
+                json.loads(raw)
+                break
+            except ValueError:
+                continue
+    return bytes(raw)
+
+
+async def read_frame_async(reader, header: bytes = b"") -> Optional[Dict[str, Any]]:
+    """
+    asyncio counterpart of read_frame. `header` holds any header bytes the
+    caller already consumed while sniffing the connection mode.
+    """
+    body = await read_frame_body_async(reader, header)
+    return None if body is None else decode_frame(body)
+
+
+async def read_frame_body_async(reader, header: bytes = b"") -> Optional[bytes]:
+    try:
+        header += await reader.readexactly(HEADER.size - len(header))
+    except asyncio.IncompleteReadError as e:
+        if not e.partial and not header:
+            return None
+        raise ProtocolError("connection closed mid-frame")
+    (length,) = HEADER.unpack(header)
+    if length > MAX_FRAME:
+        raise ProtocolError(f"frame too large: {length} bytes")
+    try:
+        return await reader.readexactly(length)
+    except asyncio.IncompleteReadError:
+        raise ProtocolError("connection closed mid-frame")
+
+
+async def read_legacy_async(reader, first: bytes = b"") -> bytes:
+    raw = bytearray(first)
+    while True:
+        if raw.rstrip().endswith(b"}"):
+            try:
+                json.loads(raw)
+                break
+            except ValueError:
+                pass
+        chunk = await reader.read(65536)
+        if not chunk:
+            break
+        raw += chunk
+        if len(raw) > MAX_FRAME:
+            raise ProtocolError("request too large")
+    return bytes(raw)
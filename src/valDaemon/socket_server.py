@@ -4,28 +4,52 @@ import socket
 import threading
 import signal
 import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Dict, Any, Iterator, Optional
 
-from valDaemon.handlers.interface_handler import handle_create, handle_delete, handle_list
-from valDaemon.handlers.peer_handler import handle_list as peers_list, handle_add, handle_remove
-from valDaemon.handlers.key_handler import handle_gen_keys
+# importing the handler modules registers their actions
+from valDaemon.handlers import admin_handler, interface_handler, ipam_handler, key_handler, peer_handler  # noqa: F401
+from valDaemon.dispatch import Bool, Invalid, Schema, registry as actions
+from valDaemon.utils.netlink import sessions
+from valDaemon.utils.ipam import ipam
+from valDaemon.utils.journal import journal
+from valDaemon.utils.keys import pool as keypool
+from valDaemon.utils import metrics
+from valDaemon.utils.peer_stats import stats, stats_metrics
+from valDaemon.utils.profiler import profiler
+from valDaemon.utils.sweeper import sweeper, sweeper_metrics
+from valDaemon.utils.tracing import activate, span, tracer
+from valDaemon.utils.wg_service import cache, capture_state, init_backend, restore_state, wireguard_metrics
+from valDaemon.protocol import ProtocolError, decode_frame, encode_frame, is_framed, read_frame_body, read_legacy
 
 DEFAULT_SOCKET = "/run/valdaemon.sock"
 FALLBACK_SOCKET = "/tmp/valdaemon.sock"
+DEFAULT_WORKERS = int(os.environ.get("VALDAEMON_WORKERS", "16"))
+DEFAULT_BACKLOG = int(os.environ.get("VALDAEMON_BACKLOG", "512"))
+DEFAULT_ENGINE = os.environ.get("VALDAEMON_ENGINE", "asyncio")
+DEFAULT_RESTORE = os.environ.get("VALDAEMON_RESTORE", "1") != "0"
+_STREAM_FLAG = Schema(stream=Bool())
 
 class SocketDaemon:
-    def __init__(self, socket_path=None):
+    def __init__(self, socket_path=None, workers=None, backlog=None):
         self.socket_path = socket_path or (DEFAULT_SOCKET if os.geteuid() == 0 else FALLBACK_SOCKET)
+        self.backlog = backlog or DEFAULT_BACKLOG
         self.server = None
         self.running = False
+        self.executor = ThreadPoolExecutor(max_workers=workers or DEFAULT_WORKERS,
+                                           thread_name_prefix="valdaemon-worker")
 
-    def start(self):
-        # remove stale socket
+    def _remove_stale_socket(self):
         try:
             if os.path.exists(self.socket_path):
                 os.remove(self.socket_path)
         except Exception:
             pass
 
+    def start(self):
+        self._remove_stale_socket()
+
         server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
         server.bind(self.socket_path)
         try:
@@ -33,10 +57,10 @@ class SocketDaemon:
         except Exception:
             pass
 
-        server.listen(5)
+        server.listen(self.backlog)
         self.server = server
         self.running = True
-        print(f"[valDaemon] Listening on {self.socket_path} (pid {os.getpid()})")
+        print(f"[valDaemon] Listening on {self.socket_path} (pid {os.getpid()}, threads, backlog {self.backlog})")
         try:
             while self.running:
                 try:
@@ -48,65 +72,181 @@ class SocketDaemon:
             self.shutdown()
 
     def handle_conn(self, conn: socket.socket):
+        metrics.connections.inc()
+        metrics.connections_total.inc()
         try:
-            raw = b""
-            while True:
-                chunk = conn.recv(65536)
-                if not chunk:
-                    break
-                raw += chunk
-            if not raw:
-                conn.send(b'{"status":"error","message":"empty request"}')
-                conn.close()
+            first = conn.recv(1, socket.MSG_PEEK)
+            if not first:
+                conn.sendall(b'{"status":"error","message":"empty request"}')
                 return
-            try:
-                payload = json.loads(raw.decode("utf-8"))
-            except Exception as e:
-                conn.send(json.dumps({"status":"error","message":f"invalid json: {e}"}).encode("utf-8"))
-                conn.close()
-                return
-
-            action = payload.get("action")
-            out = {"status":"error", "message":"unknown action"}
-            if action == "create_interface":
-                out = handle_create(payload.get("interface","wg0"))
-            elif action == "delete_interface":
-                out = handle_delete(payload.get("interface","wg0"))
-            elif action == "list_interfaces":
-                out = handle_list()
-            elif action == "list_peers":
-                out = peers_list(payload.get("interface","wg0"))
-            elif action == "add_peer":
-                if not payload.get("public_key") or not payload.get("allowed_ips"):
-                    out = {"status":"error","message":"public_key and allowed_ips required"}
-                else:
-                    out = handle_add(payload.get("interface","wg0"),
-                                     payload.get("public_key"),
-                                     payload.get("allowed_ips"))
-            elif action == "remove_peer":
-                if not payload.get("public_key"):
-                    out = {"status":"error","message":"public_key required"}
-                else:
-                    out = handle_remove(payload.get("interface","wg0"), payload.get("public_key"))
-            elif action == "generate_keypair":
-                out = handle_gen_keys()
+            if is_framed(first):
+                self.serve_framed(conn)
             else:
-                out = {"status":"error", "message": f"unknown action: {action}"}
-
-            conn.send(json.dumps(out).encode("utf-8"))
+                self.serve_legacy(conn)
         except Exception as e:
             try:
-                conn.send(json.dumps({"status":"error","message":f"server error: {e}"}).encode("utf-8"))
+                conn.sendall(json.dumps({"status":"error","message":f"server error: {e}"}).encode("utf-8"))
             except Exception:
                 pass
         finally:
+            metrics.connections.dec()
             try:
                 conn.close()
             except Exception:
                 pass
 
+    def serve_legacy(self, conn: socket.socket):
+        """One-shot mode: a single JSON request, a single JSON response, then close."""
+        raw = read_legacy(conn)
+        if not raw.strip():
+            conn.sendall(b'{"status":"error","message":"empty request"}')
+            return
+        trace = tracer.begin()
+        try:
+            with span(trace, "parse", bytes=len(raw)):
+                payload = json.loads(raw.decode("utf-8"))
+        except Exception as e:
+            conn.sendall(json.dumps({"status":"error","message":f"invalid json: {e}"}).encode("utf-8"))
+            return
+        self._open(payload, trace)
+        out = self.dispatch(payload, trace)
+        with span(trace, "serialize"):
+            data = json.dumps(out).encode("utf-8")
+        conn.sendall(data)
+        tracer.finish(trace, out.get("status"))
+
+    def serve_framed(self, conn: socket.socket):
+        """
+        Persistent mode: read length-prefixed frames until EOF and hand each one
+        to the worker pool. Responses carry the request id and are written as
+        soon as they are ready, so they may arrive out of order.
+        """
+        write_lock = threading.Lock()
+        inflight = set()
+        try:
+            while self.running:
+                try:
+                    body = read_frame_body(conn)
+                except ProtocolError as e:
+                    self._send_frame(conn, write_lock, {"id": None, "status":"error", "message": str(e)})
+                    break
+                if body is None:
+                    break
+                fut = self.executor.submit(self._reply, conn, write_lock, body)
+                inflight.add(fut)
+                fut.add_done_callback(inflight.discard)
+        finally:
+            # let requests already read finish before the caller closes the socket
+            wait(list(inflight))
+
+    def _reply(self, conn: socket.socket, write_lock: threading.Lock, body: bytes):
+        # decoded here rather than on the reader thread, so one large batch
+        # does not hold up the frames behind it
+        trace = tracer.begin()
+        try:
+            with span(trace, "parse", bytes=len(body)):
+                payload = decode_frame(body)
+        except ProtocolError as e:
+            # the frame boundary is intact, so the connection can carry on
+            self._send_frame(conn, write_lock, {"id": None, "status":"error", "message": str(e)})
+            return
+        req_id = self._open(payload, trace)
+        frames = self.stream(payload)
+        if frames is None:
+            out = dict(self.dispatch(payload, trace))
+            out["id"] = req_id
+            self._send_frame(conn, write_lock, out, trace)
+            tracer.finish(trace, out.get("status"))
+            return
+        try:
+            with activate(trace), span(trace, "stream"):
+                for frame in frames:
+                    out = dict(frame)
+                    out["id"] = req_id
+                    if not self._send_frame(conn, write_lock, out):
+                        break
+            tracer.finish(trace, "success")
+        except Exception as e:
+            self._send_frame(conn, write_lock, {"id": req_id, "status":"error","message":f"server error: {e}"})
+            tracer.finish(trace, "error")
+
+    def _open(self, payload: Dict[str, Any], trace=None):
+        """
+        Strip the transport fields off a request: returns the frame id and
+        files the caller's request id (valAPI's X-Request-ID) on the trace.
+        """
+        request_id = payload.pop("request_id", None)
+        if trace is not None:
+            trace.request_id = request_id
+            trace.action = payload.get("action")
+        return payload.pop("id", None)
+
+    def stream(self, payload: Dict[str, Any]) -> Optional[Iterator[Dict[str, Any]]]:
+        """
+        Framed clients may set "stream": true on list actions. The reply is
+        then a series of frames with "more": true followed by one final frame
+        without it. Returns None for requests that are not streamed.
+        """
+        try:
+            streamed, = _STREAM_FLAG.parse(payload)
+        except Invalid as e:
+            return iter([{"status":"error", "message": str(e)}])
+        if not streamed:
+            return None
+        return actions.open_stream(payload)
+
+    def _send_frame(self, conn: socket.socket, write_lock: threading.Lock, out: Dict[str, Any], trace=None):
+        try:
+            with span(trace, "serialize"):
+                data = encode_frame(out)
+        except ProtocolError as e:
+            data = encode_frame({"id": out.get("id"), "status":"error", "message": str(e)})
+        try:
+            with write_lock:
+                conn.sendall(data)
+            return True
+        except OSError:
+            # client went away; nothing left to deliver to
+            return False
+
+    def dispatch(self, payload: Dict[str, Any], trace=None) -> Dict[str, Any]:
+        action = payload.get("action")
+        start = time.perf_counter()
+        metrics.in_flight.inc()
+        try:
+            with activate(trace), span(trace, "dispatch"):
+                out = self._dispatch(action, payload)
+        finally:
+            metrics.in_flight.dec()
+        return self._record(action, start, out)
+
+    def _record(self, action, start: float, out: Dict[str, Any]) -> Dict[str, Any]:
+        # unregistered actions share one label to keep metric cardinality bounded
+        label = action if action in actions else "unknown"
+        metrics.requests_seconds.labels(label).observe(time.perf_counter() - start)
+        if out.get("status") == "error":
+            metrics.request_errors.labels(label).inc()
+        return out
+
+    def _dispatch(self, action, payload: Dict[str, Any]) -> Dict[str, Any]:
+        entry, args = actions.resolve(payload)
+        if entry is None:
+            return args
+        try:
+            return actions.call(entry, args)
+        except Exception as e:
+            return {"status":"error","message":f"server error: {e}"}
+
     def shutdown(self):
         self.running = False
+        self.executor.shutdown(wait=False)
+        sessions.close()
+        cache.stop()
+        keypool.stop()
+        ipam.stop()
+        journal.stop()
+        sweeper.stop()
+        stats.stop()
         try:
             if self.server:
                 self.server.close()
@@ -118,8 +258,84 @@ class SocketDaemon:
         except Exception:
             pass
 
-def run(socket_path=None):
-    daemon = SocketDaemon(socket_path)
+def _queue_metrics():
+    return metrics.family("valdaemon_mutation_queue_depth", "gauge",
+                          "Mutations waiting in an interface's queue behind the one being applied.",
+                          [({"interface": k}, n) for k, n in sorted(actions.serial.pending().items())])
+
+def _evict(ifname: str, keys):
+    # through the interface's queue, like any other remove
+    entry, args = actions.resolve({"action": "apply_peers", "interface": ifname,
+                                   "ops": [{"op": "remove", "public_key": k} for k in keys]})
+    return actions.call(entry, args) if entry is not None else args
+
+def _warm_start(restore: bool):
+    state = journal.load()
+    if state is None:
+        state = capture_state()
+        journal.adopt(state)
+        print(f"[valDaemon] State journal started with {sum(map(len, state.values()))} peers "
+              f"on {len(state)} interfaces")
+    elif restore:
+        res = restore_state(state)
+        print(f"[valDaemon] Restored {res['peers']} peers ({res['unchanged']} already present, "
+              f"{res['failed']} failed) on {res['interfaces']} interfaces in {res['seconds']}s")
+        for err in res["errors"]:
+            print(f"[valDaemon]   {err}")
+    journal.start_flusher()
+
+def run(socket_path=None, engine=None, workers=None, backlog=None, max_inflight=None, backend=None,
+        keypool_size=None, metrics_listen=None, trace=None, restore=None, idle_ttl=None, idle_mode=None,
+        listen=None):
+    """
+    Start the daemon. `engine` is "asyncio" (default) or "thread", the original
+    thread-per-connection model kept for comparison. The WireGuard backend is
+    picked here once instead of being probed per request. `metrics_listen`
+    ("host:port") additionally serves Prometheus metrics over HTTP, and
+    `trace` (a path, or "-" for stderr) writes per-request span timings.
+    Interfaces and peers recorded in the state journal are put back before
+    the socket opens unless `restore` is False; on first start the journal
+    is seeded from what the kernel already has. `idle_ttl` (seconds) turns
+    on the idle peer sweeper; `idle_mode` "evict" removes idle peers instead
+    of only reporting them. `listen` ("host:port", asyncio engine only) also
+    serves the protocol over TCP, with TLS when a certificate is configured;
+    off loopback client certificates are required.
+    """
+    engine = engine or DEFAULT_ENGINE
+    if listen and engine != "asyncio":
+        raise ValueError("--listen needs the asyncio engine")
+    # built first so a bad engine or listen address fails before anything starts
+    if engine == "thread":
+        daemon = SocketDaemon(socket_path, workers=workers, backlog=backlog)
+    elif engine == "asyncio":
+        from valDaemon.async_server import AsyncSocketDaemon
+        daemon = AsyncSocketDaemon(socket_path, workers=workers, backlog=backlog, max_inflight=max_inflight,
+                                   listen=listen)
+    else:
+        raise ValueError(f"unknown engine: {engine}")
+    if trace is not None:
+        tracer.configure(trace)
+    print(f"[valDaemon] WireGuard backend: {init_backend(backend).name}")
+    metrics.registry.add_collector(wireguard_metrics)
+    metrics.registry.add_collector(_queue_metrics)
+    metrics.registry.add_collector(sweeper_metrics)
+    metrics.registry.add_collector(stats_metrics)
+    metrics.start_http_server(metrics_listen or metrics.DEFAULT_LISTEN)
+    cache.start_refresher()
+    cache.start_link_watcher()
+    ipam.load()
+    ipam.start_flusher()
+    _warm_start(DEFAULT_RESTORE if restore is None else restore)
+    stats.start()
+    sweeper.evict = _evict
+    res = sweeper.configure(idle_ttl, idle_mode)
+    if res["status"] != "success":
+        raise ValueError(res["message"])
+    if sweeper.ttl:
+        print(f"[valDaemon] Idle sweeper: {sweeper.mode} peers without a handshake for {sweeper.ttl:g}s")
+    if keypool_size is not None:
+        keypool.size = keypool_size
+    keypool.start()
     def _handle(sig, frame):
         print("Signal received, shutting down...")
         daemon.shutdown()
@@ -127,6 +343,7 @@ def run(socket_path=None):
 
     signal.signal(signal.SIGINT, _handle)
     signal.signal(signal.SIGTERM, _handle)
+    signal.signal(signal.SIGUSR1, lambda sig, frame: print(f"[valDaemon] Profiling: {profiler.start()}"))
     daemon.start()
 
 if __name__ == "__main__":
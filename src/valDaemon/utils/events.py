@@ -0,0 +1,112 @@
+import collections
+import itertools
+import os
+import threading
+import time
+from typing import Any, Dict, Iterator, List, Tuple
+
+# events kept for watchers that fall behind or poll
+EVENT_BUFFER = int(os.environ.get("VALDAEMON_EVENT_BUFFER", "4096"))
+# peers per traffic event, so one event stays far below the frame cap
+TRAFFIC_CHUNK = 5000
+# a poller counts as watching for this long after its last read
+POLL_GRACE = 60.0
+# open watch streams; each holds a worker thread and an in-flight slot while it waits
+MAX_WATCHERS = int(os.environ.get("VALDAEMON_MAX_WATCHERS", "4"))
+
+
+class ChangeFeed:
+    """
+    Sequence-numbered log of state changes, kept in a bounded ring:
+        {"type": "interface_added" | "interface_removed", "interface"}
+        {"type": "peer_added" | "peer_updated" | "peer_removed", "interface", "public_key", "allowed_ips"}
+        {"type": "traffic", "interface", "interval", "peers": [[key, rx/s, tx/s, latest_handshake], ...]}
+    Mutations publish as they are applied; traffic comes from the peer stats
+    sampler and is only computed while someone is watching. Readers pass
+    the last sequence number they saw; `lost` tells them the ring moved past
+    it and they should reload.
+    """
+    def __init__(self, size: int = EVENT_BUFFER, max_watchers: int = MAX_WATCHERS):
+        self._events: collections.deque = collections.deque(maxlen=size)
+        self.seq = 0
+        self.watchers = 0
+        self.max_watchers = max_watchers
+        self._last_poll = 0.0
+        self._cond = threading.Condition()
+
+    def watched(self) -> bool:
+        return self.watchers > 0 or time.monotonic() - self._last_poll < POLL_GRACE
+
+    def publish(self, events: List[Dict[str, Any]]):
+        if not events:
+            return
+        with self._cond:
+            for event in events:
+                self.seq += 1
+                self._events.append((self.seq, event))
+            self._cond.notify_all()
+
+    def interface(self, ifname: str, exists: bool = True):
+        self.publish([{"type": "interface_added" if exists else "interface_removed", "interface": ifname}])
+
+    def peers(self, ifname: str, specs: List[Dict[str, Any]], existed: Dict[str, bool]):
+        """Events for accepted peer specs; `existed` says which keys the cache already held."""
+        events = []
+        for spec in specs:
+            key = spec["public_key"]
+            if spec.get("remove"):
+                events.append({"type": "peer_removed", "interface": ifname, "public_key": key})
+                continue
+            kind = "peer_updated" if existed.get(key, True) else "peer_added"
+            events.append({"type": kind, "interface": ifname, "public_key": key,
+                           "allowed_ips": list(spec["allowed_ips"]) if spec.get("allowed_ips") is not None else None})
+        self.publish(events)
+
+    def traffic(self, ifname: str, interval: float, rows: List[List[Any]]):
+        self.publish([{"type": "traffic", "interface": ifname, "interval": interval,
+                       "peers": rows[i:i + TRAFFIC_CHUNK]} for i in range(0, len(rows), TRAFFIC_CHUNK)])
+
+    def read(self, since: int = 0, timeout: float = 0) -> Tuple[int, List[Dict[str, Any]], bool]:
+        """(latest seq, events after `since`, lost), waiting up to `timeout` for something new."""
+        with self._cond:
+            if timeout and since >= self.seq:
+                self._cond.wait(timeout)
+            oldest = self._events[0][0] if self._events else self.seq + 1
+            # past the ring, or a sequence from before a daemon restart
+            lost = since + 1 < oldest or since > self.seq
+            if since > self.seq:
+                since = oldest - 1
+            start = max(0, since + 1 - oldest)
+            events = [event for _, event in itertools.islice(self._events, start, None)]
+            self._last_poll = time.monotonic()
+            return self.seq, events, lost
+
+    def watch(self, since: int = None, heartbeat: float = 15.0) -> Iterator[Dict[str, Any]]:
+        """
+        Endless stream of frames with the events after `since` (default: from
+        now on). Frames with no events are heartbeats, sent every `heartbeat`
+        seconds so a dead reader is noticed. Past `max_watchers` open streams
+        the stream is refused; valAPI shares one among all its clients, and
+        anything else can poll with read().
+        """
+        with self._cond:
+            full = self.watchers >= self.max_watchers
+            if not full:
+                self.watchers += 1
+        if full:
+            yield {"status": "error", "message": f"too many watch streams (max {self.max_watchers}); "
+                                                 "poll the watch action instead"}
+            return
+        try:
+            if since is None:
+                since = self.seq
+            while True:
+                seq, events, lost = self.read(since, heartbeat)
+                yield {"status": "success", "more": True, "seq": seq, "lost": lost, "events": events}
+                since = seq
+        finally:
+            with self._cond:
+                self.watchers -= 1
+
+
+feed = ChangeFeed()
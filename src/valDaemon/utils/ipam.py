@@ -0,0 +1,284 @@
+import base64
+import ipaddress
+import json
+import os
+import socket
+import threading
+import zlib
+from array import array
+from typing import Any, Dict, Iterable, List, Optional
+
+DEFAULT_STATE_DIR = os.environ.get("VALDAEMON_STATE_DIR",
+                                   "/var/lib/valdaemon" if os.geteuid() == 0 else "/tmp/valdaemon")
+# Largest pool we keep a bitmap for: 2**24 addresses = 2 MiB of bits.
+MAX_POOL_BITS = 24
+
+
+class AddressPool:
+    """
+    One CIDR tracked as a bitmap (bit set = address in use).
+
+    Allocation is O(1) amortized: released offsets go on a stack and are
+    reused first; otherwise a next-fit cursor walks forward, skipping whole
+    used bytes, and never moves backwards. Nothing is ever scanned twice
+    between releases, so handing out a /16 costs one pass over the bitmap,
+    not a pass per peer.
+    """
+    def __init__(self, cidr: str, bitmap: bytes = None, reserve_first: bool = True):
+        self.network = ipaddress.ip_network(cidr, strict=False)
+        host_bits = self.network.max_prefixlen - self.network.prefixlen
+        if host_bits > MAX_POOL_BITS:
+            raise ValueError(f"pool {cidr} too large; at most 2^{MAX_POOL_BITS} addresses")
+        self.size = self.network.num_addresses
+        self.host = self.network.max_prefixlen
+        self.family = socket.AF_INET if self.network.version == 4 else socket.AF_INET6
+        self.base = int(self.network.network_address)
+        self.bits = bytearray(bitmap) if bitmap is not None else bytearray((self.size + 7) // 8)
+        if len(self.bits) != (self.size + 7) // 8:
+            raise ValueError(f"bitmap does not match pool {cidr}")
+        self.reserve_first = reserve_first
+        self.released = array("I")
+        self.next = 0
+        if bitmap is None:
+            if self.size > 2:
+                # v4 network/broadcast; for v6, offset 0 is the subnet-router anycast address
+                self._set(0)
+                if self.network.version == 4:
+                    self._set(self.size - 1)
+            if reserve_first and self.size > 2:
+                # first host is conventionally the interface's own address
+                self._set(1)
+        self.used = sum(bin(b).count("1") for b in self.bits)
+
+    # ---- bitmap primitives ----
+    def _test(self, off: int) -> bool:
+        return bool(self.bits[off >> 3] & (1 << (off & 7)))
+
+    def _set(self, off: int):
+        self.bits[off >> 3] |= 1 << (off & 7)
+
+    def _clear(self, off: int):
+        self.bits[off >> 3] &= ~(1 << (off & 7)) & 0xFF
+
+    def offset(self, cidr: str) -> Optional[int]:
+        """Bit index of a host address ("10.8.0.7" or "10.8.0.7/32"); None if not a host of this pool."""
+        addr, _, plen = cidr.strip().partition("/")
+        if plen and plen != str(self.host):
+            return None
+        try:
+            packed = socket.inet_pton(self.family, addr)
+        except (OSError, ValueError):
+            return None
+        off = int.from_bytes(packed, "big") - self.base
+        return off if 0 <= off < self.size else None
+
+    def _addr(self, off: int) -> str:
+        packed = (self.base + off).to_bytes(4 if self.family == socket.AF_INET else 16, "big")
+        return f"{socket.inet_ntop(self.family, packed)}/{self.host}"
+
+    # ---- public ----
+    @property
+    def free(self) -> int:
+        return self.size - self.used
+
+    def allocate(self) -> Optional[str]:
+        while self.released:
+            off = self.released.pop()
+            if not self._test(off):
+                self._set(off)
+                self.used += 1
+                return self._addr(off)
+        bits, size = self.bits, self.size
+        off = self.next
+        while off < size:
+            if not off & 7 and bits[off >> 3] == 0xFF:
+                off += 8
+                continue
+            if not bits[off >> 3] & (1 << (off & 7)):
+                self._set(off)
+                self.used += 1
+                self.next = off + 1
+                return self._addr(off)
+            off += 1
+        self.next = size
+        return None
+
+    def claim(self, cidr: str) -> bool:
+        """Mark a specific address used (e.g. one a peer already has). False if outside the pool."""
+        off = self.offset(cidr)
+        if off is None:
+            return False
+        if not self._test(off):
+            self._set(off)
+            self.used += 1
+        return True
+
+    def release(self, cidr: str) -> bool:
+        off = self.offset(cidr)
+        if off is None or not self._test(off):
+            return False
+        self._clear(off)
+        self.used -= 1
+        self.released.append(off)
+        return True
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"cidr": str(self.network), "reserve_first": self.reserve_first,
+                "bitmap": base64.b64encode(zlib.compress(bytes(self.bits))).decode()}
+
+
+class IPAM:
+    """
+    Per-interface address pools, at most one per IP family. Allocations hand
+    out one host address from each of the interface's pools, so a dual-stack
+    interface yields e.g. "10.8.0.7/32,fd00::7/128". State is persisted as a
+    zlib-compressed bitmap per pool (a /16 is 8 KiB before compression),
+    flushed in the background when dirty and on shutdown.
+    """
+    def __init__(self, state_dir: str = DEFAULT_STATE_DIR):
+        self.path = os.path.join(state_dir, "ipam.json")
+        self._pools: Dict[str, Dict[int, AddressPool]] = {}
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._stop = threading.Event()
+
+    def has_pool(self, ifname: str) -> bool:
+        return bool(self._pools.get(ifname))
+
+    def create_pool(self, ifname: str, cidr: str, reserve_first: bool = True,
+                    in_use: Iterable[str] = ()) -> Dict[str, Any]:
+        try:
+            pool = AddressPool(cidr, reserve_first=reserve_first)
+        except ValueError as e:
+            return {"status": "error", "message": str(e)}
+        with self._lock:
+            pools = self._pools.setdefault(ifname, {})
+            if pool.network.version in pools:
+                return {"status": "error", "message": f"{ifname} already has an IPv{pool.network.version} pool"}
+            for cidr_in_use in in_use:
+                pool.claim(cidr_in_use)
+            pools[pool.network.version] = pool
+            self._dirty = True
+        return {"status": "success", "pool": self._describe(ifname, pool)}
+
+    def delete_pool(self, ifname: str, version: int = None) -> Dict[str, Any]:
+        with self._lock:
+            pools = self._pools.get(ifname)
+            if not pools:
+                return {"status": "error", "message": f"no pool for {ifname}"}
+            if version is None:
+                del self._pools[ifname]
+            elif pools.pop(version, None) is None:
+                return {"status": "error", "message": f"no IPv{version} pool for {ifname}"}
+            self._dirty = True
+        return {"status": "success"}
+
+    def reset(self, ifname: str):
+        """Free every address of the interface's pools (its peers are gone), keeping the CIDRs."""
+        with self._lock:
+            pools = self._pools.get(ifname)
+            if not pools:
+                return
+            for version, pool in list(pools.items()):
+                pools[version] = AddressPool(str(pool.network), reserve_first=pool.reserve_first)
+            self._dirty = True
+
+    def status(self, ifname: str = None) -> Dict[str, Any]:
+        with self._lock:
+            pools = [self._describe(name, pool) for name, by_family in self._pools.items()
+                     if ifname is None or name == ifname for pool in by_family.values()]
+        return {"status": "success", "pools": pools}
+
+    def _describe(self, ifname: str, pool: AddressPool) -> Dict[str, Any]:
+        return {"interface": ifname, "cidr": str(pool.network), "size": pool.size,
+                "used": pool.used, "free": pool.free}
+
+    def allocate(self, ifname: str, count: int = 1) -> List[str]:
+        """
+        Return `count` allowed-ips strings, each holding one new address per
+        family pool. All-or-nothing: raises ValueError if any pool runs dry.
+        """
+        with self._lock:
+            pools = list(self._pools.get(ifname, {}).values())
+            if not pools:
+                raise ValueError(f"no address pool configured for {ifname}")
+            if any(pool.free < count for pool in pools):
+                raise ValueError(f"address pool for {ifname} exhausted")
+            out = []
+            for _ in range(count):
+                out.append(",".join(pool.allocate() for pool in pools))
+            self._dirty = True
+            return out
+
+    def claim(self, ifname: str, allowed_ips: Iterable[str]):
+        """Record explicitly assigned host addresses so they are never handed out."""
+        with self._lock:
+            pools = self._pools.get(ifname)
+            if not pools:
+                return
+            for cidr in allowed_ips:
+                pool = pools.get(6 if ":" in cidr else 4)
+                if pool is not None:
+                    pool.claim(cidr)
+            self._dirty = True
+
+    def release(self, ifname: str, allowed_ips: Iterable[str]) -> int:
+        released = 0
+        with self._lock:
+            pools = self._pools.get(ifname)
+            if not pools:
+                return 0
+            for cidr in allowed_ips:
+                pool = pools.get(6 if ":" in cidr else 4)
+                if pool is not None and pool.release(cidr):
+                    released += 1
+            if released:
+                self._dirty = True
+        return released
+
+    # ---- persistence ----
+    def load(self):
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return
+        with self._lock:
+            for ifname, pools in data.get("pools", {}).items():
+                for entry in pools:
+                    bitmap = zlib.decompress(base64.b64decode(entry["bitmap"]))
+                    pool = AddressPool(entry["cidr"], bitmap=bitmap,
+                                       reserve_first=entry.get("reserve_first", True))
+                    self._pools.setdefault(ifname, {})[pool.network.version] = pool
+
+    def save(self, force: bool = False):
+        with self._lock:
+            if not (self._dirty or force):
+                return
+            data = {"version": 1, "pools": {name: [p.to_dict() for p in by_family.values()]
+                                            for name, by_family in self._pools.items()}}
+            self._dirty = False
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(data, f)
+        os.replace(tmp, self.path)
+
+    def start_flusher(self, interval: float = 2.0):
+        def _loop():
+            while not self._stop.wait(interval):
+                try:
+                    self.save()
+                except Exception as e:
+                    print(f"[valDaemon] IPAM save failed: {e}")
+        threading.Thread(target=_loop, name="valdaemon-ipam-flush", daemon=True).start()
+
+    def stop(self):
+        self._stop.set()
+        try:
+            self.save()
+        except Exception as e:
+            print(f"[valDaemon] IPAM save failed: {e}")
+
+
+ipam = IPAM()
@@ -0,0 +1,243 @@
+import os
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional
+
+from valDaemon.utils.ipam import DEFAULT_STATE_DIR
+
+FLUSH_INTERVAL = float(os.environ.get("VALDAEMON_JOURNAL_FLUSH", "1.0"))
+# compact once the log holds this many records and more than the state itself
+COMPACT_MIN = int(os.environ.get("VALDAEMON_JOURNAL_COMPACT", "10000"))
+HEADER = "# valdaemon-state 1"
+
+# In memory: {ifname: {public_key: [allowed_ips, endpoint, keepalive]}}, each
+# field a string as it appears on disk ("" for none).
+State = Dict[str, Dict[str, List[str]]]
+
+
+def _apply(state: State, owners: Dict[str, Dict[str, str]], fields: List[str]):
+    kind = fields[0]
+    if kind == "I":
+        state.setdefault(fields[1], {})
+    elif kind == "D":
+        state.pop(fields[1], None)
+        owners.pop(fields[1], None)
+    elif kind == "P":
+        _, ifname, key, ips, endpoint, keepalive = fields
+        peers = state.setdefault(ifname, {})
+        rec = peers.get(key) or ["", "", ""]
+        if ips != "-":
+            # the kernel moves a prefix to the peer that claimed it last
+            held = owners.setdefault(ifname, {})
+            for prefix in rec[0].split(",") if rec[0] else ():
+                if held.get(prefix) == key:
+                    del held[prefix]
+            for prefix in ips.split(",") if ips else ():
+                prev = held.get(prefix)
+                if prev is not None and prev != key and prev in peers:
+                    prev_ips = [p for p in peers[prev][0].split(",") if p != prefix]
+                    peers[prev][0] = ",".join(prev_ips)
+                held[prefix] = key
+            rec[0] = ips
+        if endpoint != "-":
+            rec[1] = endpoint
+        if keepalive != "-":
+            rec[2] = keepalive
+        peers[key] = rec
+    elif kind == "R":
+        rec = state.get(fields[1], {}).pop(fields[2], None)
+        held = owners.get(fields[1])
+        if rec and held:
+            for prefix in rec[0].split(",") if rec[0] else ():
+                if held.get(prefix) == fields[2]:
+                    del held[prefix]
+
+
+def spec_record(ifname: str, spec: Dict[str, Any]) -> str:
+    """One journal line for an accepted backend peer spec."""
+    key = spec["public_key"]
+    if spec.get("remove"):
+        return f"R\t{ifname}\t{key}\n"
+    ips = ",".join(spec["allowed_ips"]) if spec.get("allowed_ips") is not None else "-"
+    endpoint = "-"
+    if spec.get("endpoint"):
+        host, port = spec["endpoint"]
+        endpoint = f"[{host}]:{port}" if ":" in host else f"{host}:{port}"
+    keepalive = "-" if spec.get("persistent_keepalive") is None else str(spec["persistent_keepalive"])
+    return f"P\t{ifname}\t{key}\t{ips}\t{endpoint}\t{keepalive}\n"
+
+
+class StateJournal:
+    """
+    Durable record of the interfaces and peers the daemon configured, so a
+    restart (or reboot, which wipes kernel WireGuard state) can put them
+    back. IPAM pools are persisted separately, in ipam.json.
+
+    Records are tab-separated lines, appended to state.log:
+        I ifname                                  interface exists
+        D ifname                                  interface and its peers gone
+        P ifname key allowed_ips endpoint keepalive   peer set; "-" = unchanged
+        R ifname key                              peer removed
+    Mutations only queue a line; a flusher thread appends and fsyncs the
+    batch every FLUSH_INTERVAL seconds (group commit), so the request path
+    never waits on the disk. Once the log outgrows the state it describes,
+    the current state is written to state.snap (same format, temp file +
+    rename) and the log starts over. Both files carry a generation number
+    in their header; loading replays the snapshot and then the log only if
+    it belongs to the same generation, and ignores a torn last line.
+    """
+    def __init__(self, directory: str = DEFAULT_STATE_DIR):
+        self.snap_path = os.path.join(directory, "state.snap")
+        self.log_path = os.path.join(directory, "state.log")
+        self.state: State = {}
+        self._owners: Dict[str, Dict[str, str]] = {}
+        self._pending: List[str] = []
+        self._records = 0
+        self._gen = 0
+        self._log_ok = False
+        self._lock = threading.Lock()
+        self._io_lock = threading.Lock()
+        self._log = None
+        self._stop = threading.Event()
+        self.enabled = False
+
+    # ---- recording ----
+    def _record(self, lines: Iterable[str]):
+        if not self.enabled:
+            return
+        with self._lock:
+            for line in lines:
+                _apply(self.state, self._owners, line.rstrip("\n").split("\t"))
+                self._pending.append(line)
+
+    def interface(self, ifname: str, exists: bool = True):
+        self._record([f"{'I' if exists else 'D'}\t{ifname}\n"])
+
+    def peers(self, ifname: str, specs: List[Dict[str, Any]]):
+        self._record(spec_record(ifname, spec) for spec in specs)
+
+    # ---- persistence ----
+    def load(self) -> Optional[State]:
+        """Replay snapshot and log into memory. Returns None when there is no journal yet."""
+        state: State = {}
+        owners: Dict[str, Dict[str, str]] = {}
+        gen = None
+        records = 0
+        log_ok = False
+        for path in (self.snap_path, self.log_path):
+            try:
+                f = open(path)
+            except FileNotFoundError:
+                continue
+            with f:
+                header = f.readline().split()
+                if header[:3] != HEADER.split() or len(header) < 4:
+                    continue
+                if gen is not None and header[3] != gen:
+                    break  # log left over from before the last compaction
+                gen = header[3]
+                log_ok = path == self.log_path
+                for line in f:
+                    if not line.endswith("\n"):
+                        break  # torn write from a crash mid-append
+                    fields = line.rstrip("\n").split("\t")
+                    if fields[0] in ("P", "R", "I", "D"):
+                        _apply(state, owners, fields)
+                        records += path == self.log_path
+        with self._lock:
+            self.state, self._owners, self._records = state, owners, records
+            self._gen = int(gen or 0)
+            self._log_ok = log_ok
+            self.enabled = True
+        return state if gen is not None else None
+
+    def adopt(self, state: State):
+        """Start from `state` (e.g. captured from the kernel) and snapshot it right away."""
+        with self._lock:
+            self.state, self._owners, self._pending = state, {}, []
+            for ifname, peers in state.items():
+                held = self._owners.setdefault(ifname, {})
+                for key, rec in peers.items():
+                    for prefix in rec[0].split(",") if rec[0] else ():
+                        held[prefix] = key
+            self.enabled = True
+        self.compact()
+
+    def flush(self):
+        with self._io_lock:
+            with self._lock:
+                lines, self._pending = self._pending, []
+                self._records += len(lines)
+                compact = self._records >= COMPACT_MIN and self._records > sum(map(len, self.state.values()))
+            if lines:
+                if self._log is None:
+                    self._open_log()
+                self._log.write("".join(lines))
+                self._log.flush()
+                os.fsync(self._log.fileno())
+        if compact:
+            self.compact()
+
+    def compact(self):
+        with self._io_lock:
+            # take the lock only to copy; writing 50k lines happens outside it.
+            # Queued lines are already folded into the state being copied.
+            with self._lock:
+                self._pending = []
+                self._gen += 1
+                gen = self._gen
+                snap = {ifname: {k: list(rec) for k, rec in peers.items()} for ifname, peers in self.state.items()}
+            os.makedirs(os.path.dirname(self.snap_path), exist_ok=True)
+            tmp = self.snap_path + ".tmp"
+            with open(tmp, "w") as f:
+                f.write(f"{HEADER} {gen} {time.time():.0f}\n")
+                for ifname, peers in snap.items():
+                    f.write(f"I\t{ifname}\n")
+                    f.writelines(f"P\t{ifname}\t{key}\t{ips}\t{endpoint or '-'}\t{keepalive or '-'}\n"
+                                 for key, (ips, endpoint, keepalive) in peers.items())
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self.snap_path)
+            if self._log is not None:
+                self._log.close()
+                self._log = None
+            self._log_ok = False
+            self._open_log()
+            with self._lock:
+                self._records = 0
+
+    def _open_log(self):
+        # append to the log load() replayed; anything else starts over under the current generation
+        if self._log_ok:
+            self._log = open(self.log_path, "a")
+            return
+        os.makedirs(os.path.dirname(self.log_path), exist_ok=True)
+        self._log = open(self.log_path, "w")
+        self._log.write(f"{HEADER} {self._gen}\n")
+        self._log.flush()
+        os.fsync(self._log.fileno())
+        self._log_ok = True
+
+    def start_flusher(self, interval: float = FLUSH_INTERVAL):
+        def _loop():
+            while not self._stop.wait(interval):
+                try:
+                    self.flush()
+                except Exception as e:
+                    print(f"[valDaemon] Journal write failed: {e}")
+        threading.Thread(target=_loop, name="valdaemon-journal", daemon=True).start()
+
+    def stop(self):
+        self._stop.set()
+        if not self.enabled:
+            return
+        try:
+            self.flush()
+        except Exception as e:
+            print(f"[valDaemon] Journal write failed: {e}")
+        if self._log is not None:
+            self._log.close()
+            self._log = None
+
+
+journal = StateJournal()
@@ -0,0 +1,120 @@
+import base64
+import collections
+import os
+import threading
+from typing import List, Tuple
+
+try:
+    from cryptography.hazmat.primitives.asymmetric.x25519 import X25519PrivateKey
+    from cryptography.hazmat.primitives.serialization import Encoding, PublicFormat
+except ImportError:  # pragma: no cover - falls back to the pure-Python ladder below
+    X25519PrivateKey = None
+
+DEFAULT_POOL_SIZE = int(os.environ.get("VALDAEMON_KEYPOOL_SIZE", "0"))
+
+# ---- pure-Python X25519 (RFC 7748), used only when `cryptography` is missing ----
+_P = 2 ** 255 - 19
+_A24 = 121665
+
+
+def _clamp(k: bytes) -> bytes:
+    k = bytearray(k)
+    k[0] &= 248
+    k[31] &= 127
+    k[31] |= 64
+    return bytes(k)
+
+
+def _ladder(scalar: int, u: int) -> int:
+    x1, x2, z2, x3, z3 = u, 1, 0, u, 1
+    swap = 0
+    for t in reversed(range(255)):
+        bit = (scalar >> t) & 1
+        swap ^= bit
+        if swap:
+            x2, x3, z2, z3 = x3, x2, z3, z2
+        swap = bit
+        a, b = x2 + z2, x2 - z2
+        aa, bb = a * a % _P, b * b % _P
+        e = aa - bb
+        c, d = x3 + z3, x3 - z3
+        da, cb = d * a % _P, c * b % _P
+        x3 = (da + cb) ** 2 % _P
+        z3 = x1 * (da - cb) ** 2 % _P
+        x2 = aa * bb % _P
+        z2 = e * (aa + _A24 * e) % _P
+    if swap:
+        x2, z2 = x3, z3
+    return x2 * pow(z2, _P - 2, _P) % _P
+
+
+def _public_key_py(private: bytes) -> bytes:
+    return _ladder(int.from_bytes(_clamp(private), "little"), 9).to_bytes(32, "little")
+
+
+def public_key(private: bytes) -> bytes:
+    """Curve25519 public key for a raw 32-byte private key (what `wg pubkey` does)."""
+    if X25519PrivateKey is not None:
+        return X25519PrivateKey.from_private_bytes(private).public_key().public_bytes(Encoding.Raw, PublicFormat.Raw)
+    return _public_key_py(private)
+
+
+def new_keypair() -> Tuple[str, str]:
+    """
+    Base64 (private, public) pair, equivalent to `wg genkey | wg pubkey`. Uses
+    `cryptography` when installed; the pure-Python fallback is correct but not
+    constant-time and runs at roughly a millisecond per key.
+    """
+    private = _clamp(os.urandom(32))
+    return base64.b64encode(private).decode(), base64.b64encode(public_key(private)).decode()
+
+
+class KeyPool:
+    """
+    Pre-generated keypairs for onboarding bursts. A background thread tops the
+    pool up to `size` whenever it drops below half; `take` hands out pooled
+    pairs first and generates the rest inline. Each pair is handed out once.
+    """
+    def __init__(self, size: int = DEFAULT_POOL_SIZE):
+        self.size = size
+        self._pairs = collections.deque()
+        self._lock = threading.Lock()
+        self._low = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self.size <= 0 or self._thread is not None:
+            return
+        self._low.set()
+        self._thread = threading.Thread(target=self._refill, name="valdaemon-keypool", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._low.set()
+
+    def _refill(self):
+        while not self._stop.is_set():
+            self._low.wait()
+            # clear before filling: a take() that drains the pool mid-fill sets it again
+            self._low.clear()
+            while len(self._pairs) < self.size and not self._stop.is_set():
+                self._pairs.append(new_keypair())
+
+    def take(self, count: int = 1) -> List[Tuple[str, str]]:
+        out = []
+        with self._lock:
+            while self._pairs and len(out) < count:
+                out.append(self._pairs.popleft())
+        if self.size > 0 and len(self._pairs) < self.size // 2:
+            self._low.set()
+        while len(out) < count:
+            out.append(new_keypair())
+        return out
+
+    def __len__(self):
+        return len(self._pairs)
+
+
+pool = KeyPool()
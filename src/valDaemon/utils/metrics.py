@@ -0,0 +1,269 @@
+import bisect
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Iterable, List, Sequence, Tuple
+
+from valDaemon.utils.tracing import current_span
+
+# Prometheus text exposition format, version 0.0.4. Hand-written so the daemon
+# keeps its dependency list at pyroute2 alone; valAPI.metrics uses it too.
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+DEFAULT_LISTEN = os.environ.get("VALDAEMON_METRICS", "")
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence, extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _num(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def family(name: str, kind: str, help: str, samples: Iterable[Tuple[Dict[str, str], float]]) -> List[str]:
+    """Render one metric family from (labels, value) pairs; used by scrape-time collectors."""
+    lines = [f"# HELP {name} {help}", f"# TYPE {name} {kind}"]
+    for labels, value in samples:
+        lines.append(f"{name}{_labels(list(labels), list(labels.values()))} {_num(value)}")
+    return lines
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[tuple, object] = {}
+        self._lock = threading.Lock()
+        if not self.labelnames:
+            self.labels()
+
+    def labels(self, *values):
+        key = tuple(str(v) for v in values)
+        child = self._children.get(key)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(key, self._new_child())
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            children = list(self._children.items())
+        for values, child in children:
+            lines.extend(self._render_child(values, child))
+        return lines
+
+
+class _Value:
+    __slots__ = ("value", "lock")
+
+    def __init__(self):
+        self.value = 0.0
+        self.lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0):
+        with self.lock:
+            self.value += amount
+
+    def dec(self, amount: float = 1.0):
+        with self.lock:
+            self.value -= amount
+
+    def set(self, value: float):
+        self.value = value
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _Value()
+
+    def inc(self, amount: float = 1.0):
+        self.labels().inc(amount)
+
+    def _render_child(self, values, child):
+        return [f"{self.name}{_labels(self.labelnames, values)} {_num(child.value)}"]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, amount: float = 1.0):
+        self.labels().dec(amount)
+
+    def set(self, value: float):
+        self.labels().set(value)
+
+
+class _Histo:
+    __slots__ = ("buckets", "counts", "sum", "lock")
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.lock = threading.Lock()
+
+    def observe(self, value: float):
+        i = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            self.counts[i] += 1
+            self.sum += value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self):
+        return _Histo(self.buckets)
+
+    def observe(self, value: float):
+        self.labels().observe(value)
+
+    def _render_child(self, values, child):
+        with child.lock:
+            counts, total = list(child.counts), child.sum
+        lines, cumulative = [], 0
+        for bound, count in zip(self.buckets + (float("inf"),), counts):
+            cumulative += count
+            le = 'le="' + _num(bound) + '"'
+            lines.append(f"{self.name}_bucket{_labels(self.labelnames, values, le)} {cumulative}")
+        lines.append(f"{self.name}_sum{_labels(self.labelnames, values)} {_num(total)}")
+        lines.append(f"{self.name}_count{_labels(self.labelnames, values)} {cumulative}")
+        return lines
+
+
+class Registry:
+    """Metrics registered at import time plus collectors run on every scrape."""
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+        self._collectors: List[Callable[[], Iterable[str]]] = []
+
+    def counter(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._add(Counter(name, help, labelnames))
+
+    def gauge(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._add(Gauge(name, help, labelnames))
+
+    def histogram(self, name: str, help: str, labelnames: Sequence[str] = (), buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self._add(Histogram(name, help, labelnames, buckets))
+
+    def _add(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, fn: Callable[[], Iterable[str]]):
+        self._collectors.append(fn)
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for fn in self._collectors:
+            try:
+                lines.extend(fn())
+            except Exception as e:
+                lines.append(f"# collector {getattr(fn, '__name__', fn)} failed: {_escape(e)}")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+requests_seconds = registry.histogram("valdaemon_request_duration_seconds",
+                                      "Time to dispatch one request, by action.", ("action",))
+request_errors = registry.counter("valdaemon_request_errors_total",
+                                  "Requests answered with status error, by action.", ("action",))
+in_flight = registry.gauge("valdaemon_requests_in_flight", "Requests currently being dispatched.")
+connections = registry.gauge("valdaemon_connections", "Open client connections.")
+connections_total = registry.counter("valdaemon_connections_total", "Client connections accepted.")
+backend_seconds = registry.histogram("valdaemon_backend_call_duration_seconds",
+                                     "Time spent in WireGuard backend calls.", ("backend", "call"))
+backend_errors = registry.counter("valdaemon_backend_call_errors_total",
+                                  "Backend calls that returned an error.", ("backend", "call"))
+
+
+class InstrumentedBackend:
+    """
+    Wraps a backend so every public call is timed and its errors counted,
+    and shows up as a "backend" span when the request is traced.
+    """
+    def __init__(self, backend):
+        self._backend = backend
+        self.name = backend.name
+
+    def __getattr__(self, attr):
+        fn = getattr(self._backend, attr)
+        if attr.startswith("_") or not callable(fn):
+            return fn
+        timer = backend_seconds.labels(self.name, attr)
+        errors = backend_errors.labels(self.name, attr)
+
+        def call(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                with current_span("backend", backend=self.name, call=attr):
+                    res = fn(*args, **kwargs)
+            except Exception:
+                errors.inc()
+                raise
+            finally:
+                timer.observe(time.perf_counter() - start)
+            if isinstance(res, dict) and res.get("status") not in (None, "success"):
+                errors.inc()
+            return res
+        # cache on the instance so __getattr__ runs once per method
+        setattr(self, attr, call)
+        return call
+
+
+def start_http_server(listen: str = DEFAULT_LISTEN, source: Registry = registry):
+    """
+    Serve GET /metrics on "host:port" (or ":port") from a daemon thread.
+    Does nothing when `listen` is empty.
+    """
+    if not listen:
+        return None
+    host, _, port = listen.rpartition(":")
+
+    class _Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] not in ("/metrics", "/"):
+                self.send_error(404)
+                return
+            body = source.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer((host.strip("[]") or "0.0.0.0", int(port)), _Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="valdaemon-metrics", daemon=True).start()
+    print(f"[valDaemon] Metrics on http://{listen}/metrics")
+    return server
@@ -0,0 +1,80 @@
+import threading
+from typing import Any, Callable
+
+try:
+    from pyroute2 import IPRoute, WireGuard
+except ImportError:  # pragma: no cover - pyroute2 is only needed on the netlink path
+    IPRoute = WireGuard = None
+
+_FACTORIES = {
+    "iproute": lambda: IPRoute(),
+    "wireguard": lambda: WireGuard(),
+}
+
+
+class NetlinkSessions:
+    """
+    Long-lived IPRoute / WireGuard sockets, one of each per thread.
+
+    pyroute2 sockets are not safe to share between threads, so every worker
+    thread lazily opens its own and keeps it for its lifetime. A call that
+    fails with a socket-level error (not a netlink NACK) drops that thread's
+    socket, reconnects and retries once.
+    """
+    def __init__(self):
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._open = set()
+
+    def available(self) -> bool:
+        return IPRoute is not None
+
+    def _get(self, kind: str):
+        sock = getattr(self._local, kind, None)
+        if sock is None:
+            if IPRoute is None:
+                raise RuntimeError("pyroute2 is not installed")
+            sock = _FACTORIES[kind]()
+            setattr(self._local, kind, sock)
+            with self._lock:
+                self._open.add(sock)
+        return sock
+
+    def _drop(self, kind: str):
+        sock = getattr(self._local, kind, None)
+        setattr(self._local, kind, None)
+        if sock is not None:
+            with self._lock:
+                self._open.discard(sock)
+            try:
+                sock.close()
+            except Exception:
+                pass
+
+    def _call(self, kind: str, fn: Callable[[Any], Any]) -> Any:
+        try:
+            return fn(self._get(kind))
+        except (OSError, EOFError):
+            self._drop(kind)
+            return fn(self._get(kind))
+
+    def iproute(self, fn: Callable[[Any], Any]) -> Any:
+        """Run fn(ipr) on this thread's IPRoute socket."""
+        return self._call("iproute", fn)
+
+    def wireguard(self, fn: Callable[[Any], Any]) -> Any:
+        """Run fn(wg) on this thread's WireGuard generic-netlink socket."""
+        return self._call("wireguard", fn)
+
+    def close(self):
+        with self._lock:
+            socks, self._open = self._open, set()
+        for sock in socks:
+            try:
+                sock.close()
+            except Exception:
+                pass
+        self._local = threading.local()
+
+
+sessions = NetlinkSessions()
@@ -0,0 +1,329 @@
+import bisect
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from valDaemon.utils.prefix_trie import AllowedIPsIndex
+
+try:
+    from pyroute2 import IPRoute
+    from pyroute2.netlink.rtnl import RTMGRP_LINK
+except ImportError:  # pragma: no cover - link events are optional
+    IPRoute = None
+
+DEFAULT_TTL = float(os.environ.get("VALDAEMON_CACHE_TTL", "5"))
+DEFAULT_REFRESH = float(os.environ.get("VALDAEMON_CACHE_REFRESH", "30"))
+
+
+class PeerTable(dict):
+    """
+    {public_key: Peer} that keeps an AllowedIPsIndex in step with its
+    contents once one has been built (lazily, on first use). Writes go
+    through item assignment and pop, as the cache's mutators do. Like the
+    kernel, giving a prefix to a peer takes it away from its previous owner.
+    """
+    __slots__ = ("index",)
+
+    def __init__(self, *args):
+        super().__init__(*args)
+        self.index: Optional[AllowedIPsIndex] = None
+
+    def ensure_index(self) -> AllowedIPsIndex:
+        if self.index is None:
+            self.index = AllowedIPsIndex.build((key, peer.allowed_ips) for key, peer in self.items())
+        return self.index
+
+    def adopt_index(self, old: "PeerTable"):
+        """Reuse `old`'s index, patching only the peers whose allowed_ips differ."""
+        if old.index is None:
+            return
+        self.index, old.index = old.index, None
+        for key, peer in old.items():
+            new = self.get(key)
+            if new is None or new.allowed_ips != peer.allowed_ips:
+                self._unindex(key, peer.allowed_ips)
+        for key, peer in self.items():
+            prev = old.get(key)
+            if prev is None or prev.allowed_ips != peer.allowed_ips:
+                self._index(key, peer.allowed_ips)
+
+    def _unindex(self, key: str, allowed_ips):
+        for cidr in allowed_ips:
+            try:
+                self.index.remove(cidr, key)
+            except ValueError:
+                pass
+
+    def _index(self, key: str, allowed_ips):
+        for cidr in allowed_ips:
+            try:
+                prev = self.index.add(cidr, key)
+            except ValueError:
+                continue
+            other = self.get(prev) if prev is not None and prev != key else None
+            if other is not None:
+                taken = AllowedIPsIndex.parse(cidr)
+                kept = tuple(ip for ip in other.allowed_ips if _same_prefix(ip, taken) is False)
+                super().__setitem__(prev, other.replace(allowed_ips=kept))
+
+    def __setitem__(self, key: str, peer):
+        old = self.get(key)
+        super().__setitem__(key, peer)
+        if self.index is not None:
+            old_ips = old.allowed_ips if old is not None else ()
+            if old_ips != peer.allowed_ips:
+                self._unindex(key, [ip for ip in old_ips if ip not in peer.allowed_ips])
+                self._index(key, [ip for ip in peer.allowed_ips if ip not in old_ips])
+
+    def __delitem__(self, key: str):
+        self.pop(key)
+
+    def pop(self, key: str, *default):
+        if key not in self:
+            if default:
+                return default[0]
+            raise KeyError(key)
+        peer = super().pop(key)
+        if self.index is not None:
+            self._unindex(key, peer.allowed_ips)
+        return peer
+
+
+def _same_prefix(cidr: str, parsed) -> Optional[bool]:
+    try:
+        return AllowedIPsIndex.parse(cidr) == parsed
+    except ValueError:
+        return None
+
+
+class _Entry:
+    __slots__ = ("peers", "sorted_keys", "fetched_at", "replay", "refreshing")
+
+    def __init__(self):
+        self.peers: PeerTable = PeerTable()
+        self.sorted_keys: Optional[List[str]] = None
+        self.fetched_at = 0.0
+        self.replay: List[Callable[[Dict[str, Any]], None]] = []
+        self.refreshing = 0
+
+
+class PeerCache:
+    """
+    In-memory copy of each interface's peer table: {public_key: Peer}.
+
+    Reads are served from memory while younger than `ttl`; older entries are
+    re-dumped from the kernel on demand and by a background refresher.
+    Mutations made through the daemon are applied to the cache as soon as the
+    kernel accepts them; peers are replaced rather than edited in place and
+    readers get snapshots. A mutation that lands while a dump is in flight is
+    replayed on top of the fresh dump so it is not lost.
+    """
+    def __init__(self, loader: Callable[[str], Dict[str, Any]],
+                 iface_loader: Callable[[], Dict[str, Any]], ttl: float = DEFAULT_TTL):
+        self.loader = loader
+        self.iface_loader = iface_loader
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries: Dict[str, _Entry] = {}
+        self._ifaces: Optional[Dict[str, Any]] = None
+        self._ifaces_at = 0.0
+        self._stop = threading.Event()
+
+    # ---- reads ----
+    def _meta(self, entry: _Entry, source: str, error: str = None) -> Dict[str, Any]:
+        age = 0.0 if source == "kernel" else round(time.monotonic() - entry.fetched_at, 3)
+        meta = {"source": source, "age": age, "ttl": self.ttl, "stale": error is not None}
+        if error is not None:
+            meta["error"] = error
+        return meta
+
+    def _ensure(self, ifname: str, fresh: bool):
+        """
+        Make sure the interface is loaded and young enough. Returns (meta, None)
+        or (None, error response). Must be called without the lock held.
+        """
+        with self._lock:
+            entry = self._entries.get(ifname)
+            if entry is not None and entry.fetched_at and not fresh \
+                    and time.monotonic() - entry.fetched_at <= self.ttl:
+                return self._meta(entry, "cache"), None
+        res = self.refresh(ifname)
+        with self._lock:
+            entry = self._entries.get(ifname)
+            if res.get("status") == "success":
+                return self._meta(entry, "kernel"), None
+            if entry is None or not entry.fetched_at:
+                return None, res
+            # kernel unreachable: serve what we have, flagged as stale
+            return self._meta(entry, "cache", res.get("message")), None
+
+    def peers(self, ifname: str, fresh: bool = False) -> Dict[str, Any]:
+        """Return {"status", "peers": [peer, ...], "cache": meta}; peers is a snapshot."""
+        meta, err = self._ensure(ifname, fresh)
+        if err:
+            return err
+        with self._lock:
+            entry = self._entries.get(ifname)
+            peers = list(entry.peers.values()) if entry else []
+        return {"status": "success", "peers": peers, "cache": meta}
+
+    def get(self, ifname: str, public_key: str) -> Optional[Any]:
+        """One peer by key, loading the interface if needed; None if unknown or unreachable."""
+        _, err = self._ensure(ifname, False)
+        if err:
+            return None
+        with self._lock:
+            entry = self._entries.get(ifname)
+            return entry.peers.get(public_key) if entry else None
+
+    def indexed(self, ifname: str, fn: Callable[[PeerTable, AllowedIPsIndex], Any], fresh: bool = False):
+        """
+        Run fn(peers, index) under the cache lock against the interface's
+        AllowedIPs index (built on first use). Returns (result, None) or
+        (None, error response).
+        """
+        _, err = self._ensure(ifname, fresh)
+        if err:
+            return None, err
+        with self._lock:
+            entry = self._entries.get(ifname)
+            peers = entry.peers if entry is not None else PeerTable()
+            return fn(peers, peers.ensure_index()), None
+
+    def page(self, ifname: str, cursor: str = None, limit: int = 1000,
+             match: Callable[[Any], bool] = None, fresh: bool = False) -> Dict[str, Any]:
+        """
+        Return up to `limit` peers ordered by public key, starting after
+        `cursor`, keeping only those accepted by `match`. The sorted key index
+        is rebuilt lazily after changes, so paging is O(log n + page).
+        """
+        meta, err = self._ensure(ifname, fresh)
+        if err:
+            return err
+        with self._lock:
+            entry = self._entries.get(ifname)
+            if entry is None:
+                return {"status": "success", "peers": [], "next_cursor": None, "total": 0, "cache": meta}
+            if entry.sorted_keys is None:
+                entry.sorted_keys = sorted(entry.peers)
+            keys, peers = entry.sorted_keys, entry.peers
+            i = bisect.bisect_right(keys, cursor) if cursor else 0
+            out = []
+            while i < len(keys) and len(out) < limit:
+                peer = peers[keys[i]]
+                i += 1
+                if match is None or match(peer):
+                    out.append(peer)
+            next_cursor = keys[i - 1] if i < len(keys) and len(out) >= limit else None
+            return {"status": "success", "peers": out, "next_cursor": next_cursor,
+                    "total": len(keys), "cache": meta}
+
+    def interfaces(self, fresh: bool = False) -> Dict[str, Any]:
+        # one consistent snapshot: invalidate_interfaces() may clear the table meanwhile
+        with self._lock:
+            ifaces, age = self._ifaces, time.monotonic() - self._ifaces_at
+        if fresh or ifaces is None or age > self.ttl:
+            res = self.iface_loader()
+            if res.get("status") != "success":
+                return res
+            with self._lock:
+                self._ifaces, self._ifaces_at = res, time.monotonic()
+            return dict(res, cache={"source": "kernel", "age": 0.0, "ttl": self.ttl, "stale": False})
+        return dict(ifaces, cache={"source": "cache", "age": round(age, 3), "ttl": self.ttl, "stale": False})
+
+    # ---- refresh ----
+    def refresh(self, ifname: str) -> Dict[str, Any]:
+        with self._lock:
+            entry = self._entries.setdefault(ifname, _Entry())
+            entry.refreshing += 1
+            start = len(entry.replay)
+        res = self.loader(ifname)
+        with self._lock:
+            entry.refreshing -= 1
+            replay = entry.replay[start:]
+            if not entry.refreshing:
+                entry.replay = []
+            if res.get("status") != "success":
+                if not entry.fetched_at:
+                    self._entries.pop(ifname, None)
+                return res
+            peers = PeerTable((peer.public_key, peer) for peer in res["peers"])
+            peers.adopt_index(entry.peers)
+            for fn in replay:
+                fn(peers)
+            entry.peers = peers
+            entry.sorted_keys = None
+            entry.fetched_at = time.monotonic()
+            return {"status": "success"}
+
+    def refresh_all(self):
+        with self._lock:
+            names = list(self._entries)
+        for name in names:
+            self.refresh(name)
+
+    def start_refresher(self, interval: float = DEFAULT_REFRESH):
+        """Re-dump every cached interface each `interval` seconds (0 disables)."""
+        if interval <= 0:
+            return
+
+        def _loop():
+            while not self._stop.wait(interval):
+                try:
+                    self.refresh_all()
+                except Exception:
+                    pass
+        threading.Thread(target=_loop, name="valdaemon-cache-refresh", daemon=True).start()
+
+    def start_link_watcher(self):
+        """
+        Drop cached state when rtnetlink reports a link being created or
+        removed, so interface lists and dead interfaces never linger until TTL.
+        WireGuard itself emits no peer events; peer drift is caught by refresh.
+        """
+        if IPRoute is None:
+            return
+
+        def _loop():
+            try:
+                with IPRoute() as ipr:
+                    ipr.bind(groups=RTMGRP_LINK)
+                    while not self._stop.is_set():
+                        for msg in ipr.get():
+                            event = msg.get("event")
+                            if event == "RTM_DELLINK":
+                                self.invalidate(msg.get_attr("IFLA_IFNAME"))
+                            elif event == "RTM_NEWLINK":
+                                self.invalidate_interfaces()
+            except Exception:
+                pass
+        threading.Thread(target=_loop, name="valdaemon-link-watch", daemon=True).start()
+
+    def stop(self):
+        self._stop.set()
+
+    # ---- writes ----
+    def invalidate_interfaces(self):
+        with self._lock:
+            self._ifaces = None
+
+    def invalidate(self, ifname: str = None):
+        with self._lock:
+            self._ifaces = None
+            if ifname is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(ifname, None)
+
+    def mutate(self, ifname: str, fn: Callable[[Dict[str, Any]], None]):
+        """Apply fn(peers) to a cached interface; no-op if it is not cached."""
+        with self._lock:
+            entry = self._entries.get(ifname)
+            if entry is None:
+                return
+            if entry.fetched_at:
+                fn(entry.peers)
+                entry.sorted_keys = None
+            if entry.refreshing:
+                entry.replay.append(fn)
@@ -0,0 +1,99 @@
+import ipaddress
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+PEER_FIELDS = ("public_key", "endpoint", "allowed_ips", "latest_handshake",
+               "rx_bytes", "tx_bytes", "persistent_keepalive", "has_preshared_key")
+
+
+class Peer:
+    """
+    Parsed peer state. Slotted and treated as immutable (use `replace`), so
+    the daemon can hold 100k of them without a dict per peer and hand the
+    same objects to concurrent readers.
+    """
+    __slots__ = PEER_FIELDS + ("_networks",)
+
+    def __init__(self, public_key: str, endpoint: Optional[str] = None,
+                 allowed_ips: Tuple[str, ...] = (), latest_handshake: int = 0,
+                 rx_bytes: int = 0, tx_bytes: int = 0, persistent_keepalive: int = 0,
+                 has_preshared_key: bool = False):
+        self.public_key = public_key
+        self.endpoint = endpoint
+        self.allowed_ips = allowed_ips
+        self.latest_handshake = latest_handshake
+        self.rx_bytes = rx_bytes
+        self.tx_bytes = tx_bytes
+        self.persistent_keepalive = persistent_keepalive
+        self.has_preshared_key = has_preshared_key
+        self._networks = None
+
+    @classmethod
+    def from_row(cls, row: Sequence[str]) -> "Peer":
+        """Build from a `wg show dump` peer line split into columns."""
+        return cls(
+            public_key=row[0],
+            has_preshared_key=row[1] != "(none)",
+            endpoint=None if row[2] == "(none)" else row[2],
+            allowed_ips=() if row[3] == "(none)" else tuple(row[3].split(",")),
+            latest_handshake=int(row[4]),
+            rx_bytes=int(row[5]),
+            tx_bytes=int(row[6]),
+            persistent_keepalive=0 if row[7] == "off" else int(row[7]),
+        )
+
+    def replace(self, **changes) -> "Peer":
+        values = {f: getattr(self, f) for f in PEER_FIELDS}
+        values.update(changes)
+        return Peer(**values)
+
+    def networks(self):
+        if self._networks is None:
+            nets = []
+            for ip in self.allowed_ips:
+                try:
+                    nets.append(ipaddress.ip_network(ip, strict=False))
+                except ValueError:
+                    pass
+            self._networks = tuple(nets)
+        return self._networks
+
+    def to_dict(self, fields: Sequence[str] = PEER_FIELDS) -> Dict[str, Any]:
+        return {f: _jsonable(getattr(self, f)) for f in fields}
+
+    def to_list(self, fields: Sequence[str] = PEER_FIELDS) -> List[Any]:
+        return [_jsonable(getattr(self, f)) for f in fields]
+
+
+def _jsonable(value):
+    return list(value) if isinstance(value, tuple) else value
+
+
+def parse_fields(fields) -> Tuple[str, ...]:
+    """Accept "a,b" or ["a", "b"]; raise ValueError on unknown names."""
+    if not fields:
+        return PEER_FIELDS
+    if isinstance(fields, str):
+        fields = fields.split(",")
+    fields = tuple(f.strip() for f in fields if f.strip())
+    unknown = [f for f in fields if f not in PEER_FIELDS]
+    if unknown:
+        raise ValueError(f"unknown field(s): {', '.join(unknown)}; valid: {', '.join(PEER_FIELDS)}")
+    return fields
+
+
+def build_filter(active_since: Optional[int] = None, allowed_ip: Optional[str] = None):
+    """Return a predicate over Peer, or None when no filter was asked for."""
+    checks = []
+    if active_since is not None:
+        since = int(active_since)
+        checks.append(lambda p: p.latest_handshake >= since)
+    if allowed_ip:
+        target = ipaddress.ip_network(allowed_ip, strict=False)
+        # an address matches the peer routing it; a prefix matches every peer overlapping it
+        checks.append(lambda p: any(n.version == target.version and n.overlaps(target)
+                                    for n in p.networks()))
+    if not checks:
+        return None
+    if len(checks) == 1:
+        return checks[0]
+    return lambda p: all(check(p) for check in checks)
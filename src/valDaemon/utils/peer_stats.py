@@ -0,0 +1,345 @@
+import heapq
+import os
+import threading
+import time
+from array import array
+from operator import add, attrgetter
+from typing import Any, Dict, List, Optional, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # the daemon image does not ship numpy; top-N falls back to array/map
+    np = None
+
+from valDaemon.utils.events import feed
+from valDaemon.utils.metrics import family
+from valDaemon.utils.wg_service import cache
+
+# seconds between samples, at most the finest tier's step; 0 = off
+DEFAULT_INTERVAL = float(os.environ.get("VALDAEMON_STATS_INTERVAL", "10"))
+# step:rows per tier, finest first. Every tier costs 12 bytes per peer per row.
+DEFAULT_TIERS = os.environ.get("VALDAEMON_STATS_TIERS", "10:60,60:60,3600:24")
+TOP_BY = ("rx", "tx", "total")
+_RX, _TX, _HS = attrgetter("rx_bytes"), attrgetter("tx_bytes"), attrgetter("latest_handshake")
+
+
+def parse_tiers(spec: str) -> List[Tuple[int, int]]:
+    tiers = []
+    for part in spec.split(","):
+        step, rows = part.split(":")
+        tiers.append((int(step), int(rows)))
+    tiers.sort()
+    if not tiers or any(s <= 0 or r <= 0 for s, r in tiers):
+        raise ValueError(f"bad stats tiers: {spec}")
+    for (step, rows), (coarse, _) in zip(tiers, tiers[1:]):
+        # each tier is built from the one below, which must hold a whole bucket of it
+        if coarse % step or step * rows < coarse:
+            raise ValueError(f"bad stats tiers: {spec}: {coarse}s buckets need whole {step}s buckets to cover them")
+    return tiers
+
+
+def _delta(cur: int, prev: int) -> int:
+    # counters restart from zero when a peer is removed and added back
+    return cur - prev if cur >= prev else cur
+
+
+def _grow(arr: array, n: int) -> array:
+    if len(arr) < n:
+        arr.frombytes(bytes(arr.itemsize * (n - len(arr))))
+    return arr
+
+
+class Tier:
+    """
+    A ring of `rows` buckets of `step` seconds. Each bucket is one column
+    per peer slot: average rx and tx bytes/s as float32, and the latest
+    handshake seen during the bucket as uint32.
+    """
+    __slots__ = ("step", "rows", "ring", "head", "bucket", "acc_rx", "acc_tx", "acc_hs")
+
+    def __init__(self, step: int, rows: int):
+        self.step = step
+        self.rows = rows
+        self.ring: List[Optional[Tuple[int, array, array, array]]] = [None] * rows
+        self.head = 0
+        # start of the bucket being filled
+        self.bucket = None
+        self.acc_rx, self.acc_tx, self.acc_hs = array("d"), array("d"), array("I")
+
+    def push(self, bucket: int, rx: array, tx: array, hs: array):
+        self.ring[self.head] = (bucket, rx, tx, hs)
+        self.head = (self.head + 1) % self.rows
+
+    def add(self, now: float, rx: array, tx: array, hs: array) -> Optional[int]:
+        """
+        Fold one sample's byte deltas into the current bucket. Returns the
+        start of the bucket this closed, if the clock moved past it.
+        """
+        bucket = int(now // self.step) * self.step
+        closed = None
+        if bucket != self.bucket:
+            if self.bucket is not None:
+                step = float(self.step)
+                self.push(self.bucket, array("f", [v / step for v in self.acc_rx]),
+                          array("f", [v / step for v in self.acc_tx]), self.acc_hs)
+                closed = self.bucket
+            self.bucket = bucket
+            self.acc_rx, self.acc_tx, self.acc_hs = rx, tx, hs
+            return closed
+        n = len(rx)
+        for acc in (self.acc_rx, self.acc_tx, self.acc_hs):
+            _grow(acc, n)
+        self.acc_rx = array("d", map(add, self.acc_rx, rx))
+        self.acc_tx = array("d", map(add, self.acc_tx, tx))
+        self.acc_hs = array("I", map(max, self.acc_hs, hs))
+        return None
+
+    def roll_up(self, finer: "Tier", closed: int) -> Optional[int]:
+        """
+        Called when `finer` closed the bucket starting at `closed`. Once that
+        bucket belongs to a later one of ours, our current bucket is built from
+        the finer buckets inside it. Returns the start of the bucket this closed.
+        """
+        bucket = closed // self.step * self.step
+        if self.bucket is None:
+            self.bucket = bucket
+        if bucket == self.bucket:
+            return None
+        start, self.bucket = self.bucket, bucket
+        rows = list(finer.buckets(start, start + self.step - 1))
+        if not rows:
+            return None
+        n = max(len(r[1]) for r in rows)
+        rx, tx, hs = array("d", bytes(8 * n)), array("d", bytes(8 * n)), array("I", bytes(4 * n))
+        for _, r, t, h in rows:
+            rx = array("d", map(add, rx, r)) + rx[len(r):]
+            tx = array("d", map(add, tx, t)) + tx[len(t):]
+            hs = array("I", map(max, hs, h)) + hs[len(h):]
+        scale = finer.step / self.step
+        self.push(start, array("f", [v * scale for v in rx]), array("f", [v * scale for v in tx]), hs)
+        return start
+
+    def buckets(self, start: float = 0, end: float = float("inf")):
+        """Closed buckets overlapping [start, end], oldest first."""
+        for i in range(self.rows):
+            row = self.ring[(self.head + i) % self.rows]
+            if row is not None and row[0] + self.step > start and row[0] <= end:
+                yield row
+
+    def oldest(self) -> Optional[int]:
+        for row in self.buckets():
+            return row[0]
+        return None
+
+
+class InterfaceSeries:
+    """
+    Every peer on one interface gets a slot: its column in each tier. Slots
+    of peers that disappear are reused only once their data has aged out
+    of the coarsest tier, so a new peer never inherits someone else's history.
+    """
+    def __init__(self, tiers: List[Tuple[int, int]]):
+        self.tiers = [Tier(step, rows) for step, rows in tiers]
+        self.retention = max(step * rows for step, rows in tiers)
+        self.slots: Dict[str, int] = {}
+        self.keys: List[Optional[str]] = []
+        self.retired: Dict[int, float] = {}
+        self.prev_rx, self.prev_tx, self.prev_hs = array("Q"), array("Q"), array("I")
+        self.sampled_at = None
+
+    def _slot(self, key: str, now: float) -> int:
+        # retired is in retirement order, so only the first entry can be old enough
+        oldest = next(iter(self.retired.items()), None)
+        if oldest is not None and now - oldest[1] > self.retention:
+            slot = oldest[0]
+            del self.retired[slot]
+            del self.slots[self.keys[slot]]
+        else:
+            slot = len(self.keys)
+            self.keys.append(None)
+        self.keys[slot] = key
+        self.slots[key] = slot
+        return slot
+
+    def sample(self, now: float, peers, changes: bool = False) -> Optional[List[List[Any]]]:
+        """
+        Fold one dump into the tiers. With `changes`, also returns
+        [key, rx/s, tx/s, latest_handshake] for every peer that moved traffic
+        or handshook since the previous sample.
+        """
+        n_before = len(self.keys)
+        get = self.slots.get
+        slots = [get(p.public_key) for p in peers]
+        fresh = []
+        for i, slot in enumerate(slots):
+            if slot is None:
+                slots[i] = slot = self._slot(peers[i].public_key, now)
+                fresh.append(slot)
+        n = len(self.keys)
+        if slots == list(range(n)):
+            # the dump lists every slot in order: no scatter needed
+            rx = array("Q", map(_RX, peers))
+            tx = array("Q", map(_TX, peers))
+            hs = array("I", map(_HS, peers))
+        else:
+            rx, tx, hs = array("Q", bytes(8 * n)), array("Q", bytes(8 * n)), array("I", bytes(4 * n))
+            for slot, p in zip(slots, peers):
+                rx[slot], tx[slot], hs[slot] = p.rx_bytes, p.tx_bytes, p.latest_handshake
+        prev_rx, prev_tx = _grow(self.prev_rx, n), _grow(self.prev_tx, n)
+        for slot in fresh:
+            # first sighting: the counters so far are not traffic from this interval
+            prev_rx[slot], prev_tx[slot] = rx[slot], tx[slot]
+        d_rx = array("d", map(_delta, rx, prev_rx))
+        d_tx = array("d", map(_delta, tx, prev_tx))
+        self.prev_rx, self.prev_tx = rx, tx
+        changed = None
+        if changes:
+            keys, prev_hs = self.keys, _grow(self.prev_hs, n)
+            elapsed = now - self.sampled_at if self.sampled_at and now > self.sampled_at else 1.0
+            changed = [[keys[i], round(r / elapsed, 1), round(t / elapsed, 1), h]
+                       for i, (r, t, h, ph) in enumerate(zip(d_rx, d_tx, hs, prev_hs)) if r or t or h != ph]
+        self.prev_hs, self.sampled_at = hs, now
+
+        seen = set(slots)
+        for slot in self.retired.keys() & seen:
+            del self.retired[slot]
+        # slots appended this round are all seen; anything else unseen and not yet retired just went away
+        if n_before - (len(seen) - (n - n_before)) > len(self.retired):
+            for slot in range(n_before):
+                if slot not in seen and slot not in self.retired:
+                    self.retired[slot] = now
+
+        closed = self.tiers[0].add(now, d_rx, d_tx, hs)
+        for finer, tier in zip(self.tiers, self.tiers[1:]):
+            if closed is None:
+                break
+            closed = tier.roll_up(finer, closed)
+        return changed
+
+    def pick(self, start: float) -> Tier:
+        """The finest tier that still holds data from `start`."""
+        for tier in self.tiers:
+            oldest = tier.oldest()
+            if oldest is not None and oldest <= start:
+                return tier
+        # nothing reaches back that far: the tier with the oldest data
+        return min(self.tiers, key=lambda t: t.oldest() if t.oldest() is not None else float("inf"))
+
+
+class PeerStats:
+    """
+    Per-peer traffic and handshake history, sampled from one peer dump per
+    interface every `interval` seconds and kept at decreasing resolution
+    (10 s for 10 minutes, 1 min for an hour, 1 h for a day by default).
+    Storage is columnar, in flat arrays of 12 bytes per peer per bucket, so
+    100k peers cost about 175 MB with the default tiers; adjust
+    VALDAEMON_STATS_TIERS to trade history for memory.
+    """
+    def __init__(self, interval: float = DEFAULT_INTERVAL, tiers: str = DEFAULT_TIERS):
+        self.interval = interval
+        self.tiers = parse_tiers(tiers)
+        self.series: Dict[str, InterfaceSeries] = {}
+        self.last_sample = None
+        self.sample_seconds = 0.0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+
+    def sample(self, now: float = None):
+        start = time.perf_counter()
+        now = time.time() if now is None else now
+        res = cache.interfaces(fresh=True)
+        names = [i.get("ifname") if isinstance(i, dict) else i for i in res.get("interfaces", [])]
+        watched = feed.watched()
+        for ifname in filter(None, names):
+            dump = cache.peers(ifname, fresh=True)
+            if dump.get("status") != "success":
+                continue
+            with self._lock:
+                series = self.series.get(ifname)
+                if series is None:
+                    series = self.series[ifname] = InterfaceSeries(self.tiers)
+                changed = series.sample(now, dump["peers"], changes=watched)
+            if changed:
+                feed.traffic(ifname, self.interval, changed)
+        with self._lock:
+            for ifname in [n for n in self.series if n not in names]:
+                del self.series[ifname]
+            self.last_sample = now
+            self.sample_seconds = time.perf_counter() - start
+
+    def peer(self, ifname: str, public_key: str, start: float = None, end: float = None) -> Dict[str, Any]:
+        now = time.time()
+        end = now if end is None else end
+        start = end - 3600 if start is None else start
+        with self._lock:
+            series = self.series.get(ifname)
+            slot = series.slots.get(public_key) if series is not None else None
+            if slot is None:
+                return {"status":"error","message":f"no stats for peer {public_key} on {ifname}"}
+            tier = series.pick(start)
+            points = [[t, round(rx[slot], 1) if slot < len(rx) else None,
+                       round(tx[slot], 1) if slot < len(tx) else None,
+                       hs[slot] if slot < len(hs) else None]
+                      for t, rx, tx, hs in tier.buckets(start, end)]
+        return {"status":"success", "interface": ifname, "public_key": public_key, "step": tier.step,
+                "fields": ["time", "rx_bytes_per_sec", "tx_bytes_per_sec", "latest_handshake"],
+                "points": points}
+
+    def top(self, ifname: str, by: str = "total", window: float = 3600, limit: int = 10) -> Dict[str, Any]:
+        """The `limit` peers that moved the most bytes over the last `window` seconds."""
+        if by not in TOP_BY:
+            return {"status":"error","message":f"by must be one of: {', '.join(TOP_BY)}"}
+        end = time.time()
+        with self._lock:
+            series = self.series.get(ifname)
+            if series is None:
+                return {"status":"error","message":f"no stats for {ifname}"}
+            tier = series.pick(end - window)
+            rows = list(tier.buckets(end - window, end))
+            keys = list(series.keys)
+        cols = [c for _, rx, tx, _ in rows for c in ((rx,) if by == "rx" else (tx,) if by == "tx" else (rx, tx))]
+        n = len(keys)
+        if np is not None:
+            totals = np.zeros(n)
+            for col in cols:
+                totals[:len(col)] += np.frombuffer(col, dtype=np.float32)
+            totals *= tier.step
+            top = np.argpartition(-totals, limit - 1)[:limit] if limit < n else np.arange(n)
+            best = sorted(((float(totals[i]), int(i)) for i in top), reverse=True)
+        else:
+            totals = array("d", bytes(8 * n))
+            for col in cols:
+                totals = array("d", map(add, totals, col)) + totals[len(col):]
+            best = [(v * tier.step, i) for i, v in heapq.nlargest(limit, enumerate(totals), key=lambda kv: kv[1])]
+        peers = [{"public_key": keys[i], "bytes": round(v)} for v, i in best if v > 0 and keys[i] is not None]
+        return {"status":"success", "interface": ifname, "by": by, "window": window, "step": tier.step,
+                "peers": peers}
+
+    def start(self):
+        if not self.interval:
+            return
+
+        def _loop():
+            # on interval boundaries, so a slow sample does not make a bucket miss its turn
+            while not self._stop.wait(self.interval - time.time() % self.interval):
+                try:
+                    self.sample()
+                except Exception as e:
+                    print(f"[valDaemon] Peer stats sample failed: {e}")
+        threading.Thread(target=_loop, name="valdaemon-peer-stats", daemon=True).start()
+
+    def stop(self):
+        self._stop.set()
+
+
+stats = PeerStats()
+
+
+def stats_metrics() -> List[str]:
+    with stats._lock:
+        series = list(stats.series.items())
+        seconds = stats.sample_seconds
+    return (family("valdaemon_peer_stats_slots", "gauge", "Peer slots held by the traffic history.",
+                   [({"interface": k}, len(s.keys)) for k, s in sorted(series)])
+            + family("valdaemon_peer_stats_sample_seconds", "gauge", "Time taken by the last history sample.",
+                     [({}, seconds)]))
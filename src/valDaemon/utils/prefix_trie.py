@@ -0,0 +1,210 @@
+import socket
+from typing import Any, Container, Iterable, List, Optional, Tuple
+
+
+class _Node:
+    __slots__ = ("key", "plen", "owner", "zero", "one")
+
+    def __init__(self, key: int, plen: int, owner: Any = None):
+        self.key = key
+        self.plen = plen
+        self.owner = owner
+        self.zero = None
+        self.one = None
+
+
+class PrefixTrie:
+    """
+    Path-compressed binary (Patricia) trie mapping `width`-bit prefixes to an
+    owner. Only prefixes and branch points get a node, so memory is O(n)
+    rather than O(n * width), while insert, remove, longest-prefix match and
+    overlap checks touch at most `width` nodes.
+    """
+    def __init__(self, width: int):
+        self.width = width
+        self.root = _Node(0, 0)
+        self.size = 0
+
+    def _bit(self, key: int, pos: int) -> int:
+        return (key >> (self.width - 1 - pos)) & 1
+
+    def _mask(self, plen: int) -> int:
+        return ((1 << plen) - 1) << (self.width - plen)
+
+    def _covers(self, node: _Node, key: int) -> bool:
+        return (key ^ node.key) >> (self.width - node.plen) == 0
+
+    @staticmethod
+    def _child(node: _Node, bit: int) -> Optional[_Node]:
+        return node.one if bit else node.zero
+
+    @staticmethod
+    def _link(node: _Node, bit: int, child: Optional[_Node]):
+        if bit:
+            node.one = child
+        else:
+            node.zero = child
+
+    def insert(self, key: int, plen: int, owner: Any) -> Any:
+        """Set the owner of key/plen; returns the previous owner (None if new)."""
+        key &= self._mask(plen)
+        node = self.root
+        while True:
+            if node.plen == plen:
+                prev, node.owner = node.owner, owner
+                if prev is None:
+                    self.size += 1
+                return prev
+            bit = self._bit(key, node.plen)
+            child = self._child(node, bit)
+            if child is None:
+                self._link(node, bit, _Node(key, plen, owner))
+                self.size += 1
+                return None
+            common = min(plen, child.plen, self.width - (key ^ child.key).bit_length())
+            if common == child.plen:
+                node = child
+                continue
+            # split the edge at the first differing bit
+            mid = _Node(key & self._mask(common), common)
+            self._link(node, bit, mid)
+            self._link(mid, self._bit(child.key, common), child)
+            if common == plen:
+                mid.owner = owner
+            else:
+                self._link(mid, self._bit(key, common), _Node(key, plen, owner))
+            self.size += 1
+            return None
+
+    def remove(self, key: int, plen: int, owner: Any = None) -> bool:
+        """Drop key/plen (only if held by `owner`, when given) and prune the path."""
+        key &= self._mask(plen)
+        path = []
+        node = self.root
+        while node is not None and node.plen < plen and self._covers(node, key):
+            path.append(node)
+            node = self._child(node, self._bit(key, node.plen))
+        if node is None or node.plen != plen or node.key != key or node.owner is None:
+            return False
+        if owner is not None and node.owner != owner:
+            return False
+        node.owner = None
+        self.size -= 1
+        # splice out ownerless nodes with fewer than two children
+        while path and node.owner is None and (node.zero is None or node.one is None):
+            parent = path.pop()
+            self._link(parent, self._bit(node.key, parent.plen), node.zero or node.one)
+            node = parent
+            if node is self.root:
+                break
+        return True
+
+    def lookup(self, key: int) -> Optional[Tuple[int, int, Any]]:
+        """Longest prefix containing the full-width address `key`: (key, plen, owner)."""
+        best = None
+        node = self.root
+        while node is not None and self._covers(node, key):
+            if node.owner is not None:
+                best = node
+            if node.plen == self.width:
+                break
+            node = self._child(node, self._bit(key, node.plen))
+        return (best.key, best.plen, best.owner) if best is not None else None
+
+    def overlaps(self, key: int, plen: int, skip: Container = (), limit: int = 8) -> List[Tuple[int, int, Any]]:
+        """
+        Prefixes overlapping key/plen, i.e. containing it or contained in it,
+        whose owner is not in `skip`. Stops after `limit` hits.
+        """
+        key &= self._mask(plen)
+        out = []
+        node = self.root
+        while node is not None and node.plen < plen:
+            if not self._covers(node, key):
+                return out
+            if node.owner is not None and node.owner not in skip:
+                out.append((node.key, node.plen, node.owner))
+                if len(out) >= limit:
+                    return out
+            node = self._child(node, self._bit(key, node.plen))
+        if node is None or (node.key ^ key) >> (self.width - plen):
+            return out
+        stack = [node]
+        while stack and len(out) < limit:
+            node = stack.pop()
+            if node.owner is not None and node.owner not in skip:
+                out.append((node.key, node.plen, node.owner))
+            if node.one is not None:
+                stack.append(node.one)
+            if node.zero is not None:
+                stack.append(node.zero)
+        return out
+
+    def __len__(self):
+        return self.size
+
+
+class AllowedIPsIndex:
+    """
+    AllowedIPs of one interface, one PrefixTrie per address family, keyed by
+    CIDR strings as WireGuard reports them ("10.8.0.7/32", "fd00::/64").
+    """
+    _FAMILIES = {4: (socket.AF_INET, 32), 6: (socket.AF_INET6, 128)}
+
+    def __init__(self):
+        self._tries = {4: PrefixTrie(32), 6: PrefixTrie(128)}
+
+    @classmethod
+    def parse(cls, cidr: str) -> Tuple[int, int, int]:
+        """(version, key, plen) for "addr[/plen]"; raises ValueError."""
+        addr, _, plen = cidr.strip().partition("/")
+        version = 6 if ":" in addr else 4
+        family, width = cls._FAMILIES[version]
+        try:
+            key = int.from_bytes(socket.inet_pton(family, addr), "big")
+        except OSError:
+            raise ValueError(f"invalid address: {cidr}")
+        if not plen:
+            return version, key, width
+        if not plen.isdigit() or int(plen) > width:
+            raise ValueError(f"invalid prefix length: {cidr}")
+        return version, key, int(plen)
+
+    @classmethod
+    def format(cls, version: int, key: int, plen: int) -> str:
+        family, width = cls._FAMILIES[version]
+        return f"{socket.inet_ntop(family, key.to_bytes(width // 8, 'big'))}/{plen}"
+
+    def add(self, cidr: str, owner: Any) -> Any:
+        version, key, plen = self.parse(cidr)
+        return self._tries[version].insert(key, plen, owner)
+
+    def remove(self, cidr: str, owner: Any = None) -> bool:
+        version, key, plen = self.parse(cidr)
+        return self._tries[version].remove(key, plen, owner)
+
+    def lookup(self, ip: str) -> Optional[Tuple[str, Any]]:
+        """(prefix, owner) of the longest prefix routing `ip`, or None."""
+        version, key, _ = self.parse(ip.partition("/")[0])
+        hit = self._tries[version].lookup(key)
+        return (self.format(version, hit[0], hit[1]), hit[2]) if hit else None
+
+    def conflicts(self, cidr: str, skip: Container = (), limit: int = 8) -> List[Tuple[str, Any]]:
+        version, key, plen = self.parse(cidr)
+        return [(self.format(version, k, p), owner)
+                for k, p, owner in self._tries[version].overlaps(key, plen, skip, limit)]
+
+    def __len__(self):
+        return sum(len(t) for t in self._tries.values())
+
+    @classmethod
+    def build(cls, items: Iterable[Tuple[Any, Iterable[str]]]) -> "AllowedIPsIndex":
+        """Index from (owner, allowed_ips) pairs; unparseable entries are skipped."""
+        index = cls()
+        for owner, allowed_ips in items:
+            for cidr in allowed_ips:
+                try:
+                    index.add(cidr, owner)
+                except ValueError:
+                    pass
+        return index
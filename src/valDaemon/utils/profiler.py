@@ -0,0 +1,92 @@
+import collections
+import os
+import re
+import sys
+import tempfile
+import threading
+import time
+from typing import Any, Dict
+
+DEFAULT_DIR = os.environ.get("VALDAEMON_PROFILE_DIR", tempfile.gettempdir())
+DEFAULT_SECONDS = 10.0
+MAX_SECONDS = 300.0
+INTERVAL = 0.005
+
+_WORKER_SUFFIX = re.compile(r"_\d+$")
+
+
+def _frame_name(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class SamplingProfiler:
+    """
+    On-demand wall-clock profiler. Samples the stack of every thread each
+    `interval` seconds and writes the counts in folded format ("a;b;c 42" per
+    line), which flamegraph.pl, speedscope and inferno read directly. Unlike
+    cProfile it sees the worker and refresher threads, not just the caller,
+    and costs nothing while idle. One profile runs at a time.
+    """
+    def __init__(self, directory: str = DEFAULT_DIR, interval: float = INTERVAL):
+        self.directory = directory
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._path = None
+
+    def start(self, seconds: float = DEFAULT_SECONDS) -> Dict[str, Any]:
+        try:
+            seconds = float(seconds)
+        except (TypeError, ValueError):
+            return {"status":"error","message":"seconds must be a number"}
+        if not 0 < seconds <= MAX_SECONDS:
+            return {"status":"error","message":f"seconds must be in (0, {MAX_SECONDS:g}]"}
+        with self._lock:
+            if self._path is not None:
+                return {"status":"error","message":f"profile already running: {self._path}"}
+            stamp = time.strftime("%Y%m%d-%H%M%S")
+            self._path = os.path.join(self.directory, f"valdaemon-profile-{stamp}-{os.getpid()}.folded")
+            path = self._path
+        threading.Thread(target=self._run, args=(seconds, path), name="valdaemon-profiler", daemon=True).start()
+        return {"status":"success","path": path, "seconds": seconds}
+
+    def _run(self, seconds: float, path: str):
+        counts = collections.Counter()
+        me = threading.get_ident()
+        names, names_at = {}, 0.0
+        deadline = time.monotonic() + seconds
+        try:
+            while True:
+                now = time.monotonic()
+                if now >= deadline:
+                    break
+                if now - names_at > 1.0:
+                    # pool threads come and go; fold valdaemon-worker_3 into valdaemon-worker
+                    names = {t.ident: _WORKER_SUFFIX.sub("", t.name) for t in threading.enumerate()}
+                    names_at = now
+                for ident, frame in sys._current_frames().items():
+                    if ident == me:
+                        continue
+                    stack = []
+                    while frame is not None:
+                        stack.append(_frame_name(frame))
+                        frame = frame.f_back
+                    stack.append(names.get(ident, "thread"))
+                    stack.reverse()
+                    counts[";".join(stack)] += 1
+                time.sleep(self.interval)
+            os.makedirs(self.directory, exist_ok=True)
+            tmp = path + ".tmp"
+            with open(tmp, "w") as f:
+                for stack, n in counts.most_common():
+                    f.write(f"{stack} {n}\n")
+            os.replace(tmp, path)
+            print(f"[valDaemon] Profile written to {path} ({sum(counts.values())} samples)")
+        except OSError as e:
+            print(f"[valDaemon] Profile failed: {e}")
+        finally:
+            with self._lock:
+                self._path = None
+
+
+profiler = SamplingProfiler()
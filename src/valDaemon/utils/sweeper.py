@@ -0,0 +1,223 @@
+import heapq
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from valDaemon.utils.metrics import family
+from valDaemon.utils.wg_service import cache
+
+# seconds without a handshake before a peer counts as idle; 0 = sweeper off
+DEFAULT_TTL = float(os.environ.get("VALDAEMON_IDLE_TTL", "0"))
+DEFAULT_INTERVAL = float(os.environ.get("VALDAEMON_IDLE_INTERVAL", "60"))
+# "flag" only reports idle peers; "evict" removes them
+DEFAULT_MODE = os.environ.get("VALDAEMON_IDLE_MODE", "flag")
+DEFAULT_BATCH = int(os.environ.get("VALDAEMON_IDLE_BATCH", "512"))
+# comma-separated interfaces to sweep; empty = all
+SWEEP_INTERFACES = [n for n in os.environ.get("VALDAEMON_IDLE_INTERFACES", "").split(",") if n]
+MODES = ("flag", "evict")
+
+
+class IdleSweeper:
+    """
+    Finds peers that have not completed a handshake for `ttl` seconds, for
+    clients (mostly mobile ones) that went away without being removed.
+
+    Every `interval` seconds each interface is read once through `dump`
+    (the peer cache, so a dump younger than its TTL, such as the stats
+    sampler's, is reused rather than repeated). A peer's expiry is its
+    latest handshake, or the first time the sweeper saw it if it never had
+    one, plus the TTL. Expiries live in a min-heap, so a sweep only touches
+    the peers whose time is up; a handshake just pushes a newer entry and
+    the outdated one is dropped when it reaches the top. The heap is rebuilt
+    when outdated entries outnumber live ones.
+
+    In "flag" mode idle peers are only reported (`idle()`, metrics). In
+    "evict" mode they are handed to `evict(ifname, [public_key, ...])` in
+    batches of `batch`; the daemon routes that through the interface's
+    mutation queue, so IPAM, the journal and the cache see a normal remove.
+    """
+    def __init__(self, dump: Callable[[str], Dict[str, Any]], interfaces: Callable[[], List[str]],
+                 ttl: float = DEFAULT_TTL, interval: float = DEFAULT_INTERVAL,
+                 mode: str = DEFAULT_MODE, batch: int = DEFAULT_BATCH):
+        self.dump = dump
+        self.interfaces = interfaces
+        self.evict: Optional[Callable[[str, List[str]], Dict[str, Any]]] = None
+        self.ttl = ttl
+        self.interval = interval
+        self.mode = mode
+        self.batch = batch
+        self._heap: List[Tuple[float, str, str]] = []
+        self._expiry: Dict[str, Dict[str, float]] = {}
+        self._first_seen: Dict[str, Dict[str, float]] = {}
+        self._idle: Dict[str, Dict[str, float]] = {}
+        self.evicted = 0
+        self.evict_errors = 0
+        self.last_sweep = None
+        self._lock = threading.Lock()
+        self._sweep_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def configure(self, ttl: float = None, mode: str = None, interval: float = None,
+                  batch: int = None) -> Dict[str, Any]:
+        if mode is not None and mode not in MODES:
+            return {"status":"error","message":f"mode must be one of: {', '.join(MODES)}"}
+        ttl = self.ttl if ttl is None else float(ttl)
+        interval = self.interval if interval is None else float(interval)
+        batch = self.batch if batch is None else int(batch)
+        if ttl < 0 or interval <= 0 or batch <= 0:
+            return {"status":"error","message":"ttl must be >= 0, interval and batch > 0"}
+        with self._lock:
+            if ttl != self.ttl:
+                # expiries were computed with the old TTL
+                self._heap, self._expiry, self._idle = [], {}, {}
+            self.ttl, self.interval, self.batch = ttl, interval, batch
+            self.mode = mode or self.mode
+        if ttl and self._thread is None:
+            self.start()
+        return self.status()
+
+    def status(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"status":"success", "ttl": self.ttl, "mode": self.mode, "interval": self.interval,
+                    "batch": self.batch, "running": self._thread is not None and self.ttl > 0,
+                    "tracked": sum(map(len, self._expiry.values())),
+                    "idle": {ifname: len(keys) for ifname, keys in self._idle.items() if keys},
+                    "evicted": self.evicted, "evict_errors": self.evict_errors,
+                    "last_sweep": self.last_sweep}
+
+    def idle(self, ifname: str = None) -> Dict[str, List[Dict[str, Any]]]:
+        """Idle peers per interface, longest idle first, with the time they were last active."""
+        with self._lock:
+            names = [ifname] if ifname is not None else list(self._idle)
+            return {name: [{"public_key": key, "last_active": last}
+                           for key, last in sorted(self._idle.get(name, {}).items(), key=lambda kv: kv[1])]
+                    for name in names}
+
+    # ---- sweeping ----
+    def _observe(self, ifname: str, peers, now: float):
+        expiry, first_seen, idle = {}, self._first_seen.get(ifname, {}), self._idle.get(ifname, {})
+        old = self._expiry.get(ifname, {})
+        seen = {}
+        for p in peers:
+            key = p.public_key
+            last = p.latest_handshake
+            if not last:
+                last = seen[key] = first_seen.get(key, now)
+            exp = last + self.ttl
+            expiry[key] = exp
+            if old.get(key) != exp:
+                heapq.heappush(self._heap, (exp, ifname, key))
+                idle.pop(key, None)
+        self._expiry[ifname] = expiry
+        self._first_seen[ifname] = seen
+        # peers removed since the last dump drop out here
+        self._idle[ifname] = {k: v for k, v in idle.items() if k in expiry}
+
+    def _expired(self, now: float) -> Dict[str, List[str]]:
+        due: Dict[str, List[str]] = {}
+        heap = self._heap
+        while heap and heap[0][0] <= now:
+            exp, ifname, key = heapq.heappop(heap)
+            if self._expiry.get(ifname, {}).get(key) != exp:
+                continue  # handshake since, or peer gone
+            self._idle.setdefault(ifname, {})[key] = exp - self.ttl
+            due.setdefault(ifname, []).append(key)
+        live = sum(map(len, self._expiry.values()))
+        if len(heap) > 2 * live + 1024:
+            self._heap = [(exp, ifname, key) for ifname, keys in self._expiry.items()
+                          for key, exp in keys.items() if key not in self._idle.get(ifname, ())]
+            heapq.heapify(self._heap)
+        return due
+
+    def sweep(self, now: float = None) -> Dict[str, Any]:
+        """One pass: dump every interface, update expiries, then flag or evict what is due."""
+        if not self.ttl:
+            return {"status":"error","message":"idle sweeper is off (ttl 0)"}
+        with self._sweep_lock:
+            start = time.perf_counter()
+            now = time.time() if now is None else now
+            names = self.interfaces()
+            with self._lock:
+                for ifname in list(self._expiry):
+                    if ifname not in names:
+                        for table in (self._expiry, self._first_seen, self._idle):
+                            table.pop(ifname, None)
+            for ifname in names:
+                res = self.dump(ifname)
+                if res.get("status") != "success":
+                    continue
+                with self._lock:
+                    self._observe(ifname, res["peers"], now)
+            with self._lock:
+                due = self._expired(now)
+                mode = self.mode
+            evicted = self._evict_idle() if mode == "evict" and self.evict is not None else 0
+            with self._lock:
+                self.last_sweep = now
+                flagged = sum(map(len, self._idle.values()))
+            return {"status":"success", "interfaces": len(names), "newly_idle": sum(map(len, due.values())),
+                    "idle": flagged, "evicted": evicted, "seconds": round(time.perf_counter() - start, 4)}
+
+    def _evict_idle(self) -> int:
+        with self._lock:
+            pending = {ifname: list(keys) for ifname, keys in self._idle.items() if keys}
+        evicted = 0
+        for ifname, keys in pending.items():
+            for i in range(0, len(keys), self.batch):
+                chunk = keys[i:i + self.batch]
+                res = self.evict(ifname, chunk)
+                results = res.get("results") or [res] * len(chunk)
+                gone = [key for key, r in zip(chunk, results) if r.get("status") == "success"]
+                with self._lock:
+                    idle, expiry = self._idle.get(ifname, {}), self._expiry.get(ifname, {})
+                    for key in gone:
+                        idle.pop(key, None)
+                        expiry.pop(key, None)
+                    self.evicted += len(gone)
+                    self.evict_errors += len(chunk) - len(gone)
+                evicted += len(gone)
+        return evicted
+
+    def start(self):
+        if self._thread is not None:
+            return
+
+        def _loop():
+            while not self._stop.wait(self.interval):
+                if not self.ttl:
+                    continue
+                try:
+                    self.sweep()
+                except Exception as e:
+                    print(f"[valDaemon] Idle sweep failed: {e}")
+        self._thread = threading.Thread(target=_loop, name="valdaemon-idle-sweeper", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+
+def _interface_names() -> List[str]:
+    res = cache.interfaces()
+    names = [i.get("ifname") if isinstance(i, dict) else i for i in res.get("interfaces", [])]
+    return [n for n in names if n and (not SWEEP_INTERFACES or n in SWEEP_INTERFACES)]
+
+
+sweeper = IdleSweeper(cache.peers, _interface_names)
+
+
+def sweeper_metrics() -> List[str]:
+    if not sweeper.ttl:
+        return []
+    status = sweeper.status()
+    lines = []
+    lines += family("valdaemon_idle_peers", "gauge",
+                    "Peers without a handshake for longer than the idle TTL.",
+                    [({"interface": k}, n) for k, n in sorted(status["idle"].items())])
+    lines += family("valdaemon_idle_peers_evicted_total", "counter",
+                    "Idle peers removed by the sweeper.", [({}, status["evicted"])])
+    lines += family("valdaemon_idle_peers_evict_errors_total", "counter",
+                    "Idle peers the sweeper failed to remove.", [({}, status["evict_errors"])])
+    return lines
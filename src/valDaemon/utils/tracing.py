@@ -0,0 +1,151 @@
+import contextlib
+import contextvars
+import json
+import os
+import sys
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+DEFAULT_OUTPUT = os.environ.get("VALDAEMON_TRACE", "")
+DEFAULT_SLOW_MS = float(os.environ.get("VALDAEMON_TRACE_SLOW_MS", "0"))
+
+_current: contextvars.ContextVar = contextvars.ContextVar("valdaemon_trace", default=None)
+_NULL = contextlib.nullcontext()
+
+
+class Trace:
+    """Spans of one request, as offsets from its start in milliseconds."""
+    __slots__ = ("request_id", "action", "start", "spans", "status")
+
+    def __init__(self):
+        self.request_id = None
+        self.action = None
+        self.start = time.perf_counter()
+        self.spans: List[Dict[str, Any]] = []
+        self.status = None
+
+    @contextlib.contextmanager
+    def span(self, name: str, **attrs):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            t1 = time.perf_counter()
+            entry = {"name": name, "at_ms": round((t0 - self.start) * 1000, 3),
+                     "ms": round((t1 - t0) * 1000, 3)}
+            if attrs:
+                entry.update(attrs)
+            self.spans.append(entry)
+
+
+class TraceGroup:
+    """Several traced requests served by one piece of work, e.g. a coalesced batch; each gets its spans."""
+    __slots__ = ("traces",)
+
+    def __init__(self, traces: List[Trace]):
+        self.traces = traces
+
+    @contextlib.contextmanager
+    def span(self, name: str, **attrs):
+        with contextlib.ExitStack() as stack:
+            for trace in self.traces:
+                stack.enter_context(trace.span(name, **attrs))
+            yield
+
+
+def span(trace: Optional[Trace], name: str, **attrs):
+    """trace.span(...) or a no-op when tracing is off."""
+    return trace.span(name, **attrs) if trace is not None else _NULL
+
+
+def current_span(name: str, **attrs):
+    """A span on the request being handled by this thread, if it is traced."""
+    trace = _current.get()
+    return trace.span(name, **attrs) if trace is not None else _NULL
+
+
+def current() -> Optional[Trace]:
+    """The trace made current in this thread by activate(), if any."""
+    return _current.get()
+
+
+def group(traces: List[Optional[Trace]]):
+    """One trace standing for all of `traces` (None when none of them is traced)."""
+    traces = [t for t in traces if t is not None]
+    if len(traces) < 2:
+        return traces[0] if traces else None
+    return TraceGroup(traces)
+
+
+@contextlib.contextmanager
+def activate(trace: Optional[Trace]):
+    """Make `trace` the current one in this thread, so deeper layers can add spans."""
+    if trace is None:
+        yield
+        return
+    token = _current.set(trace)
+    try:
+        yield
+    finally:
+        _current.reset(token)
+
+
+class Tracer:
+    """
+    Optional per-request tracing. When enabled, every request gets a Trace
+    and, once answered, one JSON line: request id (as sent by the client),
+    action, status, total time and the parse / dispatch / backend /
+    serialize spans. Only requests slower than `slow_ms` are written. Output
+    is a file path, or "-" for stderr; an empty output disables tracing.
+    """
+    def __init__(self, output: str = DEFAULT_OUTPUT, slow_ms: float = DEFAULT_SLOW_MS):
+        self._lock = threading.Lock()
+        self._stream = None
+        self.output = ""
+        self.slow_ms = slow_ms
+        self.configure(output=output)
+
+    @property
+    def enabled(self) -> bool:
+        return self._stream is not None
+
+    def configure(self, output: str = None, slow_ms: float = None, enabled: bool = None) -> Dict[str, Any]:
+        if enabled is False:
+            output = ""
+        elif enabled and output is None and not self.output:
+            output = "-"
+        with self._lock:
+            if slow_ms is not None:
+                self.slow_ms = float(slow_ms)
+            if output is not None and output != self.output:
+                if self._stream is not None and self._stream is not sys.stderr:
+                    self._stream.close()
+                self._stream = None
+                if output == "-":
+                    self._stream = sys.stderr
+                elif output:
+                    self._stream = open(output, "a", buffering=1)
+                self.output = output
+        return {"status": "success", "enabled": self.enabled, "output": self.output, "slow_ms": self.slow_ms}
+
+    def begin(self) -> Optional[Trace]:
+        return Trace() if self._stream is not None else None
+
+    def finish(self, trace: Optional[Trace], status: str = None):
+        if trace is None:
+            return
+        total = (time.perf_counter() - trace.start) * 1000
+        if total < self.slow_ms:
+            return
+        line = json.dumps({"ts": round(time.time(), 6), "request_id": trace.request_id, "action": trace.action,
+                           "status": status or trace.status, "ms": round(total, 3), "spans": trace.spans})
+        with self._lock:
+            if self._stream is not None:
+                try:
+                    self._stream.write(line + "\n")
+                except (OSError, ValueError):
+                    pass
+
+
+tracer = Tracer()
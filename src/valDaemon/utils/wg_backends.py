@@ -0,0 +1,469 @@
+import binascii
+import ipaddress
+import os
+import re
+import shutil
+import subprocess
+import threading
+import time
+from socket import AF_INET, AF_INET6, inet_pton
+from typing import Dict, Any, List, Optional
+
+from valDaemon.utils.netlink import sessions
+
+try:
+    from pyroute2.netlink import NLM_F_ACK, NLM_F_REQUEST
+    from pyroute2.netlink.generic.wireguard import WG_CMD_SET_DEVICE, WG_GENL_VERSION, wgmsg
+except ImportError:  # pragma: no cover - only needed by the netlink backend
+    wgmsg = None
+
+CAP_NET_ADMIN = 12
+# Peers per WG_CMD_SET_DEVICE message / `wg set` invocation. Keeps netlink
+# messages well under the socket send buffer and argv under ARG_MAX.
+PEERS_PER_MESSAGE = 512
+
+# WGPEER_A_FLAGS bits (include/uapi/linux/wireguard.h)
+WGPEER_F_REMOVE_ME = 1
+WGPEER_F_REPLACE_ALLOWEDIPS = 2
+
+# Column order of `wg show <if> dump` peer lines; every backend reports peers as
+# rows in this order so callers do not care where they came from.
+DUMP_COLUMNS = ("public_key", "preshared_key", "endpoint", "allowed_ips",
+                "latest_handshake", "rx_bytes", "tx_bytes", "persistent_keepalive")
+
+
+def has_net_admin() -> bool:
+    """True if the effective capability set carries CAP_NET_ADMIN (always true for root)."""
+    if os.geteuid() == 0:
+        return True
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("CapEff:"):
+                    return bool(int(line.split()[1], 16) & (1 << CAP_NET_ADMIN))
+    except Exception:
+        pass
+    return False
+
+
+def split_allowed_ips(allowed_ips: str) -> List[str]:
+    return [ip.strip() for ip in allowed_ips.split(",") if ip.strip()]
+
+
+class WireGuardBackend:
+    """
+    What valDaemon needs from WireGuard. Every call returns a dict with
+    "status" ("success" or "error", with a "message") and never raises.
+
+    - create_interface / delete_interface(ifname): add (and bring up) or
+      remove a wireguard link.
+    - list_interfaces(): "interfaces": [{"index", "ifname", "state"}].
+    - dump_peers(ifname): "rows", one list of strings per peer in
+      DUMP_COLUMNS order, formatted like `wg show <if> dump`.
+    - add_peer / remove_peer(ifname, public_key[, allowed_ips]): one peer;
+      allowed_ips is a comma-separated string.
+    - set_peers(ifname, specs): up to PEERS_PER_MESSAGE peers at once. A spec
+      is {"public_key", "remove"} or {"public_key", "allowed_ips": [cidr, ...],
+      "endpoint": (host, port), "persistent_keepalive"}, optional keys None
+      or absent to leave them unchanged.
+
+    allowed_ips always replaces the peer's whole list, as `wg set ...
+    allowed-ips` does; callers send the full list, never a delta.
+    """
+    name = "base"
+
+    def create_interface(self, ifname: str) -> Dict[str, Any]:
+        raise NotImplementedError
+
+    def delete_interface(self, ifname: str) -> Dict[str, Any]:
+        raise NotImplementedError
+
+    def list_interfaces(self) -> Dict[str, Any]:
+        raise NotImplementedError
+
+    def dump_peers(self, ifname: str) -> Dict[str, Any]:
+        raise NotImplementedError
+
+    def add_peer(self, ifname: str, public_key: str, allowed_ips: str) -> Dict[str, Any]:
+        return self.set_peers(ifname, [{"public_key": public_key, "allowed_ips": split_allowed_ips(allowed_ips)}])
+
+    def remove_peer(self, ifname: str, public_key: str) -> Dict[str, Any]:
+        return self.set_peers(ifname, [{"public_key": public_key, "remove": True}])
+
+    def set_peers(self, ifname: str, specs: List[Dict[str, Any]]) -> Dict[str, Any]:
+        raise NotImplementedError
+
+
+class NetlinkBackend(WireGuardBackend):
+    """
+    Talks rtnetlink / WireGuard generic netlink directly through the shared
+    per-thread sessions. Needs CAP_NET_ADMIN for mutations but not root, so the
+    daemon can run unprivileged with e.g. systemd AmbientCapabilities.
+    """
+    name = "netlink"
+
+    def create_interface(self, ifname: str) -> Dict[str, Any]:
+        def _create(ipr):
+            ipr.link("add", ifname=ifname, kind="wireguard")
+            idx = ipr.link_lookup(ifname=ifname)
+            if idx:
+                ipr.link("set", index=idx[0], state="up")
+        try:
+            sessions.iproute(_create)
+            return {"status": "success", "message": f"Interface {ifname} created (netlink)"}
+        except Exception as e:
+            return {"status": "error", "message": f"netlink create failed: {e}"}
+
+    def delete_interface(self, ifname: str) -> Dict[str, Any]:
+        try:
+            idx = sessions.iproute(lambda ipr: ipr.link_lookup(ifname=ifname))
+            if not idx:
+                return {"status": "error", "message": f"{ifname} not found"}
+            sessions.iproute(lambda ipr: ipr.link("del", index=idx[0]))
+            return {"status": "success", "message": f"Interface {ifname} deleted (netlink)"}
+        except Exception as e:
+            return {"status": "error", "message": f"netlink delete failed: {e}"}
+
+    def list_interfaces(self) -> Dict[str, Any]:
+        try:
+            links = sessions.iproute(lambda ipr: ipr.get_links())
+            wg_links = []
+            for link in links:
+                linkinfo = link.get_attr("IFLA_LINKINFO")
+                info_kind = linkinfo.get_attr("IFLA_INFO_KIND") if linkinfo else None
+                if info_kind == "wireguard":
+                    wg_links.append({
+                        "index": link["index"],
+                        "ifname": link.get_attr("IFLA_IFNAME"),
+                        "state": link.get_attr("IFLA_OPERSTATE")
+                    })
+            return {"status": "success", "interfaces": wg_links}
+        except Exception as e:
+            return {"status": "error", "message": f"list_interfaces error: {e}"}
+
+    def dump_peers(self, ifname: str) -> Dict[str, Any]:
+        try:
+            msgs = sessions.wireguard(lambda wg: wg.info(ifname))
+        except Exception as e:
+            return {"status": "error", "message": f"netlink dump failed: {e}"}
+        rows = []
+        for msg in msgs:
+            for peer in msg.get_attr("WGDEVICE_A_PEERS") or []:
+                rows.append(_peer_row(peer))
+        return {"status": "success", "rows": rows}
+
+    def set_peers(self, ifname: str, specs: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Apply up to PEERS_PER_MESSAGE peer specs in a single WG_CMD_SET_DEVICE message."""
+        try:
+            sessions.wireguard(lambda wg: _set_peers(wg, ifname, specs))
+            return {"status": "success"}
+        except Exception as e:
+            return {"status": "error", "message": f"netlink set failed: {e}"}
+
+
+def _allowed_ip(cidr: str) -> Dict[str, Any]:
+    net = ipaddress.ip_network(cidr, strict=False)
+    family = AF_INET6 if net.version == 6 else AF_INET
+    # pyroute2 types the address as raw bytes ("hex"); text would go out as ASCII
+    return {"attrs": [["WGALLOWEDIP_A_FAMILY", family],
+                      ["WGALLOWEDIP_A_IPADDR", inet_pton(family, str(net.network_address))],
+                      ["WGALLOWEDIP_A_CIDR_MASK", net.prefixlen]]}
+
+
+def _wg_peer(spec: Dict[str, Any]) -> Dict[str, Any]:
+    """One nested WGDEVICE_A_PEERS entry, attributes as in include/uapi/linux/wireguard.h."""
+    attrs = [["WGPEER_A_PUBLIC_KEY", spec["public_key"]]]
+    if spec.get("remove"):
+        attrs.append(["WGPEER_A_FLAGS", WGPEER_F_REMOVE_ME])
+        return {"attrs": attrs}
+    if spec.get("endpoint"):
+        host, port = spec["endpoint"]
+        attrs.append(["WGPEER_A_ENDPOINT", {"addr": host, "port": port}])
+    if spec.get("persistent_keepalive") is not None:
+        attrs.append(["WGPEER_A_PERSISTENT_KEEPALIVE_INTERVAL", spec["persistent_keepalive"]])
+    if spec.get("allowed_ips") is not None:
+        # without the flag the kernel adds the prefixes to the peer's old ones
+        attrs.append(["WGPEER_A_FLAGS", WGPEER_F_REPLACE_ALLOWEDIPS])
+        attrs.append(["WGPEER_A_ALLOWEDIPS", [_allowed_ip(cidr) for cidr in spec["allowed_ips"]]])
+    return {"attrs": attrs}
+
+
+def _set_device_msg(ifname: str, specs: List[Dict[str, Any]]):
+    # WireGuard.set() only takes one peer, so build the WG_CMD_SET_DEVICE
+    # message with every peer nested under a single WGDEVICE_A_PEERS.
+    msg = wgmsg()
+    msg["cmd"] = WG_CMD_SET_DEVICE
+    msg["version"] = WG_GENL_VERSION
+    msg["attrs"].append(["WGDEVICE_A_IFNAME", ifname])
+    msg["attrs"].append(["WGDEVICE_A_PEERS", [_wg_peer(spec) for spec in specs]])
+    return msg
+
+
+def _set_peers(wg, ifname: str, specs: List[Dict[str, Any]]):
+    msg = _set_device_msg(ifname, specs)
+    return wg.nlm_request(msg, msg_type=wg.prid, msg_flags=NLM_F_REQUEST | NLM_F_ACK)
+
+
+def _key(value) -> str:
+    if value is None:
+        return "(none)"
+    if isinstance(value, bytes):
+        value = value.decode("ascii")
+    # an all-zero preshared key means "unset"
+    return "(none)" if value.strip("A=") == "" else value
+
+
+def _peer_row(peer) -> List[str]:
+    endpoint = "(none)"
+    ep = peer.get_attr("WGPEER_A_ENDPOINT")
+    if ep and ep.get("addr"):
+        addr = ep["addr"]
+        endpoint = f"[{addr}]:{ep['port']}" if ":" in addr else f"{addr}:{ep['port']}"
+    allowed = []
+    for ip in peer.get_attr("WGPEER_A_ALLOWEDIPS") or []:
+        addr = ip.get("addr")
+        if addr is None:
+            addr = f"{ip.get_attr('WGALLOWEDIP_A_IPADDR')}/{ip.get_attr('WGALLOWEDIP_A_CIDR_MASK')}"
+        allowed.append(addr)
+    hs = peer.get_attr("WGPEER_A_LAST_HANDSHAKE_TIME")
+    keepalive = peer.get_attr("WGPEER_A_PERSISTENT_KEEPALIVE_INTERVAL") or 0
+    return [
+        _key(peer.get_attr("WGPEER_A_PUBLIC_KEY")),
+        _key(peer.get_attr("WGPEER_A_PRESHARED_KEY")),
+        endpoint,
+        ",".join(allowed) or "(none)",
+        str(hs.get("tv_sec", 0) if hs else 0),
+        str(peer.get_attr("WGPEER_A_RX_BYTES") or 0),
+        str(peer.get_attr("WGPEER_A_TX_BYTES") or 0),
+        str(keepalive) if keepalive else "off",
+    ]
+
+
+class SubprocessBackend(WireGuardBackend):
+    """
+    Shells out to `wg` / `ip`. Binary paths and the sudo prefix are resolved
+    once when the backend is built rather than on every call.
+    """
+    name = "subprocess"
+
+    def __init__(self):
+        self.wg = shutil.which("wg")
+        self.ip = shutil.which("ip")
+        self.prefix: Optional[List[str]] = []
+        if not has_net_admin():
+            sudo = shutil.which("sudo")
+            self.prefix = [sudo] if sudo else None
+
+    def _run(self, cmd: List[str]) -> Dict[str, Any]:
+        if self.prefix is None:
+            return {"status": "error", "message": "Root required and sudo not available."}
+        if not cmd[0]:
+            return {"status": "error", "message": "required binary (wg/ip) not found."}
+        full = self.prefix + cmd
+        try:
+            proc = subprocess.run(full, capture_output=True, text=True)
+        except Exception as e:
+            return {"status": "error", "message": f"Failed to run {full}: {e}"}
+        if proc.returncode != 0:
+            return {
+                "status": "error",
+                "message": f"Command failed: {' '.join(full)}",
+                "stdout": proc.stdout,
+                "stderr": proc.stderr,
+                "rc": proc.returncode
+            }
+        return {"status": "success", "stdout": proc.stdout, "stderr": proc.stderr, "rc": proc.returncode}
+
+    def create_interface(self, ifname: str) -> Dict[str, Any]:
+        res = self._run([self.ip, "link", "add", ifname, "type", "wireguard"])
+        if res.get("status") == "success":
+            res = self._run([self.ip, "link", "set", ifname, "up"])
+        return res
+
+    def delete_interface(self, ifname: str) -> Dict[str, Any]:
+        return self._run([self.ip, "link", "del", ifname])
+
+    def list_interfaces(self) -> Dict[str, Any]:
+        if not self.ip:
+            return {"status": "error", "message": "ip binary not found."}
+        try:
+            proc = subprocess.run([self.ip, "-o", "link", "show", "type", "wireguard"],
+                                  capture_output=True, text=True)
+        except Exception as e:
+            return {"status": "error", "message": f"list_interfaces error: {e}"}
+        if proc.returncode != 0:
+            return {"status": "error", "message": f"list_interfaces error: {proc.stderr.strip()}"}
+        wg_links = []
+        for line in proc.stdout.splitlines():
+            m = re.match(r"(\d+):\s+([^:@\s]+).*?\bstate\s+(\S+)", line)
+            if m:
+                wg_links.append({"index": int(m.group(1)), "ifname": m.group(2), "state": m.group(3)})
+        return {"status": "success", "interfaces": wg_links}
+
+    def dump_peers(self, ifname: str) -> Dict[str, Any]:
+        res = self._run([self.wg, "show", ifname, "dump"])
+        if res.get("status") != "success":
+            return res
+        lines = res.get("stdout", "").strip().splitlines()
+        # first line describes the interface itself
+        return {"status": "success", "rows": [line.split("\t") for line in lines[1:]]}
+
+    def add_peer(self, ifname: str, public_key: str, allowed_ips: str) -> Dict[str, Any]:
+        return self._run([self.wg, "set", ifname, "peer", public_key, "allowed-ips", allowed_ips])
+
+    def remove_peer(self, ifname: str, public_key: str) -> Dict[str, Any]:
+        return self._run([self.wg, "set", ifname, "peer", public_key, "remove"])
+
+    def set_peers(self, ifname: str, specs: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """`wg set` accepts any number of `peer ...` clauses: one fork per batch."""
+        cmd = [self.wg, "set", ifname]
+        for spec in specs:
+            cmd += ["peer", spec["public_key"]]
+            if spec.get("remove"):
+                cmd.append("remove")
+                continue
+            if spec.get("allowed_ips") is not None:
+                cmd += ["allowed-ips", ",".join(spec["allowed_ips"])]
+            if spec.get("endpoint"):
+                host, port = spec["endpoint"]
+                cmd += ["endpoint", f"[{host}]:{port}" if ":" in host else f"{host}:{port}"]
+            if spec.get("persistent_keepalive") is not None:
+                cmd += ["persistent-keepalive", str(spec["persistent_keepalive"] or "off")]
+        return self._run(cmd)
+
+
+# simulated kernel round trip per FakeBackend call, in seconds
+FAKE_LATENCY = float(os.environ.get("VALDAEMON_FAKE_LATENCY", "0"))
+
+
+class FakeBackend(WireGuardBackend):
+    """
+    In-memory stand-in for a kernel with WireGuard, for benchmarks and
+    development without CAP_NET_ADMIN. Checks keys and prefixes the way the
+    kernel does, and like WireGuard gives a prefix to at most one peer per
+    interface: assigning it to one peer takes it from another. allowed_ips
+    replaces a peer's list, as `wg set` does. Each call can
+    sleep `latency` seconds to stand in for the netlink round trip.
+    """
+    name = "fake"
+
+    def __init__(self, latency: float = None):
+        self.latency = FAKE_LATENCY if latency is None else latency
+        self._lock = threading.Lock()
+        self._links: Dict[str, Dict[str, Any]] = {}
+        self._next_index = 100
+
+    def _wait(self):
+        if self.latency:
+            time.sleep(self.latency)
+
+    def create_interface(self, ifname: str) -> Dict[str, Any]:
+        self._wait()
+        if not ifname or len(ifname) > 15 or "/" in ifname or ifname.strip() != ifname:
+            return {"status": "error", "message": f"invalid interface name {ifname!r}"}
+        with self._lock:
+            if ifname in self._links:
+                return {"status": "error", "message": f"create failed: {ifname} exists"}
+            self._next_index += 1
+            self._links[ifname] = {"index": self._next_index, "peers": {}, "owners": {}}
+        return {"status": "success", "message": f"Interface {ifname} created (fake)"}
+
+    def delete_interface(self, ifname: str) -> Dict[str, Any]:
+        self._wait()
+        with self._lock:
+            if self._links.pop(ifname, None) is None:
+                return {"status": "error", "message": f"Interface {ifname} not found"}
+        return {"status": "success", "message": f"Interface {ifname} deleted (fake)"}
+
+    def list_interfaces(self) -> Dict[str, Any]:
+        self._wait()
+        with self._lock:
+            links = [{"index": link["index"], "ifname": name, "state": "UNKNOWN"}
+                     for name, link in self._links.items()]
+        return {"status": "success", "interfaces": links}
+
+    def dump_peers(self, ifname: str) -> Dict[str, Any]:
+        self._wait()
+        with self._lock:
+            link = self._links.get(ifname)
+            if link is None:
+                return {"status": "error", "message": f"Unable to access interface {ifname}: No such device"}
+            rows = [list(row) for row in link["peers"].values()]
+        return {"status": "success", "rows": rows}
+
+    def set_peers(self, ifname: str, specs: List[Dict[str, Any]]) -> Dict[str, Any]:
+        self._wait()
+        for spec in specs:
+            err = _check_spec(spec)
+            if err:
+                return {"status": "error", "message": f"fake set failed: {err}"}
+        with self._lock:
+            link = self._links.get(ifname)
+            if link is None:
+                return {"status": "error", "message": f"Unable to modify interface {ifname}: No such device"}
+            for spec in specs:
+                _apply_spec(link, spec)
+        return {"status": "success"}
+
+
+def _check_spec(spec: Dict[str, Any]) -> Optional[str]:
+    try:
+        if len(binascii.a2b_base64(spec["public_key"])) != 32:
+            raise ValueError
+    except (ValueError, TypeError, binascii.Error):
+        return f"invalid public key {spec.get('public_key')!r}"
+    for cidr in spec.get("allowed_ips") or ():
+        try:
+            ipaddress.ip_network(cidr, strict=False)
+        except (ValueError, TypeError):
+            return f"invalid allowed ip {cidr!r}"
+    return None
+
+
+def _apply_spec(link: Dict[str, Any], spec: Dict[str, Any]):
+    peers, owners, key = link["peers"], link["owners"], spec["public_key"]
+    row = peers.get(key)
+    if spec.get("remove"):
+        if row is not None:
+            for cidr in split_allowed_ips(row[3]) if row[3] != "(none)" else ():
+                owners.pop(cidr, None)
+            del peers[key]
+        return
+    if row is None:
+        row = peers[key] = [key, "(none)", "(none)", "(none)", "0", "0", "0", "off"]
+    if spec.get("allowed_ips") is not None:
+        for cidr in split_allowed_ips(row[3]) if row[3] != "(none)" else ():
+            owners.pop(cidr, None)
+        for cidr in spec["allowed_ips"]:
+            other = owners.get(cidr)
+            if other is not None and other != key:
+                rest = [c for c in split_allowed_ips(peers[other][3]) if c != cidr]
+                peers[other][3] = ",".join(rest) or "(none)"
+            owners[cidr] = key
+        row[3] = ",".join(spec["allowed_ips"]) or "(none)"
+    if spec.get("endpoint"):
+        host, port = spec["endpoint"]
+        row[2] = f"[{host}]:{port}" if ":" in host else f"{host}:{port}"
+    if spec.get("persistent_keepalive") is not None:
+        row[7] = str(spec["persistent_keepalive"]) if spec["persistent_keepalive"] else "off"
+
+
+BACKENDS = {
+    "netlink": NetlinkBackend,
+    "subprocess": SubprocessBackend,
+    "fake": FakeBackend,
+}
+
+
+def select_backend(name: str = "auto"):
+    """
+    Build the backend once. "auto" picks netlink when pyroute2 is importable and
+    the process holds CAP_NET_ADMIN, otherwise falls back to subprocess.
+    "fake" keeps everything in memory and never touches the kernel.
+    """
+    if name == "auto":
+        name = "netlink" if sessions.available() and has_net_admin() else "subprocess"
+    try:
+        return BACKENDS[name]()
+    except KeyError:
+        raise ValueError(f"unknown backend: {name}")
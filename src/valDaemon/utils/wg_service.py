@@ -1,172 +1,777 @@
 import os
-import shutil
-import subprocess
-from typing import Dict, Any, List
+import base64
+import binascii
+import ipaddress
+import socket
+import threading
+import time
+from typing import Dict, Any, Iterator, List, Optional, Tuple
 
-def _is_root() -> bool:
-    return os.geteuid() == 0
+from valDaemon.utils.events import feed
+from valDaemon.utils.ipam import ipam
+from valDaemon.utils.journal import State, journal
+from valDaemon.utils.keys import pool as keypool
+from valDaemon.utils.metrics import InstrumentedBackend, family
+from valDaemon.utils.peer_cache import PeerCache
+from valDaemon.utils.peer_model import Peer, build_filter, parse_fields
+from valDaemon.utils.prefix_trie import AllowedIPsIndex
+from valDaemon.utils.tracing import activate, group
+from valDaemon.utils.wg_backends import PEERS_PER_MESSAGE, select_backend, split_allowed_ips
 
-def _run_cmd(cmd: List[str]) -> Dict[str, Any]:
+_backend = None
+_backend_lock = threading.Lock()
+
+def init_backend(name: str = None):
     """
-    Run a command. If not root and sudo exists, prefix with sudo.
-    Returns dict with status, stdout/stderr.
+    Choose the WireGuard backend once, at daemon startup. `name` is "auto",
+    "netlink" or "subprocess" (default: $VALDAEMON_BACKEND or auto).
     """
-    prefix = []
-    if not _is_root():
-        if shutil.which("sudo"):
-            prefix = ["sudo"]
-        else:
-            return {"status": "error", "message": "Root required and sudo not available."}
-    try:
-        proc = subprocess.run(prefix + cmd, capture_output=True, text=True)
-    except Exception as e:
-        return {"status": "error", "message": f"Failed to run {prefix + cmd}: {e}"}
+    global _backend
+    with _backend_lock:
+        _backend = InstrumentedBackend(select_backend(name or os.environ.get("VALDAEMON_BACKEND", "auto")))
+    return _backend
+
+def get_backend():
+    if _backend is None:
+        init_backend()
+    return _backend
+
+def _load_peers(ifname: str) -> Dict[str, Any]:
+    res = get_backend().dump_peers(ifname)
+    if res.get("status") != "success":
+        return res
+    return {"status": "success", "peers": [Peer.from_row(row) for row in res["rows"] if row]}
+
+cache = PeerCache(_load_peers, lambda: get_backend().list_interfaces())
+
+def _apply_specs(peers: Dict[str, Peer], specs: List[Dict[str, Any]]):
+    """Mirror accepted peer specs into a cached {public_key: Peer} table."""
+    for spec in specs:
+        key = spec["public_key"]
+        if spec.get("remove"):
+            peers.pop(key, None)
+            continue
+        changes = {}
+        if spec.get("allowed_ips") is not None:
+            changes["allowed_ips"] = tuple(spec["allowed_ips"])
+        if spec.get("endpoint"):
+            changes["endpoint"] = _fmt_endpoint(*spec["endpoint"])
+        if spec.get("persistent_keepalive") is not None:
+            changes["persistent_keepalive"] = spec["persistent_keepalive"]
+        peer = peers.get(key) or Peer(key)
+        peers[key] = peer.replace(**changes)
+
+def _cache_specs(ifname: str, specs: List[Dict[str, Any]]):
+    """Record peer specs the kernel accepted: in the peer cache, the state journal and the change feed."""
+    if specs:
+        existed: Dict[str, bool] = {}
 
-    if proc.returncode != 0:
-        return {
-            "status": "error",
-            "message": f"Command failed: {' '.join(prefix + cmd)}",
-            "stdout": proc.stdout,
-            "stderr": proc.stderr,
-            "rc": proc.returncode
-        }
-    return {"status": "success", "stdout": proc.stdout, "stderr": proc.stderr, "rc": proc.returncode}
+        def apply(rows):
+            # may run again as a replay after a refresh; the first run saw the table as it was
+            if not existed:
+                existed.update((spec["public_key"], spec["public_key"] in rows) for spec in specs)
+            _apply_specs(rows, specs)
+        cache.mutate(ifname, apply)
+        journal.peers(ifname, specs)
+        feed.peers(ifname, specs, existed)
 
 
 # ----------------------------
 # Interface functions
 # ----------------------------
 def create_interface(ifname: str = "wg0") -> Dict[str, Any]:
-    """
-    Create WireGuard interface. Prefer pyroute2 when root; otherwise use `ip` via sudo.
-    """
-    if _is_root():
-        try:
-            from pyroute2 import IPRoute
-            with IPRoute() as ipr:
-                ipr.link("add", ifname=ifname, kind="wireguard")
-                idx = ipr.link_lookup(ifname=ifname)
-                if idx:
-                    ipr.link("set", index=idx[0], state="up")
-            return {"status": "success", "message": f"Interface {ifname} created (pyroute2)"}
-        except Exception as e:
-            # fallback to ip
-            return {"status": "error", "message": f"pyroute2 failed: {e}"}
-    else:
-        return _run_cmd(["ip", "link", "add", ifname, "type", "wireguard"])
+    res = get_backend().create_interface(ifname)
+    cache.invalidate(ifname)
+    if res.get("status") == "success":
+        journal.interface(ifname)
+        feed.interface(ifname)
+    return res
 
 
 def delete_interface(ifname: str = "wg0") -> Dict[str, Any]:
-    if _is_root():
-        try:
-            from pyroute2 import IPRoute
-            with IPRoute() as ipr:
-                idx = ipr.link_lookup(ifname=ifname)
-                if not idx:
-                    return {"status": "error", "message": f"{ifname} not found"}
-                ipr.link("del", index=idx[0])
-            return {"status": "success", "message": f"Interface {ifname} deleted (pyroute2)"}
-        except Exception as e:
-            return {"status": "error", "message": f"pyroute2 delete failed: {e}"}
-    else:
-        return _run_cmd(["ip", "link", "del", ifname])
-
-
-def list_interfaces() -> Dict[str, Any]:
-    try:
-        from pyroute2 import IPRoute
-        with IPRoute() as ipr:
-            links = ipr.get_links()
-            wg_links = []
-            for link in links:
-                linkinfo = link.get_attr("IFLA_LINKINFO") if link.get_attr("IFLA_LINKINFO") else None
-                info_kind = linkinfo.get_attr("IFLA_INFO_KIND") if linkinfo else None
-                if info_kind == "wireguard":
-                    wg_links.append({
-                        "index": link["index"],
-                        "ifname": link.get_attr("IFLA_IFNAME"),
-                        "state": link.get_attr("IFLA_OPERSTATE")
-                    })
-        return {"status": "success", "interfaces": wg_links}
-    except Exception as e:
-        return {"status": "error", "message": f"list_interfaces error: {e}"}
+    res = get_backend().delete_interface(ifname)
+    cache.invalidate(ifname)
+    if res.get("status") == "success":
+        ipam.reset(ifname)
+        journal.interface(ifname, exists=False)
+        feed.interface(ifname, exists=False)
+    return res
+
+
+def list_interfaces(fresh: bool = False) -> Dict[str, Any]:
+    return cache.interfaces(fresh)
 
 
 # ----------------------------
 # Peer functions
 # ----------------------------
-def list_peers(ifname: str = "wg0") -> Dict[str, Any]:
-    # use wg dump via wg binary (compatible)
-    if shutil.which("wg"):
-        res = _run_cmd(["wg", "show", ifname, "dump"])
+DEFAULT_PAGE = 1000
+MAX_PAGE = 10000
+
+def _list_query(fields, active_since, allowed_ip, limit):
+    fields = parse_fields(fields)
+    match = build_filter(active_since, allowed_ip)
+    limit = min(max(int(limit or DEFAULT_PAGE), 1), MAX_PAGE)
+    return fields, match, limit
+
+def _encode_page(peers: List[Peer], fields, compact: bool) -> Dict[str, Any]:
+    if compact:
+        return {"fields": list(fields), "rows": [peer.to_list(fields) for peer in peers]}
+    return {"peers": [peer.to_dict(fields) for peer in peers]}
+
+def list_peers(ifname: str = "wg0", fresh: bool = False, cursor: str = None, limit: int = None,
+               fields=None, active_since: int = None, allowed_ip: str = None,
+               compact: bool = False) -> Dict[str, Any]:
+    """
+    One page of parsed peers, ordered by public key and served from the peer
+    cache (fresh=True forces a kernel dump first). Pass the returned
+    next_cursor back as `cursor` for the following page. `fields` projects the
+    output; `active_since` (unix time) and `allowed_ip` filter server side.
+    compact=True returns {"fields": [...], "rows": [[...], ...]} instead of
+    one object per peer.
+    """
+    try:
+        fields, match, limit = _list_query(fields, active_since, allowed_ip, limit)
+    except (TypeError, ValueError) as e:
+        return {"status": "error", "message": str(e)}
+    res = cache.page(ifname, cursor=cursor, limit=limit, match=match, fresh=fresh)
+    if res.get("status") != "success":
+        return res
+    out = {"status": "success", "next_cursor": res["next_cursor"], "total": res["total"], "cache": res["cache"]}
+    out.update(_encode_page(res["peers"], fields, compact))
+    return out
+
+
+def iter_peers(ifname: str = "wg0", fresh: bool = False, limit: int = None, fields=None,
+               active_since: int = None, allowed_ip: str = None,
+               compact: bool = False) -> Iterator[Dict[str, Any]]:
+    """
+    Streaming form of list_peers: yields {"more": True, "peers"|"rows": ...}
+    frames of `limit` peers each, then one final status frame. Only one page
+    is materialised at a time.
+    """
+    try:
+        fields, match, limit = _list_query(fields, active_since, allowed_ip, limit)
+    except (TypeError, ValueError) as e:
+        yield {"status": "error", "message": str(e)}
+        return
+    cursor = None
+    while True:
+        res = cache.page(ifname, cursor=cursor, limit=limit, match=match, fresh=fresh and cursor is None)
         if res.get("status") != "success":
-            return res
-        dump = res.get("stdout", "")
-        if not dump.strip():
-            return {"status": "success", "peers": []}
-        lines = dump.strip().splitlines()
-        # skip header (interface info)
-        peers = []
-        for line in lines[1:]:
-            cols = line.split()
-            peers.append({"raw": line, "public_key": cols[0] if cols else None})
-        return {"status": "success", "peers": peers}
-    else:
-        # try pyroute2 WireGuard if root
-        if _is_root():
+            yield res
+            return
+        if res["peers"]:
+            yield dict(_encode_page(res["peers"], fields, compact), more=True)
+        cursor = res["next_cursor"]
+        if not cursor:
+            yield {"status": "success", "total": res["total"], "cache": res["cache"]}
+            return
+
+
+def add_peer(ifname: str, public_key: str, allowed_ips: str = None, force: bool = False) -> Dict[str, Any]:
+    """
+    Add or replace a peer. Without allowed_ips the peer gets the next free
+    address of each of the interface's IPAM pools; the response then carries
+    the assigned "allowed_ips". Prefixes overlapping another peer's are
+    refused unless force=True (the kernel would silently move them).
+    """
+    assigned = not allowed_ips
+    if assigned:
+        try:
+            allowed_ips = ipam.allocate(ifname)[0]
+        except ValueError as e:
+            return {"status": "error", "message": str(e)}
+    spec = {"public_key": public_key, "allowed_ips": split_allowed_ips(allowed_ips)}
+    if not force:
+        conflicts = find_conflicts(ifname, [spec]).get(0)
+        if conflicts:
+            if assigned:
+                ipam.release(ifname, spec["allowed_ips"])
+            return {"status": "error", "message": "allowed_ips conflict: " + "; ".join(conflicts),
+                    "conflicts": conflicts}
+    before = _ipam_before(ifname, [spec])
+    res = get_backend().add_peer(ifname, public_key, allowed_ips)
+    if res.get("status") == "success":
+        _cache_specs(ifname, [spec])
+        _ipam_commit(ifname, [spec], before, allocated=assigned)
+        if assigned:
+            res = dict(res, allowed_ips=allowed_ips)
+    elif assigned:
+        ipam.release(ifname, spec["allowed_ips"])
+    return res
+
+
+def remove_peer(ifname: str, public_key: str) -> Dict[str, Any]:
+    spec = {"public_key": public_key, "remove": True}
+    before = _ipam_before(ifname, [spec])
+    res = get_backend().remove_peer(ifname, public_key)
+    if res.get("status") == "success":
+        _cache_specs(ifname, [spec])
+        _ipam_commit(ifname, [spec], before)
+    return res
+
+
+# ----------------------------
+# AllowedIPs conflicts
+# ----------------------------
+def _conflicts(peers, index: AllowedIPsIndex, specs: List[Dict[str, Any]]) -> Dict[int, List[str]]:
+    # peers whose allowed_ips this batch replaces or removes no longer hold their old prefixes
+    moving = {spec["public_key"] for spec in specs if spec.get("remove") or spec.get("allowed_ips") is not None}
+    batch = AllowedIPsIndex()
+    out = {}
+    for pos, spec in enumerate(specs):
+        if spec.get("remove") or spec.get("allowed_ips") is None:
+            continue
+        key = spec["public_key"]
+        found = []
+        for cidr in spec["allowed_ips"]:
             try:
-                from pyroute2 import WireGuard
-                with WireGuard() as wg:
-                    info = wg.info(ifname)
-                return {"status": "success", "peers": info.get("peers", [])}
-            except Exception as e:
-                return {"status": "error", "message": f"pyroute2 WireGuard error: {e}"}
-        return {"status": "error", "message": "wg binary not found and not root for pyroute2."}
-
-
-def add_peer(ifname: str, public_key: str, allowed_ips: str) -> Dict[str, Any]:
-    # Prefer wg binary (widely available)
-    if shutil.which("wg"):
-        return _run_cmd(["wg", "set", ifname, "peer", public_key, "allowed-ips", allowed_ips])
-    else:
-        if _is_root():
+                hits = index.conflicts(cidr, skip=moving) + batch.conflicts(cidr, skip=(key,))
+            except ValueError:
+                continue  # malformed; left for the backend to reject
+            found.extend(f"{cidr} overlaps {prefix} of peer {owner}" for prefix, owner in hits)
+        if found:
+            out[pos] = found
+            continue
+        for cidr in spec["allowed_ips"]:
             try:
-                from pyroute2 import WireGuard
-                with WireGuard() as wg:
-                    wg.set(ifname, peer={"public_key": public_key.encode(), "allowed_ips": [(allowed_ips, 32)]})
-                return {"status": "success", "message": "Peer added via pyroute2"}
-            except Exception as e:
-                return {"status": "error", "message": f"pyroute2 add_peer failed: {e}"}
-        return {"status": "error", "message": "wg binary not found and not root."}
+                batch.add(cidr, key)
+            except ValueError:
+                pass
+    return out
+
+def find_conflicts(ifname: str, specs: List[Dict[str, Any]]) -> Dict[int, List[str]]:
+    """
+    {position: [message, ...]} for specs whose allowed_ips overlap a prefix
+    held by another peer, on the interface or earlier in the same batch.
+    Each prefix costs one walk of the interface's AllowedIPs trie.
+    """
+    res, err = cache.indexed(ifname, lambda peers, index: _conflicts(peers, index, specs))
+    return res or {}
 
+def lookup_peer(ifname: str, ip: str, fields=None) -> Dict[str, Any]:
+    """The peer whose AllowedIPs route `ip` (longest prefix match), as WireGuard would pick it."""
+    try:
+        fields = parse_fields(fields)
+        AllowedIPsIndex.parse(ip)
+    except ValueError as e:
+        return {"status": "error", "message": str(e)}
 
-def remove_peer(ifname: str, public_key: str) -> Dict[str, Any]:
-    if shutil.which("wg"):
-        return _run_cmd(["wg", "set", ifname, "peer", public_key, "remove"])
-    else:
-        if _is_root():
+    def _lookup(peers, index):
+        hit = index.lookup(ip)
+        return (hit[0], peers.get(hit[1])) if hit else None
+    res, err = cache.indexed(ifname, _lookup)
+    if err:
+        return err
+    if res is None or res[1] is None:
+        return {"status": "error", "message": f"no peer on {ifname} routes {ip}"}
+    return {"status": "success", "prefix": res[0], "peer": res[1].to_dict(fields)}
+
+
+# ----------------------------
+# Address management
+# ----------------------------
+MAX_ALLOCATE = 65536
+
+def _ipam_before(ifname: str, specs: List[Dict[str, Any]]) -> Dict[str, Tuple[str, ...]]:
+    """Current allowed_ips of the peers `specs` will replace or remove, from the peer cache."""
+    if not ipam.has_pool(ifname):
+        return {}
+    before = {}
+    for spec in specs:
+        if spec.get("remove") or spec.get("allowed_ips") is not None:
+            peer = cache.get(ifname, spec["public_key"])
+            if peer is not None and peer.allowed_ips:
+                before[spec["public_key"]] = peer.allowed_ips
+    return before
+
+def _ipam_commit(ifname: str, specs: List[Dict[str, Any]], before: Dict[str, Tuple[str, ...]],
+                 allocated: bool = False):
+    """
+    Claim addresses the kernel accepted and release the ones peers no longer
+    hold. allocated=True marks specs whose addresses came from IPAM already.
+    """
+    if not ipam.has_pool(ifname):
+        return
+    claimed, released = [], []
+    for spec in specs:
+        new = () if spec.get("remove") else spec.get("allowed_ips")
+        if new is None:
+            continue
+        if not allocated:
+            claimed.extend(new)
+        released.extend(ip for ip in before.get(spec["public_key"], ()) if ip not in new)
+    ipam.release(ifname, released)
+    ipam.claim(ifname, claimed)
+
+def create_pool(ifname: str, cidr: str, reserve_first: bool = True) -> Dict[str, Any]:
+    """
+    Give an interface an address pool (one per IP family). Addresses its
+    current peers already hold are marked used once, here, so later
+    allocations never look at the peer table.
+    """
+    res = cache.peers(ifname)
+    in_use = [ip for peer in res.get("peers", ()) for ip in peer.allowed_ips]
+    return ipam.create_pool(ifname, cidr, reserve_first, in_use)
+
+def delete_pool(ifname: str, version: int = None) -> Dict[str, Any]:
+    return ipam.delete_pool(ifname, version)
+
+def pool_status(ifname: str = None) -> Dict[str, Any]:
+    return ipam.status(ifname)
+
+def allocate_addresses(ifname: str, count: int = 1) -> Dict[str, Any]:
+    """Reserve `count` addresses up front, e.g. to hand out with keypairs before the peers exist."""
+    try:
+        count = int(count)
+    except (TypeError, ValueError):
+        return {"status": "error", "message": "count must be an integer"}
+    if not 1 <= count <= MAX_ALLOCATE:
+        return {"status": "error", "message": f"count must be between 1 and {MAX_ALLOCATE}"}
+    try:
+        return {"status": "success", "addresses": ipam.allocate(ifname, count)}
+    except ValueError as e:
+        return {"status": "error", "message": str(e)}
+
+def release_addresses(ifname: str, addresses: List[str]) -> Dict[str, Any]:
+    ips = [ip for entry in addresses for ip in split_allowed_ips(str(entry))]
+    return {"status": "success", "released": ipam.release(ifname, ips)}
+
+
+# ----------------------------
+# Batch peer operations
+# ----------------------------
+PEER_OPS = ("add", "remove", "update")
+
+def _valid_key(key) -> bool:
+    try:
+        return isinstance(key, str) and len(base64.b64decode(key, validate=True)) == 32
+    except (binascii.Error, ValueError):
+        return False
+
+def _parse_endpoint(endpoint: str) -> Tuple[str, int]:
+    """
+    (ip, port) from "host:port" or "[v6]:port". A hostname is resolved here,
+    as `wg set` would, since netlink only takes addresses; a name that does
+    not resolve fails this op rather than the whole message.
+    """
+    host, _, port = endpoint.rpartition(":")
+    if not host or not port.isdigit() or not 0 < int(port) < 65536:
+        raise ValueError(f"invalid endpoint: {endpoint}")
+    host = host.strip("[]")
+    try:
+        return str(ipaddress.ip_address(host)), int(port)
+    except ValueError:
+        pass
+    try:
+        infos = socket.getaddrinfo(host, int(port), type=socket.SOCK_DGRAM)
+    except (OSError, UnicodeError) as e:
+        raise ValueError(f"invalid endpoint: {endpoint}: {e}")
+    return infos[0][4][0], int(port)
+
+def parse_peer_op(op: Dict[str, Any]) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+    """
+    Turn one batch op into a backend peer spec. Returns (spec, None) or
+    (None, error message).
+      add:    create or replace a peer, allowed_ips required (apply_peers
+              fills it in from IPAM when the interface has a pool)
+      update: change only the fields that are given
+      remove: delete the peer
+    """
+    kind = op.get("op")
+    if kind not in PEER_OPS:
+        return None, f"op must be one of {', '.join(PEER_OPS)}"
+    if not _valid_key(op.get("public_key")):
+        return None, "public_key must be a base64 encoded 32-byte key"
+    spec = {"public_key": op["public_key"]}
+    if kind == "remove":
+        spec["remove"] = True
+        return spec, None
+    if op.get("allowed_ips") is not None:
+        spec["allowed_ips"] = split_allowed_ips(op["allowed_ips"])
+    elif kind == "add":
+        return None, "allowed_ips required for add"
+    try:
+        if op.get("endpoint"):
+            spec["endpoint"] = _parse_endpoint(op["endpoint"])
+        if op.get("persistent_keepalive") is not None:
+            spec["persistent_keepalive"] = int(op["persistent_keepalive"])
+    except ValueError as e:
+        return None, str(e)
+    return spec, None
+
+def apply_peers(ifname: str, ops: List[Dict[str, Any]], force: bool = False) -> Dict[str, Any]:
+    """
+    Apply a list of add/remove/update ops, PEERS_PER_MESSAGE peers per netlink
+    message (or `wg set` call). If a whole chunk is rejected it is retried
+    peer by peer so every op gets its own result. Ops whose allowed_ips
+    overlap another peer's fail unless force=True.
+    """
+    results: List[Dict[str, Any]] = [None] * len(ops)
+    ops = [op if isinstance(op, dict) else {} for op in ops]
+    assigned = _assign_addresses(ifname, ops)
+    valid = []
+    for i, op in enumerate(ops):
+        spec, err = parse_peer_op(op)
+        if err:
+            results[i] = {"public_key": op.get("public_key"), "op": op.get("op"), "status": "error", "message": err}
+        else:
+            valid.append((i, op["op"], spec))
+    if not force and valid:
+        conflicts = find_conflicts(ifname, [spec for _, _, spec in valid])
+        for pos in conflicts:
+            i, kind, spec = valid[pos]
+            results[i] = {"public_key": spec["public_key"], "op": kind, "status": "error",
+                          "message": "allowed_ips conflict: " + "; ".join(conflicts[pos]),
+                          "conflicts": conflicts[pos]}
+        valid = [v for pos, v in enumerate(valid) if pos not in conflicts]
+
+    before = _ipam_before(ifname, [spec for _, _, spec in valid])
+    backend = get_backend()
+    for start in range(0, len(valid), PEERS_PER_MESSAGE):
+        chunk = valid[start:start + PEERS_PER_MESSAGE]
+        res = backend.set_peers(ifname, [spec for _, _, spec in chunk])
+        if res.get("status") != "success" and len(chunk) > 1:
+            for i, kind, spec in chunk:
+                one = backend.set_peers(ifname, [spec])
+                results[i] = _op_result(spec, kind, one)
+            continue
+        for i, kind, spec in chunk:
+            results[i] = _op_result(spec, kind, res)
+
+    accepted = [spec for i, _, spec in valid if results[i]["status"] == "success"]
+    _cache_specs(ifname, accepted)
+    auto = set(assigned)
+    _ipam_commit(ifname, [spec for i, _, spec in valid if results[i]["status"] == "success" and i not in auto],
+                 before)
+    _ipam_commit(ifname, [spec for i, _, spec in valid if results[i]["status"] == "success" and i in auto],
+                 before, allocated=True)
+    for i in assigned:
+        if results[i]["status"] == "success":
+            results[i]["allowed_ips"] = ops[i]["allowed_ips"]
+        else:
+            ipam.release(ifname, split_allowed_ips(ops[i]["allowed_ips"]))
+    failed = sum(r["status"] != "success" for r in results)
+    status = "success" if not failed else ("error" if failed == len(results) else "partial")
+    return {"status": status, "applied": len(results) - failed, "failed": failed, "results": results}
+
+def apply_queued(ifname: str, requests: List[Tuple[str, str, Optional[str], bool, Any]]) -> List[Dict[str, Any]]:
+    """
+    Run add_peer/remove_peer requests that queued up on one interface as few
+    apply_peers batches as possible, returning one add_peer/remove_peer style
+    response per request. Requests are (op, public_key, allowed_ips, force,
+    trace); a batch's backend calls show up on the trace of every request in it.
+    An add with explicit allowed_ips that a later remove of the same key
+    undoes never reaches the kernel, provided it would have been accepted:
+    a valid key and prefixes, and no conflict unless forced. The remove
+    still goes out, in case the peer existed before. A batch is cut wherever
+    a key repeats otherwise or `force` changes, so the outcome matches
+    running them one by one.
+    """
+    results: List[Optional[Dict[str, Any]]] = [None] * len(requests)
+    batch: List[Tuple[int, Dict[str, Any]]] = []
+    where: Dict[str, int] = {}
+    batch_force = None
+
+    def flush():
+        nonlocal batch_force
+        live = [(i, op) for i, op in batch if op is not None]
+        if len(live) == 1:
+            i, op = live[0]
+            with activate(requests[i][4]):
+                if op["op"] == "add":
+                    results[i] = add_peer(ifname, op["public_key"], op.get("allowed_ips"), bool(batch_force))
+                else:
+                    results[i] = remove_peer(ifname, op["public_key"])
+        elif live:
+            with activate(group([requests[i][4] for i, _ in live])):
+                res = apply_peers(ifname, [op for _, op in live], bool(batch_force))
+            for (i, _), r in zip(live, res["results"]):
+                results[i] = {k: v for k, v in r.items() if k not in ("public_key", "op") and v is not None}
+        batch.clear()
+        where.clear()
+        batch_force = None
+
+    for i, (kind, key, allowed_ips, force, _) in enumerate(requests):
+        j = where.get(key)
+        if j is not None:
+            prev = batch[j][1]
+            if (kind == "remove" and prev["op"] == "add" and prev.get("allowed_ips")
+                    and _would_apply(ifname, [op for _, op in batch[:j] if op is not None], prev, batch_force)):
+                results[batch[j][0]] = {"status": "success", "coalesced": True}
+                batch[j] = (batch[j][0], None)
+            else:
+                flush()
+        if kind == "add":
+            if batch_force is not None and force != batch_force:
+                flush()
+            batch_force = force
+            op = {"op": "add", "public_key": key}
+            if allowed_ips:
+                op["allowed_ips"] = allowed_ips
+        else:
+            op = {"op": "remove", "public_key": key}
+        where[key] = len(batch)
+        batch.append((i, op))
+    flush()
+    return results
+
+def _would_apply(ifname: str, before: List[Dict[str, Any]], op: Dict[str, Any], force: bool) -> bool:
+    """True if `op` would pass validation and the conflict check after the ops `before` it."""
+    spec, err = parse_peer_op(op)
+    if err:
+        return False
+    try:
+        for cidr in spec["allowed_ips"]:
+            ipaddress.ip_network(cidr, strict=False)
+    except ValueError:
+        return False
+    if force:
+        return True
+    specs = [spec for spec, err in map(parse_peer_op, before) if not err]
+    return len(specs) not in find_conflicts(ifname, specs + [spec])
+
+def _assign_addresses(ifname: str, ops: List[Dict[str, Any]]) -> List[int]:
+    """
+    Bulk-allocate addresses for "add" ops that left allowed_ips out, in place.
+    Returns the indexes that were filled. Without a pool, or if it cannot
+    cover them all, the ops are left alone and fail validation as before.
+    """
+    missing = [i for i, op in enumerate(ops) if op.get("op") == "add" and not op.get("allowed_ips")]
+    if not missing or not ipam.has_pool(ifname):
+        return []
+    try:
+        addresses = ipam.allocate(ifname, len(missing))
+    except ValueError:
+        return []
+    for i, addr in zip(missing, addresses):
+        ops[i] = dict(ops[i], allowed_ips=addr)
+    return missing
+
+def _op_result(spec: Dict[str, Any], kind: str, res: Dict[str, Any]) -> Dict[str, Any]:
+    out = {"public_key": spec["public_key"], "op": kind, "status": res.get("status")}
+    if res.get("status") != "success":
+        out["message"] = res.get("stderr") or res.get("message")
+    return out
+
+
+# ----------------------------
+# Warm restart
+# ----------------------------
+def capture_state() -> State:
+    """The kernel's current interfaces and peers, in journal form; seeds the journal on first start."""
+    state: State = {}
+    res = get_backend().list_interfaces()
+    for link in res.get("interfaces", []) if res.get("status") == "success" else []:
+        dump = _load_peers(link["ifname"])
+        peers = state.setdefault(link["ifname"], {})
+        for peer in dump.get("peers", []):
+            keepalive = str(peer.persistent_keepalive) if peer.persistent_keepalive else ""
+            peers[peer.public_key] = [",".join(peer.allowed_ips), peer.endpoint or "", keepalive]
+    return state
+
+def restore_state(state: State) -> Dict[str, Any]:
+    """
+    Put journaled interfaces and peers back into the kernel: missing
+    interfaces are created, then every peer that is absent or differs goes
+    out PEERS_PER_MESSAGE per netlink message (or `wg set` call), so 50k
+    peers take about a hundred round trips instead of 50k. Peers the kernel
+    already has as journaled are skipped, and peers the journal does not
+    know about are left alone.
+    """
+    start = time.perf_counter()
+    backend = get_backend()
+    res = backend.list_interfaces()
+    existing = {link["ifname"] for link in res.get("interfaces", [])} if res.get("status") == "success" else set()
+    out = {"interfaces": 0, "created": 0, "peers": 0, "unchanged": 0, "failed": 0, "errors": []}
+    for ifname, peers in state.items():
+        out["interfaces"] += 1
+        current: Dict[str, Peer] = {}
+        if ifname in existing:
+            dump = _load_peers(ifname)
+            current = {p.public_key: p for p in dump.get("peers", [])}
+        else:
+            res = backend.create_interface(ifname)
+            if res.get("status") != "success":
+                out["failed"] += len(peers)
+                out["errors"].append(f"{ifname}: {res.get('message') or res.get('stderr')}")
+                continue
+            out["created"] += 1
+        specs = []
+        for key, (ips, endpoint, keepalive) in peers.items():
+            spec = {"public_key": key, "allowed_ips": ips.split(",") if ips else []}
             try:
-                from pyroute2 import WireGuard
-                with WireGuard() as wg:
-                    wg.set(ifname, peer={"public_key": public_key.encode(), "remove": True})
-                return {"status": "success", "message": "Peer removed via pyroute2"}
-            except Exception as e:
-                return {"status": "error", "message": f"pyroute2 remove_peer failed: {e}"}
-        return {"status": "error", "message": "wg binary not found and not root."}
-
-
-def generate_keypair() -> Dict[str, Any]:
-    if not shutil.which("wg"):
-        return {"status": "error", "message": "wg binary required to generate keys."}
+                if endpoint:
+                    spec["endpoint"] = _parse_endpoint(endpoint)
+                if keepalive:
+                    spec["persistent_keepalive"] = int(keepalive)
+            except ValueError:
+                pass
+            peer = current.get(key)
+            if peer is not None and not _peer_delta(spec, peer):
+                out["unchanged"] += 1
+                continue
+            specs.append(spec)
+        for i in range(0, len(specs), PEERS_PER_MESSAGE):
+            chunk = specs[i:i + PEERS_PER_MESSAGE]
+            res = backend.set_peers(ifname, chunk)
+            if res.get("status") == "success":
+                out["peers"] += len(chunk)
+            else:
+                out["failed"] += len(chunk)
+                out["errors"].append(f"{ifname}: {res.get('message') or res.get('stderr')}")
+        cache.invalidate(ifname)
+    out["errors"] = out["errors"][:20]
+    out["seconds"] = round(time.perf_counter() - start, 3)
+    out["status"] = "success" if not out["failed"] else "partial"
+    return out
+
+
+# ----------------------------
+# Desired-state sync
+# ----------------------------
+def _norm_ips(ips) -> frozenset:
+    out = set()
+    for ip in ips:
+        try:
+            out.add(str(ipaddress.ip_network(ip, strict=False)))
+        except ValueError:
+            out.add(ip)
+    return frozenset(out)
+
+def _fmt_endpoint(host: str, port: int) -> str:
+    return f"[{host}]:{port}" if ":" in host else f"{host}:{port}"
+
+def _peer_delta(spec: Dict[str, Any], peer: Peer) -> bool:
+    """True if the kernel peer differs from the desired spec in any field the spec sets."""
+    if _norm_ips(spec["allowed_ips"]) != _norm_ips(peer.allowed_ips):
+        return True
+    if spec.get("endpoint") and _fmt_endpoint(*spec["endpoint"]) != peer.endpoint:
+        return True
+    if spec.get("persistent_keepalive") is not None and spec["persistent_keepalive"] != peer.persistent_keepalive:
+        return True
+    return False
+
+def sync_peers(ifname: str, peers: List[Dict[str, Any]], dry_run: bool = False,
+               force: bool = False) -> Dict[str, Any]:
+    """
+    Make the interface's peer set equal to `peers`, like `wg syncconf`. Current
+    and desired peers are indexed by public key so the diff is O(n), and only
+    the add/remove/update delta is sent to the kernel.
+    """
+    # public_key -> (the add op as given, its parsed backend spec)
+    desired: Dict[str, Tuple[Dict[str, Any], Dict[str, Any]]] = {}
+    for peer in peers:
+        peer = peer if isinstance(peer, dict) else {}
+        spec, err = parse_peer_op(dict(peer, op="add"))
+        if err:
+            return {"status": "error", "message": f"invalid peer {peer.get('public_key')}: {err}"}
+        if spec["public_key"] in desired:
+            return {"status": "error", "message": f"duplicate peer {spec['public_key']}"}
+        desired[spec["public_key"]] = (dict(peer, op="add"), spec)
+
+    res = cache.peers(ifname, fresh=True)
+    if res.get("status") != "success":
+        return res
+    current = {peer.public_key: peer for peer in res["peers"]}
+
+    ops = [{"op": "remove", "public_key": key} for key in current if key not in desired]
+    added = updated = 0
+    for key, (op, spec) in desired.items():
+        peer = current.get(key)
+        if peer is None:
+            ops.append(op)
+            added += 1
+        elif _peer_delta(spec, peer):
+            ops.append(dict(op, op="update"))
+            updated += 1
+    removed = len(ops) - added - updated
+    summary = {"added": added, "removed": removed, "updated": updated,
+               "unchanged": len(desired) - added - updated}
+    if dry_run:
+        return {"status": "success", "dry_run": True, **summary, "ops": ops}
+    if not ops:
+        return {"status": "success", **summary, "results": []}
+    out = apply_peers(ifname, ops, force)
+    return {"status": out["status"], **summary, "failed": out["failed"], "results": out["results"]}
+
+
+MAX_KEYPAIRS = 10000
+
+def generate_keypair(count: int = 1) -> Dict[str, Any]:
+    """
+    X25519 keypairs generated in-process (no `wg genkey` fork), served from the
+    pre-generated pool when it is enabled. count=1 keeps the original
+    single-pair response shape; larger counts return a "keypairs" list.
+    """
     try:
-        p1 = subprocess.Popen(["wg", "genkey"], stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
-        priv, err1 = p1.communicate(timeout=3)
-        if p1.returncode != 0:
-            return {"status": "error", "message": f"wg genkey failed: {err1}"}
-        p2 = subprocess.Popen(["wg", "pubkey"], stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
-        pub, err2 = p2.communicate(input=priv, timeout=3)
-        if p2.returncode != 0:
-            return {"status": "error", "message": f"wg pubkey failed: {err2}"}
-        return {"status": "success", "private_key": priv.strip(), "public_key": pub.strip()}
+        count = int(count)
+    except (TypeError, ValueError):
+        return {"status": "error", "message": "count must be an integer"}
+    if not 1 <= count <= MAX_KEYPAIRS:
+        return {"status": "error", "message": f"count must be between 1 and {MAX_KEYPAIRS}"}
+    try:
+        pairs = keypool.take(count)
     except Exception as e:
         return {"status": "error", "message": f"keygen error: {e}"}
+    if count == 1:
+        return {"status": "success", "private_key": pairs[0][0], "public_key": pairs[0][1]}
+    return {"status": "success", "keypairs": [{"private_key": priv, "public_key": pub} for priv, pub in pairs]}
+
+
+# ----------------------------
+# Metrics
+# ----------------------------
+METRICS_MAX_PEERS = int(os.environ.get("VALDAEMON_METRICS_MAX_PEERS", "10000"))
+# a handshake older than this (WireGuard's REJECT_AFTER_TIME) means the session is gone
+ACTIVE_WINDOW = 180
+
+def wireguard_metrics() -> List[str]:
+    """
+    Interface and peer series for one scrape, read from the peer cache: an
+    interface is only dumped when its entry is older than the cache TTL, so
+    scrapes share dumps with the stats sampler and with each other. Per-peer
+    series are left out for interfaces with more than METRICS_MAX_PEERS peers
+    to bound cardinality; the interface totals are always exported.
+    """
+    start = time.perf_counter()
+    res = cache.interfaces()
+    names = [i.get("ifname") if isinstance(i, dict) else i for i in res.get("interfaces", [])]
+    now = time.time()
+    totals = {"peers": [], "active": [], "rx": [], "tx": []}
+    per_peer = {"rx": [], "tx": [], "hs": []}
+    for ifname in filter(None, names):
+        dump = cache.peers(ifname)
+        if dump.get("status") != "success":
+            continue
+        peers = dump["peers"]
+        iface = {"interface": ifname}
+        totals["peers"].append((iface, len(peers)))
+        totals["active"].append((iface, sum(now - p.latest_handshake < ACTIVE_WINDOW for p in peers)))
+        totals["rx"].append((iface, sum(p.rx_bytes for p in peers)))
+        totals["tx"].append((iface, sum(p.tx_bytes for p in peers)))
+        if len(peers) > METRICS_MAX_PEERS:
+            continue
+        for p in peers:
+            labels = {"interface": ifname, "public_key": p.public_key}
+            per_peer["rx"].append((labels, p.rx_bytes))
+            per_peer["tx"].append((labels, p.tx_bytes))
+            per_peer["hs"].append((labels, p.latest_handshake))
+    lines = []
+    lines += family("wireguard_interface_peers", "gauge", "Peers configured on the interface.", totals["peers"])
+    lines += family("wireguard_interface_active_peers", "gauge",
+                    f"Peers with a handshake in the last {ACTIVE_WINDOW} seconds.", totals["active"])
+    lines += family("wireguard_interface_receive_bytes", "gauge", "Bytes received from all current peers.",
+                    totals["rx"])
+    lines += family("wireguard_interface_transmit_bytes", "gauge", "Bytes sent to all current peers.", totals["tx"])
+    # the kernel zeroes a peer's counters when it is removed and re-added; rate() treats that as a reset
+    lines += family("wireguard_peer_receive_bytes_total", "counter",
+                    "Bytes received from the peer; resets when the peer is removed and re-added.", per_peer["rx"])
+    lines += family("wireguard_peer_transmit_bytes_total", "counter",
+                    "Bytes sent to the peer; resets when the peer is removed and re-added.", per_peer["tx"])
+    lines += family("wireguard_peer_latest_handshake_seconds", "gauge",
+                    "Unix time of the peer's latest handshake (0 if never).", per_peer["hs"])
+    lines += family("valdaemon_wireguard_scrape_duration_seconds", "gauge",
+                    "Time taken to collect the WireGuard metrics.", [({}, time.perf_counter() - start)])
+    return lines
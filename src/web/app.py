@@ -1,17 +1,18 @@
 from fastapi import FastAPI, Request
 from fastapi.responses import HTMLResponse
-from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 
 from routers import server_config  # import the router
+from static_assets import AssetFiles, asset
 
 app = FastAPI()
 
-# Static files
-app.mount("/assets", StaticFiles(directory="assets"), name="assets")
+# Static files: precompressed and fingerprinted once `python build_assets.py` has run
+app.mount("/assets", AssetFiles(directory="assets"), name="assets")
 
 # Templates
 templates = Jinja2Templates(directory="templates")
+templates.env.globals["asset"] = asset
 
 # Root route
 @app.get("/", response_class=HTMLResponse)
@@ -0,0 +1,329 @@
+"""
+Build the web UI's static assets for production, into assets/dist/:
+
+- tailwind.css and FontAwesome's all.min.css cut down to the rules whose
+  classes the templates actually use (the way Tailwind's purge works: every
+  class-like token in templates/ counts as used);
+- FontAwesome fonts subset to the icons left, when fontTools is installed
+  (otherwise copied whole; the browser only fetches the styles in use);
+- every file renamed with a content hash (css/tailwind/tailwind.3fa1c2e0b4.css)
+  so it can be cached forever, with url() references rewritten to match;
+- .gz and, if the brotli module is installed, .br variants of text files.
+
+assets/dist/manifest.json maps each source path to its built one; the app's
+`asset()` template helper reads it. Run from src/web:
+
+    python build_assets.py
+"""
+import gzip
+import hashlib
+import json
+import os
+import posixpath
+import re
+import shutil
+import sys
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    from fontTools import subset as font_subset
+except ImportError:
+    font_subset = None
+
+ASSETS = "assets"
+DIST = os.path.join(ASSETS, "dist")
+TEMPLATES = "templates"
+STYLESHEETS = ["css/tailwind/tailwind.css", "css/fontawesome/css/all.min.css"]
+COPY_DIRS = ["images"]
+# left unhashed: browsers fetch the web manifest by the URL in the page, and it
+# names its icons by fixed paths
+SKIP = {"images/site.webmanifest"}
+COMPRESS = {".css", ".js", ".svg", ".json", ".ico", ".txt", ".webmanifest"}
+MIN_COMPRESS = 512
+
+# Tailwind's default extractor: anything between quotes, tags and whitespace
+TOKEN_RE = re.compile(r"[^<>\"'`\s]*[^<>\"'`\s:]")
+CLASS_RE = re.compile(r"\.((?:\\.|[A-Za-z0-9_-])+)")
+STRING_OR_COMMENT_RE = re.compile(r"(\"(?:\\.|[^\"\\])*\"|'(?:\\.|[^'\\])*')|(/\*[\s\S]*?\*/)")
+URL_RE = re.compile(r"url\(\s*(['\"]?)([^'\")]+)\1\s*\)")
+FA_GLYPH_RE = re.compile(r"--fa:\s*\"\\([0-9a-fA-F]+)")
+GROUP_AT_RULES = ("@media", "@supports", "@layer", "@container", "@document")
+PSEUDO_FN_RE = re.compile(r":{1,2}([\w-]+)\(")
+ANY_OF = ("is", "where", "matches", "-webkit-any", "-moz-any")
+
+
+# ---- CSS pruning ----
+def used_tokens(directory: str = TEMPLATES) -> set:
+    tokens = set()
+    for root, _, files in os.walk(directory):
+        for name in files:
+            with open(os.path.join(root, name), encoding="utf-8") as f:
+                tokens.update(TOKEN_RE.findall(f.read()))
+    # class="a b" yields `class=a`; keep the part after the last = too
+    tokens.update(t.rsplit("=", 1)[-1] for t in list(tokens) if "=" in t)
+    return tokens
+
+
+def _split_top(text: str, sep: str = ",") -> list:
+    parts, depth, start = [], 0, 0
+    for i, ch in enumerate(text):
+        if ch in "([":
+            depth += 1
+        elif ch in ")]":
+            depth -= 1
+        elif ch == sep and depth == 0:
+            parts.append(text[start:i])
+            start = i + 1
+    parts.append(text[start:])
+    return parts
+
+
+def _selector_used(selector: str, used: set) -> bool:
+    """
+    Whether `selector` can match with only `used` classes on the page: every
+    class it requires must be used. Alternatives inside :is()/:where() need
+    one usable branch; classes inside :not()/:has() and friends are ignored.
+    """
+    out, i = [], 0
+    while i < len(selector):
+        m = PSEUDO_FN_RE.match(selector, i) if selector[i] == ":" and selector[i - 1:i] != "\\" else None
+        if m:
+            depth, j = 1, m.end()
+            while j < len(selector) and depth:
+                depth += {"(": 1, ")": -1}.get(selector[j], 0)
+                j += 1
+            inner = selector[m.end():j - 1]
+            if m.group(1) in ANY_OF and not any(_selector_used(alt, used) for alt in _split_top(inner)):
+                return False
+            i = j
+            continue
+        out.append(selector[i])
+        i += 1
+    return all(c.replace("\\", "") in used for c in CLASS_RE.findall("".join(out)))
+
+
+def _block_end(css: str, i: int) -> int:
+    """Index just past the } closing the block whose { is at i - 1."""
+    depth = 1
+    while depth:
+        ch = css[i]
+        if ch in "\"'":
+            i = css.index(ch, i + 1) + 1
+            continue
+        depth += {"{": 1, "}": -1}.get(ch, 0)
+        i += 1
+    return i
+
+
+def parse_css(css: str, i: int = 0):
+    """[(prelude, body)]: body is a declaration string, or a nested list for grouping at-rules."""
+    rules = []
+    n = len(css)
+    while i < n:
+        while i < n and css[i].isspace():
+            i += 1
+        if i >= n:
+            break
+        if css[i] == "}":
+            return rules, i + 1
+        j = i
+        while css[j] not in "{;":
+            if css[j] in "\"'":
+                j = css.index(css[j], j + 1)
+            j += 1
+        prelude = css[i:j].strip()
+        if css[j] == ";":
+            rules.append((prelude, None))
+            i = j + 1
+        elif prelude.lower().startswith(GROUP_AT_RULES):
+            children, i = parse_css(css, j + 1)
+            rules.append((prelude, children))
+        else:
+            end = _block_end(css, j + 1)
+            rules.append((prelude, css[j + 1:end - 1].strip()))
+            i = end
+    return rules, i
+
+
+def prune(rules, used: set):
+    kept = []
+    for prelude, body in rules:
+        if isinstance(body, list):
+            children = prune(body, used)
+            if children:
+                kept.append((prelude, children))
+        elif prelude.startswith("@") or body is None:
+            kept.append((prelude, body))
+        else:
+            selectors = [s.strip() for s in _split_top(prelude) if _selector_used(s, used)]
+            if selectors:
+                kept.append((",".join(selectors), body))
+    return kept
+
+
+def render(rules) -> str:
+    out = []
+    for prelude, body in rules:
+        if body is None:
+            out.append(prelude + ";")
+        elif isinstance(body, list):
+            out.append(prelude + "{" + render(body) + "}")
+        else:
+            out.append(prelude + "{" + body + "}")
+    return "".join(out)
+
+
+def _drop_unused_keyframes(rules, text: str):
+    kept = []
+    for prelude, body in rules:
+        if prelude.startswith(("@keyframes", "@-webkit-keyframes")):
+            name = prelude.split(None, 1)[1].strip()
+            if len(re.findall(r"(?<![\w-])" + re.escape(name) + r"(?![\w-])", text)) < 2:
+                continue
+        kept.append((prelude, body))
+    return kept
+
+
+def purge_css(css: str, used: set) -> str:
+    notices = []
+
+    def strip(m):
+        if m.group(1):
+            return m.group(1)
+        if m.group(2).startswith("/*!"):
+            notices.append(m.group(2))
+        return ""
+    rules, _ = parse_css(STRING_OR_COMMENT_RE.sub(strip, css))
+    kept = prune(rules, used)
+    text = render(kept)
+    kept = _drop_unused_keyframes(kept, text)
+    return "\n".join(notices) + "\n" + render(kept)
+
+
+# ---- output ----
+def _fingerprint(rel: str, data: bytes) -> str:
+    root, ext = posixpath.splitext(rel)
+    return f"{root}.{hashlib.sha256(data).hexdigest()[:10]}{ext}"
+
+
+class Build:
+    def __init__(self):
+        self.manifest = {}
+        self.report = []
+
+    def emit(self, rel: str, data: bytes, source_size: int) -> str:
+        out_rel = _fingerprint(rel, data)
+        path = os.path.join(DIST, out_rel)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(data)
+        sizes = {"source": source_size, "raw": len(data)}
+        if posixpath.splitext(rel)[1] in COMPRESS and len(data) >= MIN_COMPRESS:
+            sizes["gzip"] = self._variant(path + ".gz", gzip.compress(data, 9, mtime=0), len(data))
+            if brotli is not None:
+                sizes["br"] = self._variant(path + ".br", brotli.compress(data, quality=11), len(data))
+        self.manifest[rel] = "dist/" + out_rel
+        self.report.append((rel, sizes))
+        return "dist/" + out_rel
+
+    @staticmethod
+    def _variant(path: str, data: bytes, raw: int):
+        if len(data) >= raw:
+            return None
+        with open(path, "wb") as f:
+            f.write(data)
+        return len(data)
+
+    def stylesheet(self, rel: str, used: set):
+        src = os.path.join(ASSETS, rel)
+        with open(src, encoding="utf-8") as f:
+            css = f.read()
+        css = purge_css(css, used)
+        glyphs = {int(cp, 16) for cp in FA_GLYPH_RE.findall(css)}
+
+        def relink(m):
+            target = m.group(2)
+            if target.startswith(("data:", "http:", "https:", "//", "/")):
+                return m.group(0)
+            target_rel = posixpath.normpath(posixpath.join(posixpath.dirname(rel), target.split("?")[0].split("#")[0]))
+            built = self.manifest.get(target_rel) or self.font(target_rel, glyphs)
+            return f"url(/{ASSETS}/{built})" if built else m.group(0)
+        css = URL_RE.sub(relink, css)
+        self.emit(rel, css.encode("utf-8"), os.path.getsize(src))
+
+    def font(self, rel: str, glyphs: set):
+        src = os.path.join(ASSETS, rel)
+        if not os.path.exists(src):
+            return None
+        with open(src, "rb") as f:
+            data = f.read()
+        if font_subset is not None and glyphs and rel.endswith(".woff2"):
+            data = _subset_font(src, glyphs) or data
+        return self.emit(rel, data, os.path.getsize(src))
+
+    def copy(self, rel: str):
+        src = os.path.join(ASSETS, rel)
+        with open(src, "rb") as f:
+            self.emit(rel, f.read(), os.path.getsize(src))
+
+
+def _subset_font(src: str, glyphs: set):
+    options = font_subset.Options()
+    options.flavor = "woff2"
+    options.layout_features = ["*"]
+    try:
+        font = font_subset.load_font(src, options)
+        subsetter = font_subset.Subsetter(options)
+        subsetter.populate(unicodes=glyphs)
+        subsetter.subset(font)
+        tmp = src + ".subset"
+        font_subset.save_font(font, tmp, options)
+        with open(tmp, "rb") as f:
+            data = f.read()
+        os.remove(tmp)
+        return data
+    except Exception as e:  # e.g. no brotli to write woff2 with
+        print(f"font subsetting skipped for {src}: {e}", file=sys.stderr)
+        return None
+
+
+def build():
+    if os.path.isdir(DIST):
+        shutil.rmtree(DIST)
+    used = used_tokens()
+    b = Build()
+    for rel in STYLESHEETS:
+        b.stylesheet(rel, used)
+    for directory in COPY_DIRS:
+        for name in sorted(os.listdir(os.path.join(ASSETS, directory))):
+            rel = posixpath.join(directory, name)
+            if rel not in SKIP:
+                b.copy(rel)
+    with open(os.path.join(DIST, "manifest.json"), "w") as f:
+        json.dump(b.manifest, f, indent=2, sort_keys=True)
+    return b
+
+
+def main():
+    b = build()
+    best = lambda s: min(v for k, v in s.items() if k != "source" and v)
+    for rel, sizes in b.report:
+        print(f"{rel:45} {sizes['source']:>9} -> {sizes['raw']:>8}  gzip {sizes.get('gzip') or '-':>7}"
+              f"  br {sizes.get('br') or '-':>7}")
+    # the stylesheets are what every page blocks on; fonts and images are listed above
+    sheets = [s for rel, s in b.report if rel in STYLESHEETS]
+    before = sum(s["source"] for s in sheets)
+    after = sum(best(s) for s in sheets)
+    print(f"{'stylesheets':45} {before:>9} -> {after:>8} on the wire ({before / max(after, 1):.0f}x smaller)")
+    if brotli is None:
+        print("brotli not installed: no .br variants", file=sys.stderr)
+    if font_subset is None:
+        print("fontTools not installed: fonts copied whole", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,20 @@
+import os
+
 from fastapi import APIRouter, Request
 from fastapi.responses import HTMLResponse
 from fastapi.templating import Jinja2Templates
+from static_assets import asset
 
 router = APIRouter()
 templates = Jinja2Templates(directory="templates")
+templates.env.globals["asset"] = asset
+
+# valAPI as the browser reaches it; the dashboard's live panel streams from its /events
+VALAPI_URL = os.environ.get("VALAPI_URL", "http://localhost:8000").rstrip("/")
 
 @router.get("/", response_class=HTMLResponse)
 async def dashboard(request: Request):
-    return templates.TemplateResponse("dashboard/dashboard.html", {"request": request})
+    return templates.TemplateResponse("dashboard/dashboard.html", {"request": request, "api_url": VALAPI_URL})
 
 @router.get("/interface", response_class=HTMLResponse)
 async def config_interface(request: Request):
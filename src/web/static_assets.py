@@ -0,0 +1,80 @@
+import json
+import mimetypes
+import os
+
+from fastapi.staticfiles import StaticFiles
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse
+from starlette.staticfiles import NotModifiedResponse
+
+ASSETS_DIR = "assets"
+MANIFEST = os.path.join(ASSETS_DIR, "dist", "manifest.json")
+# built files carry a content hash in their name, so they never change
+IMMUTABLE = "public, max-age=31536000, immutable"
+# everything else may change in place: cache, but check the ETag first
+REVALIDATE = "no-cache"
+ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+
+
+def load_manifest(path: str = MANIFEST) -> dict:
+    """Source path -> built path, from build_assets.py; empty (serve sources) if not built."""
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+manifest = load_manifest()
+
+
+def asset(path: str) -> str:
+    """URL for an asset under assets/: its fingerprinted build if there is one."""
+    return f"/{ASSETS_DIR}/{manifest.get(path, path)}"
+
+
+def _accepts(accept_encoding: str, coding: str) -> bool:
+    for part in accept_encoding.split(","):
+        name, _, params = part.partition(";")
+        if name.strip() == coding:
+            q = params.replace(" ", "").partition("q=")[2]
+            try:
+                return not q or float(q) > 0
+            except ValueError:
+                return False
+    return False
+
+
+class AssetFiles(StaticFiles):
+    """
+    StaticFiles that serves a precompressed .br/.gz sibling when the client
+    accepts it, with its own ETag, and marks fingerprinted files under
+    dist/ as immutable. If-None-Match and If-Modified-Since get a 304 as
+    with plain StaticFiles.
+    """
+    def file_response(self, full_path, stat_result, scope, status_code: int = 200):
+        request_headers = Headers(scope=scope)
+        accept = request_headers.get("accept-encoding", "")
+        media_type = mimetypes.guess_type(str(full_path))[0] or "application/octet-stream"
+        headers = {}
+        path = full_path
+        variants = False
+        for coding, suffix in ENCODINGS:
+            candidate = f"{full_path}{suffix}"
+            if not os.path.exists(candidate):
+                continue
+            variants = True
+            if _accepts(accept, coding):
+                path, stat_result = candidate, os.stat(candidate)
+                headers["Content-Encoding"] = coding
+                break
+        if variants:
+            headers["Vary"] = "Accept-Encoding"
+        rel = os.path.relpath(str(full_path), str(self.directory))
+        headers["Cache-Control"] = IMMUTABLE if rel.startswith("dist" + os.sep) else REVALIDATE
+        response = FileResponse(path, status_code=status_code, headers=headers, media_type=media_type,
+                                stat_result=stat_result)
+        if self.is_not_modified(response.headers, request_headers):
+            return NotModifiedResponse(response.headers)
+        return response
+
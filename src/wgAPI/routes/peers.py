@@ -10,13 +10,14 @@ def list_peers():
     return wg_service.list_peers()
 
 @router.post("/add")
-def add_peer(public_key: str, allowed_ips: str):
+def add_peer(public_key: str, allowed_ips: str, force: bool = False):
     """
     API: Add a new peer
     - public_key: Base64 encoded peer public key
     - allowed_ips: IP range allowed for peer (e.g. 10.0.0.2/32)
+    - force: add even if allowed_ips overlap another peer's
     """
-    return wg_service.add_peer(public_key, allowed_ips)
+    return wg_service.add_peer(public_key, allowed_ips, force)
 
 @router.delete("/remove")
 def remove_peer(public_key: str):
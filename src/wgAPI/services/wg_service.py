@@ -1,111 +1,72 @@
-from pyroute2 import IPRoute, WireGuard
-import base64
 import os
-import subprocess
+
+from valDaemon.utils.prefix_trie import AllowedIPsIndex
+from valDaemon.utils.wg_backends import DUMP_COLUMNS, WireGuardBackend, select_backend, split_allowed_ips
+
+# auto, netlink, subprocess, or fake to keep everything in memory (tests, benchmarks)
+BACKEND = os.environ.get("WGAPI_BACKEND", "auto")
 
 class WGService:
-    def __init__(self, interface: str = "wg0"):
+    def __init__(self, interface: str = "wg0", backend: WireGuardBackend = None):
         self.interface = interface
+        self.backend = backend or select_backend(BACKEND)
 
-    def _check_privileges(self):
-        """Check if process has NET_ADMIN privilege"""
-        if os.geteuid() != 0:
-            return False
-        return True
-
-    def _run_cmd(self, cmd: list):
-        """Fallback: run shell command with sudo if not root"""
-        try:
-            result = subprocess.run(
-                ["sudo"] + cmd,
-                check=True,
-                capture_output=True,
-                text=True
-            )
-            return {"status": "success", "message": result.stdout.strip() or "Command executed"}
-        except subprocess.CalledProcessError as e:
-            return {"status": "error", "message": e.stderr.strip()}
+    def _current_peers(self):
+        """{public_key: [prefix, ...]} as the kernel has it now, or an error response"""
+        res = self.backend.dump_peers(self.interface)
+        if res.get("status") != "success":
+            return None, res
+        return {row[0]: [] if row[3] == "(none)" else row[3].split(",") for row in res["rows"] if row}, None
 
     def list_interface(self):
         """List WireGuard interfaces"""
-        try:
-            with IPRoute() as ipr:
-                links = ipr.get_links()
-                wg_links = [
-                    {
-                        "index": link["index"],
-                        "ifname": link.get_attr("IFLA_IFNAME"),
-                        "state": link.get_attr("IFLA_OPERSTATE"),
-                        "kind": link.get_attr("IFLA_LINKINFO")
-                        and link.get_attr("IFLA_LINKINFO").get_attr("IFLA_INFO_KIND"),
-                    }
-                    for link in links
-                    if link.get_attr("IFLA_LINKINFO")
-                    and link.get_attr("IFLA_LINKINFO").get_attr("IFLA_INFO_KIND") == "wireguard"
-                ]
-            return {"status": "success", "interfaces": wg_links}
-        except Exception as e:
-            return {"status": "error", "message": str(e)}
-        
+        return self.backend.list_interfaces()
+
     def create_interface(self):
         """Create a WireGuard interface like `ip link add wg0 type wireguard`"""
-        try:
-            if not self._check_privileges():
-                # fallback to shell command
-                return self._run_cmd(["ip", "link", "add", self.interface, "type", "wireguard"])
-
-            with IPRoute() as ipr:
-                ipr.link("add", ifname=self.interface, kind="wireguard")
-            return {"status": "success", "message": f"Interface {self.interface} created"}
-        except Exception as e:
-            return {"status": "error", "message": str(e)}
+        return self.backend.create_interface(self.interface)
 
     def delete_interface(self):
         """Delete the WireGuard interface"""
-        try:
-            if not self._check_privileges():
-                return self._run_cmd(["ip", "link", "del", self.interface])
-
-            with IPRoute() as ipr:
-                idx_list = ipr.link_lookup(ifname=self.interface)
-                if not idx_list:
-                    return {"status": "error", "message": f"Interface {self.interface} not found"}
-                ipr.link("del", index=idx_list[0])
-            return {"status": "success", "message": f"Interface {self.interface} deleted"}
-        except Exception as e:
-            return {"status": "error", "message": str(e)}
-
+        return self.backend.delete_interface(self.interface)
 
     def list_peers(self):
-        """List peers connected to the interface like `wg show wg0`"""
-        try:
-            with WireGuard() as wg:
-                peers = wg.info(self.interface).get("peers", [])
-            return {"status": "success", "peers": peers}
-        except Exception as e:
-            return {"status": "error", "message": str(e)}
+        """List peers connected to the interface like `wg show wg0 dump`"""
+        res = self.backend.dump_peers(self.interface)
+        if res.get("status") != "success":
+            return res
+        return {"status": "success", "peers": [dict(zip(DUMP_COLUMNS, row)) for row in res["rows"]]}
 
-    def add_peer(self, public_key: str, allowed_ips: str):
-        """Add a new peer with given public key and AllowedIPs"""
+    def add_peer(self, public_key: str, allowed_ips: str, force: bool = False):
+        """
+        Add a new peer with given public key and AllowedIPs ("10.0.0.2/32,fd00::2/128").
+        Backends replace a peer's whole list, so the current one is read right
+        before the write and the new prefixes are added to it.
+        """
+        owned, err = self._current_peers()
+        if err:
+            return err
+        current = owned.get(public_key, [])
         try:
-            with WireGuard() as wg:
-                wg.set(self.interface, peer={
-                    "public_key": base64.b64decode(public_key),
-                    "allowed_ips": [(allowed_ips, 32)]
-                })
-            return {"status": "success", "message": f"Peer {public_key} added"}
-        except Exception as e:
+            prefixes = split_allowed_ips(allowed_ips)
+            if not force:
+                index = AllowedIPsIndex.build(owned.items())
+                conflicts = [f"{cidr} overlaps {prefix} of peer {owner}"
+                             for cidr in prefixes for prefix, owner in index.conflicts(cidr, skip=(public_key,))]
+                if conflicts:
+                    return {"status": "error", "message": "allowed_ips conflict: " + "; ".join(conflicts)}
+        except ValueError as e:
             return {"status": "error", "message": str(e)}
+        # adding to a known peer extends its allowed IPs rather than replacing them
+        merged = current + [p for p in prefixes if p not in current]
+        res = self.backend.set_peers(self.interface, [{"public_key": public_key, "allowed_ips": merged}])
+        if res.get("status") != "success":
+            return res
+        return {"status": "success", "message": f"Peer {public_key} added"}
 
     def remove_peer(self, public_key: str):
         """Remove a peer by public key"""
-        try:
-            with WireGuard() as wg:
-                wg.set(self.interface, peer={
-                    "public_key": base64.b64decode(public_key),
-                    "remove": True
-                })
-            return {"status": "success", "message": f"Peer {public_key} removed"}
-        except Exception as e:
-            return {"status": "error", "message": str(e)}
-
+        res = self.backend.remove_peer(self.interface, public_key)
+        if res.get("status") != "success":
+            return res
+        return {"status": "success", "message": f"Peer {public_key} removed"}